@@ -0,0 +1,303 @@
+import argparse
+import asyncio
+import io
+import logging
+import os
+import shutil
+import signal
+import socket
+import stat
+import tarfile
+
+import fleet
+import hibernate
+import limits
+import logs
+import metrics
+import registry
+import rpc
+import supervisor
+import zygote
+from unpack import STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+BASE = os.environ.get("AGENT_BASE", "agent_bots/")
+LISTEN = os.environ.get("AGENT_LISTEN", "unix:agent.sock")
+TOKEN = os.environ.get("AGENT_TOKEN", "")
+NAME = os.environ.get("AGENT_NAME") or socket.gethostname()
+ZYGOTE_LIBS = ["python-telegram-bot", "requests", "aiohttp"]
+SKIP_DIRS = {STATE_DIR}
+
+
+def bot_path(user_id, bot_name):
+    for part in (user_id, bot_name):
+        if not part or os.sep in part or part in (".", ".."):
+            raise ValueError(f"invalid bot name {part!r}")
+    return os.path.join(BASE, user_id, bot_name)
+
+
+async def start_bot(user_id, bot_name, path, settle=False):
+    child = supervisor.get(user_id, bot_name)
+    if child and child.hibernation:
+        await supervisor.wake(child)
+        return {"pid": child.pid, "woken": True}
+    if child and child.alive:
+        return {"pid": child.pid, "already": True}
+    child = await supervisor.start(user_id, bot_name, path)
+    registry.update(user_id, bot_name, autostart=1)
+    if settle:
+        await fleet.settle(child.pid)
+    return {"pid": child.pid}
+
+
+async def stop_bot(user_id, bot_name):
+    registry.update(user_id, bot_name, autostart=0)
+    return await supervisor.stop(user_id, bot_name)
+
+
+def bot_status(user_id, bot_name):
+    row = registry.get(user_id, bot_name) or {}
+    child = supervisor.get(user_id, bot_name)
+    result = {
+        "state": supervisor.state(user_id, bot_name),
+        "restarts": row.get("restarts") or 0,
+        "exit_code": row.get("exit_code"),
+        "pid": None,
+        "started": None,
+        "usage": None,
+        "memory_mb": limits.for_bot(user_id, bot_name)["memory_mb"],
+    }
+    if child and child.alive:
+        result["pid"] = child.pid
+        result["started"] = child.started
+        usage = limits.usage.get((user_id, bot_name))
+        if usage:
+            result["usage"] = {key: usage[key] for key in ("rss", "cpu", "throttled", "event")}
+    return result
+
+
+def log_tail(path):
+    log = logs.log_path(path)
+    if not os.path.exists(log):
+        return None
+    return logs.tail(log)
+
+
+def _syncable(rel, include_logs):
+    return include_logs or not os.path.basename(rel).startswith(logs.LOG_NAME)
+
+
+def manifest(path, include_logs=False):
+    result = {}
+    for root, dirs, names in os.walk(path):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for name in dirs + names:
+            full = os.path.join(root, name)
+            rel = os.path.relpath(full, path)
+            if not _syncable(rel, include_logs):
+                continue
+            try:
+                st = os.lstat(full)
+                if stat.S_ISLNK(st.st_mode):
+                    result[rel] = [st.st_size, st.st_mtime_ns, os.readlink(full)]
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                result[rel] = [st.st_size, st.st_mtime_ns]
+    return result
+
+
+def pack(path, known=None, include_logs=False):
+    known = known or {}
+    files = {rel: meta for rel, meta in manifest(path, include_logs).items() if known.get(rel) != meta}
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        for rel, meta in files.items():
+            if len(meta) == 2:
+                tar.add(os.path.join(path, rel), arcname=rel, recursive=False)
+    return files, buf.getvalue()
+
+
+def apply(path, files, data):
+    os.makedirs(path, exist_ok=True)
+    for rel in files:
+        target = os.path.join(path, rel)
+        if os.path.lexists(target):
+            os.remove(target)
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r") as tar:
+        tar.extractall(path, filter="data")
+    for rel, meta in files.items():
+        target = os.path.join(path, rel)
+        if len(meta) == 3:
+            if os.path.commonpath([os.path.realpath(os.path.dirname(target)), os.path.realpath(path)]) != os.path.realpath(path):
+                raise ValueError(f"invalid path {rel!r}")
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.symlink(meta[2], target)
+        os.utime(target, ns=(meta[1], meta[1]), follow_symlinks=False)
+    return len(files)
+
+
+def remove_file(path, rel):
+    target = os.path.realpath(os.path.join(path, rel))
+    if os.path.commonpath([target, os.path.realpath(path)]) != os.path.realpath(path):
+        raise ValueError(f"invalid path {rel!r}")
+    if not os.path.exists(target):
+        return False
+    os.remove(target)
+    return True
+
+
+async def delete_bot(user_id, bot_name, path):
+    await supervisor.stop(user_id, bot_name)
+    registry.delete(user_id, bot_name)
+    if os.path.exists(path):
+        await asyncio.to_thread(shutil.rmtree, path)
+
+
+def load():
+    with open("/proc/loadavg", "r") as f:
+        load1 = float(f.read().split()[0])
+    memory = {}
+    with open("/proc/meminfo", "r") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            memory[name] = int(value.split()[0]) * 1024
+    return {
+        "name": NAME,
+        "bots": len(registry.all_bots()),
+        "running": len(supervisor.awake()),
+        "hibernated": len(supervisor.hibernating()),
+        "cpus": os.cpu_count() or 1,
+        "load": load1,
+        "mem_total": memory.get("MemTotal", 0),
+        "mem_available": memory.get("MemAvailable", 0),
+    }
+
+
+def handlers():
+    async def info():
+        return load()
+
+    async def start(user_id, bot_name, settle=False):
+        return await start_bot(user_id, bot_name, bot_path(user_id, bot_name), settle)
+
+    async def stop(user_id, bot_name):
+        return await stop_bot(user_id, bot_name)
+
+    async def states(user_id, bot_names):
+        return supervisor.states(user_id, bot_names)
+
+    async def status(user_id, bot_name):
+        return bot_status(user_id, bot_name)
+
+    async def log(user_id, bot_name):
+        return log_tail(bot_path(user_id, bot_name))
+
+    async def log_read(user_id, bot_name, offset, chars=2000):
+        return logs.read_since(logs.log_path(bot_path(user_id, bot_name)), offset, chars)
+
+    async def get_manifest(user_id, bot_name, include_logs=False):
+        return await asyncio.to_thread(manifest, bot_path(user_id, bot_name), include_logs)
+
+    async def get_pack(user_id, bot_name, known=None, include_logs=False):
+        files, data = await asyncio.to_thread(pack, bot_path(user_id, bot_name), known, include_logs)
+        return rpc.Binary({"files": files}, data)
+
+    async def put(user_id, bot_name, files, data):
+        return await asyncio.to_thread(apply, bot_path(user_id, bot_name), files, data)
+
+    async def remove(user_id, bot_name, rel):
+        return remove_file(bot_path(user_id, bot_name), rel)
+
+    async def delete(user_id, bot_name):
+        await delete_bot(user_id, bot_name, bot_path(user_id, bot_name))
+        return True
+
+    return {
+        "info": info,
+        "start": start,
+        "stop": stop,
+        "states": states,
+        "status": status,
+        "log": log,
+        "log_read": log_read,
+        "manifest": get_manifest,
+        "pack": get_pack,
+        "apply": put,
+        "remove": remove,
+        "delete": delete,
+    }
+
+
+async def serve(listen=LISTEN):
+    if rpc.parse_address(listen)[0] == "tcp" and not TOKEN:
+        raise SystemExit(f"AGENT_TOKEN مطلوب للاستماع على {listen}")
+    os.makedirs(BASE, exist_ok=True)
+    server = rpc.Server(handlers(), TOKEN, hello=load)
+
+    async def on_bot_event(user_id, bot_name, state, code):
+        server.broadcast("bot", user_id=user_id, bot_name=bot_name, state=state, code=code)
+
+    def on_limit(user_id, bot_name, resource_name, action):
+        server.broadcast("limit", user_id=user_id, bot_name=bot_name, resource=resource_name, action=action)
+
+    supervisor.listeners.append(on_bot_event)
+    supervisor.reconcile(bot_path)
+    if zygote.ENABLED:
+        try:
+            await zygote.start(ZYGOTE_LIBS, limits.child_env())
+        except (OSError, RuntimeError, asyncio.TimeoutError):
+            logger.exception("تعذر تشغيل الـ zygote، سيتم التشغيل العادي للبوتات")
+    tasks = [
+        asyncio.create_task(logs.rotator(lambda: [child.bot_path for child in supervisor.children()])),
+        asyncio.create_task(limits.monitor(supervisor.children, supervisor.kill, on_limit)),
+    ]
+    if hibernate.ENABLED:
+        tasks.append(asyncio.create_task(hibernate.monitor()))
+    tasks.append(asyncio.create_task(
+        fleet.restore(lambda user_id, bot_name: start_bot(user_id, bot_name, bot_path(user_id, bot_name), True))
+    ))
+    metrics_server = await metrics.serve()
+    listener = await rpc.start_server(server.handle, listen)
+    logger.info("العامل %s يستمع على %s (%s)", NAME, listen, BASE)
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+    try:
+        await stopping.wait()
+    finally:
+        listener.close()
+        if metrics_server:
+            metrics_server.close()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await zygote.stop()
+        registry.close()
+
+
+def main():
+    global BASE, NAME
+    parser = argparse.ArgumentParser(description="Worker agent that hosts a slice of the manager's bots")
+    parser.add_argument("--listen", default=LISTEN, help="unix:/path or host:port")
+    parser.add_argument("--base", default=BASE)
+    parser.add_argument("--name", default=NAME)
+    args = parser.parse_args()
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    BASE = args.base
+    NAME = args.name
+    if "REGISTRY" not in os.environ:
+        registry.REGISTRY = os.path.join(BASE, "processes.db")
+    if "ZYGOTE_SOCKET" not in os.environ:
+        zygote.SOCKET = os.path.join(BASE, "zygote.sock")
+    asyncio.run(serve(args.listen))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,15 @@
+import asyncio
+import functools
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
-import json
-import subprocess
+import secrets
 import shutil
+import time
+import zipfile
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, TelegramError
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
@@ -16,6 +20,29 @@ from telegram.ext import (
 )
 import logging
 
+import bytecode
+import clone
+import cluster
+import fleet
+import fsindex
+import hibernate
+import installer
+import jobs
+import limits
+import logs
+import metrics
+import planner
+import ratelimit
+import releases
+import router
+import rpc
+import sessions
+import snapshots
+import supervisor
+import unpack
+import uploads
+import zygote
+
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=logging.INFO
@@ -24,36 +51,96 @@ logger = logging.getLogger(__name__)
 
 TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
 BASE = os.environ.get("BASE", "user_bots/")
-DB = os.environ.get("DB", "processes.json")
+MODE = os.environ.get("MODE", "polling")
+API_URL = os.environ.get("TELEGRAM_API_URL")
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")
+FILES_PAGE_SIZE = int(os.environ.get("FILES_PAGE_SIZE", "8"))
+BOTS_PAGE_SIZE = int(os.environ.get("BOTS_PAGE_SIZE", "10"))
+ADMIN_IDS = {i.strip() for i in os.environ.get("ADMIN_IDS", "").split(",") if i.strip()}
+BULK_PROGRESS_INTERVAL = 2
+SNAPSHOTS_SHOWN = 8
 
 os.makedirs(BASE, exist_ok=True)
 
+STATE_TEXT = {
+    supervisor.RUNNING: "🟢 شغال",
+    supervisor.RESTARTING: "🟡 يعاد تشغيله",
+    supervisor.CRASHLOOP: "⚠️ متوقف بسبب أعطال متكررة",
+    supervisor.EXITED: "🔴 انتهى",
+    supervisor.HIBERNATED: "💤 في وضع السبات (يستيقظ عند وصول رسالة)",
+    cluster.UNREACHABLE: "❔ خادم التشغيل غير متاح",
+}
+
+LIMIT_EVENTS = {
+    "kill:memory": "إيقاف بسبب تجاوز الذاكرة",
+    "kill:cpu": "إيقاف بسبب استهلاك المعالج",
+    "throttle:cpu": "تقييد المعالج",
+    "notify:cpu": "تنبيه استهلاك المعالج",
+}
+
+STATE_ICONS = {
+    supervisor.RUNNING: "🟢",
+    supervisor.RESTARTING: "🟡",
+    supervisor.CRASHLOOP: "⚠️",
+    supervisor.HIBERNATED: "💤",
+    cluster.UNREACHABLE: "❔",
+}
+
+CLONE_TEXT = {
+    "reflink": "نسخ CoW",
+    "link": "روابط",
+    "copy": "نسخ كامل",
+    "symlink": "روابط رمزية",
+}
+
+BULK_TEXT = {
+    "start": "تشغيل",
+    "stop": "إيقاف",
+    "restart": "إعادة تشغيل",
+}
+
 COMMON_LIBS = [
     "requests", "aiohttp", "python-telegram-bot",
     "flask", "fastapi", "beautifulsoup4",
     "pandas", "numpy", "pillow"
 ]
 
-def load_db():
-    if not os.path.exists(DB):
-        return {}
-    with open(DB, "r") as f:
-        return json.load(f)
+def get_user_bots(user_id):
+    return [d for d in fsindex.dirs(os.path.join(BASE, user_id)) if not d.startswith(".")]
 
-def save_db(data):
-    with open(DB, "w") as f:
-        json.dump(data, f, indent=4)
+def get_bot_files(bot_path):
+    return _bot_files(fsindex.listing(bot_path))
 
-def get_user_bots(user_id):
-    user_path = os.path.join(BASE, user_id)
-    if not os.path.exists(user_path):
-        return []
-    return [d for d in os.listdir(user_path) if os.path.isdir(os.path.join(user_path, d))]
+@functools.lru_cache(maxsize=256)
+def _bot_files(listing):
+    if listing is None:
+        return ()
+    files = [(f, size) for f, size in listing.files if f != 'bot.zip' and not f.startswith(logs.LOG_NAME)]
+    return tuple([f for f in files if f[0].endswith('.py')] + [f for f in files if not f[0].endswith('.py')])
 
 def get_bot_path(user_id, bot_name):
     return os.path.join(BASE, user_id, bot_name)
 
+def format_duration(seconds):
+    seconds = int(seconds)
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if days:
+        return f"{days}ي {hours}س"
+    if hours:
+        return f"{hours}س {minutes}د"
+    return f"{minutes}د {seconds}ث"
+
 def get_main_keyboard(user_id, current_bot=None):
+    return _main_keyboard(current_bot)
+
+@functools.lru_cache(maxsize=1024)
+def _main_keyboard(current_bot):
     keyboard = []
     
     if current_bot:
@@ -70,51 +157,127 @@ def get_main_keyboard(user_id, current_bot=None):
             InlineKeyboardButton("📁 إدارة الملفات", callback_data="files_menu"),
             InlineKeyboardButton("🔄 حالة البوت", callback_data="status")
         ])
-        keyboard.append([InlineKeyboardButton("🔀 تغيير البوت", callback_data="bots_menu")])
+        keyboard.append([
+            InlineKeyboardButton("⏪ الإصدار السابق", callback_data="rollback"),
+            InlineKeyboardButton("🗂 النسخ الاحتياطية", callback_data="snapshots")
+        ])
+        keyboard.append([
+            InlineKeyboardButton("🧬 نسخ البوت", callback_data="clone"),
+            InlineKeyboardButton("🔀 تغيير البوت", callback_data="bots_menu")
+        ])
     else:
         keyboard.append([InlineKeyboardButton("📋 بوتاتي", callback_data="bots_menu")])
         keyboard.append([InlineKeyboardButton("➕ إنشاء بوت جديد", callback_data="new_bot")])
     
     return InlineKeyboardMarkup(keyboard)
 
-def get_bots_keyboard(user_id):
-    keyboard = []
+def get_bots_keyboard(user_id, page=0):
     bots = get_user_bots(user_id)
-    db = load_db()
+    states = cluster.states(user_id, bots)
+    return _bots_keyboard(tuple((b, STATE_ICONS.get(states[b], "🔴")) for b in bots), page)
+
+@functools.lru_cache(maxsize=1024)
+def _bots_keyboard(bots, page):
+    keyboard = []
+    pages = max(1, -(-len(bots) // BOTS_PAGE_SIZE))
+    page = min(max(page, 0), pages - 1)
     
-    for bot_name in bots:
-        bot_key = f"{user_id}_{bot_name}"
-        status = "🟢" if bot_key in db else "🔴"
+    for bot_name, status in bots[page * BOTS_PAGE_SIZE:(page + 1) * BOTS_PAGE_SIZE]:
         keyboard.append([
             InlineKeyboardButton(f"{status} {bot_name}", callback_data=f"select_{bot_name}"),
             InlineKeyboardButton("🗑", callback_data=f"delbot_{bot_name}")
         ])
+    if pages > 1:
+        keyboard.append(get_pager_row("bots_page_", page, pages))
+    if len(bots) > 1:
+        keyboard.append([
+            InlineKeyboardButton("▶️ تشغيل الكل", callback_data="bulk_start"),
+            InlineKeyboardButton("⏹ إيقاف الكل", callback_data="bulk_stop"),
+            InlineKeyboardButton("🔁 إعادة الكل", callback_data="bulk_restart")
+        ])
     
-    keyboard.append([InlineKeyboardButton("➕ إنشاء بوت جديد", callback_data="new_bot")])
+    keyboard.append([
+        InlineKeyboardButton("➕ إنشاء بوت جديد", callback_data="new_bot"),
+        InlineKeyboardButton("♻️ المحذوفة", callback_data="trash")
+    ])
+    keyboard.append([InlineKeyboardButton("🔙 رجوع", callback_data="back")])
+    return InlineKeyboardMarkup(keyboard)
+
+def get_snapshots_keyboard(names):
+    keyboard = [
+        [InlineKeyboardButton(f"♻️ {name}", callback_data=f"snaprestore_{name}")]
+        for name in reversed(names[-SNAPSHOTS_SHOWN:])
+    ]
+    keyboard.append([InlineKeyboardButton("📸 نسخة جديدة", callback_data="snapshot_new")])
     keyboard.append([InlineKeyboardButton("🔙 رجوع", callback_data="back")])
     return InlineKeyboardMarkup(keyboard)
 
-def get_files_keyboard(bot_path):
+def get_trash_keyboard(bots):
+    keyboard = [[InlineKeyboardButton(f"♻️ {bot_name}", callback_data=f"undelete_{bot_name}")] for bot_name in bots]
+    keyboard.append([InlineKeyboardButton("🔙 رجوع", callback_data="bots_menu")])
+    return InlineKeyboardMarkup(keyboard)
+
+def get_pager_row(prefix, page, pages):
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton("◀️", callback_data=f"{prefix}{page - 1}"))
+    row.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data=f"{prefix}{page}"))
+    if page < pages - 1:
+        row.append(InlineKeyboardButton("▶️", callback_data=f"{prefix}{page + 1}"))
+    return row
+
+def get_files_keyboard(bot_path, page=0):
+    return _files_keyboard(fsindex.listing(bot_path), page)
+
+@functools.lru_cache(maxsize=256)
+def _files_keyboard(listing, page):
     keyboard = []
-    if os.path.exists(bot_path):
-        files = [f for f in os.listdir(bot_path) if os.path.isfile(os.path.join(bot_path, f))]
-        py_files = [f for f in files if f.endswith('.py')]
-        other_files = [f for f in files if not f.endswith('.py') and f not in ['log.txt', 'bot.zip']]
-        
-        for f in py_files[:5]:
-            keyboard.append([
-                InlineKeyboardButton(f"📄 {f}", callback_data=f"view_{f}"),
-                InlineKeyboardButton("🗑", callback_data=f"del_{f}")
-            ])
-        for f in other_files[:3]:
-            keyboard.append([
-                InlineKeyboardButton(f"📎 {f}", callback_data=f"view_{f}"),
-                InlineKeyboardButton("🗑", callback_data=f"del_{f}")
-            ])
+    files = _bot_files(listing)
+    pages = max(1, -(-len(files) // FILES_PAGE_SIZE))
+    page = min(max(page, 0), pages - 1)
+    
+    for f, _ in files[page * FILES_PAGE_SIZE:(page + 1) * FILES_PAGE_SIZE]:
+        keyboard.append([
+            InlineKeyboardButton(f"{'📄' if f.endswith('.py') else '📎'} {f}", callback_data=f"view_{f}"),
+            InlineKeyboardButton("🗑", callback_data=f"del_{f}")
+        ])
+    if pages > 1:
+        keyboard.append(get_pager_row("files_page_", page, pages))
     
     keyboard.append([InlineKeyboardButton("🔙 رجوع", callback_data="back")])
     return InlineKeyboardMarkup(keyboard)
 
+@functools.lru_cache(maxsize=256)
+def get_view_keyboard(page, pages):
+    keyboard = []
+    if pages > 1:
+        keyboard.append(get_pager_row("viewpage_", page, pages))
+    keyboard.append([InlineKeyboardButton("🔙 الملفات", callback_data="files_back")])
+    return InlineKeyboardMarkup(keyboard)
+
+def format_size(size):
+    if size < 1024:
+        return f"{size} B"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f} KB"
+    return f"{size / (1024 * 1024):.1f} MB"
+
+def get_log_keyboard(user_id, current_bot, following=False):
+    return _log_keyboard(current_bot, following)
+
+@functools.lru_cache(maxsize=1024)
+def _log_keyboard(current_bot, following):
+    if following:
+        keyboard = [[InlineKeyboardButton("⏸ إيقاف المتابعة", callback_data="log_stop")]]
+    else:
+        keyboard = [[
+            InlineKeyboardButton("🔄 تحديث", callback_data="log"),
+            InlineKeyboardButton("🔴 متابعة مباشرة", callback_data="log_follow")
+        ]]
+    keyboard += _main_keyboard(current_bot).inline_keyboard
+    return InlineKeyboardMarkup(keyboard)
+
+@functools.lru_cache(maxsize=None)
 def get_libs_keyboard():
     keyboard = []
     row = []
@@ -126,9 +289,66 @@ def get_libs_keyboard():
     if row:
         keyboard.append(row)
     keyboard.append([InlineKeyboardButton("✍️ كتابة مكتبات يدوياً", callback_data="custom_libs")])
+    keyboard.append([InlineKeyboardButton("🔁 إعادة تثبيت requirements.txt", callback_data="reinstall_reqs")])
     keyboard.append([InlineKeyboardButton("🔙 رجوع", callback_data="back")])
     return InlineKeyboardMarkup(keyboard)
 
+def get_job_keyboard(job_id):
+    return InlineKeyboardMarkup([[InlineKeyboardButton("✖️ إلغاء", callback_data=f"canceljob_{job_id}")]])
+
+async def safe_edit(message, text, reply_markup=None):
+    try:
+        await message.edit_text(text, reply_markup=reply_markup)
+    except BadRequest as e:
+        if "not modified" not in str(e):
+            logger.warning("تعذر تعديل الرسالة: %s", e)
+
+def job_reporter(message, user_id, bot_name, done_text, fail_text):
+    async def on_progress(job):
+        text = f"⏳ {job.title}\n🆔 المهمة: {job.id}"
+        tail = job.tail()
+        if tail:
+            text += f"\n\n{tail}"
+        with ratelimit.low_priority():
+            await safe_edit(message, text, reply_markup=get_job_keyboard(job.id))
+
+    async def on_done(job):
+        if job.status == jobs.DONE:
+            text = done_text
+        elif job.status == jobs.CANCELLED:
+            text = f"⛔ تم إلغاء المهمة {job.id}."
+        else:
+            text = f"{fail_text}\n\n{job.error or job.tail(500)}"
+        await safe_edit(message, text, reply_markup=get_main_keyboard(user_id, bot_name))
+
+    return on_progress, on_done
+
+def run_action(message, user_id, key, title, func, markup, kind="action"):
+    result = {}
+
+    async def run(job):
+        result["text"] = await func(job)
+
+    async def on_done(job):
+        if job.status == jobs.CANCELLED:
+            text = f"⛔ تم إلغاء المهمة {job.id}."
+        elif job.status == jobs.FAILED:
+            text = f"❌ فشل: {job.title}\n\n{job.error or job.tail(500)}"
+        else:
+            text = result["text"]
+        keyboard = markup() if markup else None
+        if isinstance(text, tuple):
+            text, keyboard = text
+        await safe_edit(message, text, reply_markup=keyboard)
+
+    return jobs.submit(key, title, run, owner=user_id, on_done=on_done, kind=kind)
+
+def pip_install_job(packages, bot_path):
+    async def run(job):
+        return await installer.install(job, bot_path, packages=packages)
+    return run
+
+@metrics.timed("start")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.message.from_user.id)
     current_bot = context.user_data.get("current_bot")
@@ -150,331 +370,568 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=get_main_keyboard(user_id, current_bot)
         )
 
+buttons = router.Router(
+    observe=lambda name, seconds: metrics.HANDLER_SECONDS.observe(seconds, handler=f"button:{name}")
+)
+
+class Press:
+    def __init__(self, query, context):
+        self.query = query
+        self.context = context
+        self.user_id = str(query.from_user.id)
+        self.current_bot = context.user_data.get("current_bot")
+        self.bot_path = get_bot_path(self.user_id, self.current_bot) if self.current_bot else None
+    
+    @property
+    def main_keyboard(self):
+        return get_main_keyboard(self.user_id, self.current_bot)
+    
+    async def edit(self, text, reply_markup=None):
+        await self.query.edit_message_text(text, reply_markup=reply_markup)
+
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    user_id = str(query.from_user.id)
-    user_path = os.path.join(BASE, user_id)
-    current_bot = context.user_data.get("current_bot")
-    bot_path = get_bot_path(user_id, current_bot) if current_bot else None
+    action, arg = buttons.resolve(query.data)
+    if action is None:
+        logger.warning("زر غير معروف: %s", query.data)
+        return
     
-    if query.data == "bots_menu":
-        bots = get_user_bots(user_id)
-        if not bots:
-            await query.edit_message_text(
-                "📋 لا يوجد بوتات بعد.\n\nاضغط 'إنشاء بوت جديد' لإنشاء أول بوت:",
-                reply_markup=get_bots_keyboard(user_id)
-            )
-        else:
-            await query.edit_message_text(
-                f"📋 بوتاتك ({len(bots)}):\n\n🟢 = شغال | 🔴 = متوقف\n\nاختر بوت للتحكم فيه:",
-                reply_markup=get_bots_keyboard(user_id)
-            )
+    press = Press(query, context)
+    if action.needs_bot and not press.current_bot:
+        await press.edit("❌ اختر بوت أولاً!", reply_markup=get_main_keyboard(press.user_id, None))
+        return
     
-    elif query.data == "new_bot":
-        await query.edit_message_text(
-            "➕ إنشاء بوت جديد\n\n"
-            "أرسل اسم البوت الجديد (بدون مسافات):\n\n"
-            "مثال: MyBot أو bot1"
-        )
-        context.user_data["waiting_for_bot_name"] = True
+    try:
+        if action.parse:
+            await buttons.run(action, press, arg)
+        else:
+            await buttons.run(action, press)
+    except (rpc.Unavailable, rpc.RemoteError) as e:
+        logger.warning("فشل الاتصال بالعامل أثناء %s: %s", action.name, e)
+        await press.edit("❌ خادم التشغيل غير متاح حالياً، حاول مرة أخرى لاحقاً.", reply_markup=press.main_keyboard)
+
+async def show_bots(press, page):
+    bots = get_user_bots(press.user_id)
+    if not bots:
+        text = "📋 لا يوجد بوتات بعد.\n\nاضغط 'إنشاء بوت جديد' لإنشاء أول بوت:"
+    else:
+        text = f"📋 بوتاتك ({len(bots)}):\n\n🟢 = شغال | 🔴 = متوقف\n\nاختر بوت للتحكم فيه:"
+    press.context.user_data["bots_page"] = page
+    await cluster.refresh(press.user_id, bots)
+    await safe_edit(press.query.message, text, reply_markup=get_bots_keyboard(press.user_id, page))
+
+@buttons.action("bots_menu")
+async def on_bots_menu(press):
+    await show_bots(press, 0)
+
+@buttons.action("bots_page_", parse=int)
+async def on_bots_page(press, page):
+    await show_bots(press, page)
+
+@buttons.action("new_bot")
+async def on_new_bot(press):
+    await press.edit(
+        "➕ إنشاء بوت جديد\n\n"
+        "أرسل اسم البوت الجديد (بدون مسافات):\n\n"
+        "مثال: MyBot أو bot1"
+    )
+    press.context.user_data["waiting_for_bot_name"] = True
+
+@buttons.action("select_", parse=str)
+async def on_select(press, bot_name):
+    press.context.user_data["current_bot"] = bot_name
     
-    elif query.data.startswith("select_"):
-        bot_name = query.data.replace("select_", "")
-        context.user_data["current_bot"] = bot_name
-        
-        await query.edit_message_text(
-            f"✅ تم اختيار البوت: {bot_name}\n\n"
-            "استخدم الأزرار للتحكم في البوت:",
-            reply_markup=get_main_keyboard(user_id, bot_name)
-        )
+    await press.edit(
+        f"✅ تم اختيار البوت: {bot_name}\n\n"
+        "استخدم الأزرار للتحكم في البوت:",
+        reply_markup=get_main_keyboard(press.user_id, bot_name)
+    )
+
+@buttons.action("delbot_", parse=str)
+async def on_delete_bot(press, bot_name):
+    user_id, user_data = press.user_id, press.context.user_data
+    bot_to_delete = get_bot_path(user_id, bot_name)
     
-    elif query.data.startswith("delbot_"):
-        bot_name = query.data.replace("delbot_", "")
-        bot_to_delete = get_bot_path(user_id, bot_name)
-        
-        db = load_db()
-        bot_key = f"{user_id}_{bot_name}"
-        if bot_key in db:
+    async def delete(job):
+        if os.path.isdir(bot_to_delete):
             try:
-                os.kill(db[bot_key], 9)
-            except ProcessLookupError:
-                pass
-            del db[bot_key]
-            save_db(db)
+                await asyncio.to_thread(snapshots.create, user_id, bot_name, bot_to_delete, snapshots.DELETED)
+                await asyncio.to_thread(snapshots.prune, user_id, bot_name)
+            except OSError as e:
+                logger.exception("تعذر أخذ نسخة من %s/%s قبل الحذف", user_id, bot_name)
+                return f"❌ تعذر أخذ نسخة احتياطية قبل الحذف، لم يتم حذف البوت.\n\n{e}"
         
-        if os.path.exists(bot_to_delete):
-            shutil.rmtree(bot_to_delete)
+        await cluster.delete(user_id, bot_name)
+        await asyncio.to_thread(releases.remove, bot_to_delete)
         
-        if context.user_data.get("current_bot") == bot_name:
-            context.user_data["current_bot"] = None
+        if user_data.get("current_bot") == bot_name:
+            user_data["current_bot"] = None
         
-        await query.edit_message_text(
-            f"✅ تم حذف البوت: {bot_name}",
-            reply_markup=get_bots_keyboard(user_id)
-        )
+        return f"✅ تم حذف البوت: {bot_name}\n\nيمكن استعادته من '♻️ المحذوفة' خلال {snapshots.SNAPSHOT_TRASH_DAYS:g} يوم."
     
-    elif query.data == "run":
-        if not current_bot:
-            await query.edit_message_text(
-                "❌ اختر بوت أولاً!",
-                reply_markup=get_main_keyboard(user_id, None)
-            )
-            return
-        
-        app_path = os.path.join(bot_path, "app.py")
-        if not os.path.exists(app_path):
-            await query.edit_message_text(
-                "❌ لم أجد app.py في مجلد البوت.\n\nأرسل ملف .py أو ZIP أولاً.",
-                reply_markup=get_main_keyboard(user_id, current_bot)
-            )
-            return
-        
-        log_path = os.path.join(bot_path, "log.txt")
-        env = os.environ.copy()
-        env["PYTHONPATH"] = bot_path
-        
-        with open(log_path, "w") as log_file:
-            p = subprocess.Popen(
-                ["python3", "app.py"],
-                stdout=log_file,
-                stderr=subprocess.STDOUT,
-                cwd=bot_path,
-                env=env
-            )
-        
-        db = load_db()
-        bot_key = f"{user_id}_{current_bot}"
-        db[bot_key] = p.pid
-        save_db(db)
-        
-        await query.edit_message_text(
-            f"✅ تم تشغيل {current_bot}!\n\nPID = {p.pid}",
-            reply_markup=get_main_keyboard(user_id, current_bot)
+    await press.edit(f"⏳ جاري حذف {bot_name}...")
+    run_action(
+        press.query.message, user_id, f"{user_id}_{bot_name}", f"حذف {bot_name}", delete,
+        lambda: get_bots_keyboard(user_id, user_data.get("bots_page", 0))
+    )
+
+@buttons.action("run", needs_bot=True)
+async def on_run(press):
+    user_id, current_bot = press.user_id, press.current_bot
+    app_path = os.path.join(press.bot_path, "app.py")
+    if not os.path.exists(app_path):
+        await press.edit(
+            "❌ لم أجد app.py في مجلد البوت.\n\nأرسل ملف .py أو ZIP أولاً.",
+            reply_markup=press.main_keyboard
         )
+        return
     
-    elif query.data == "stop":
-        if not current_bot:
-            await query.edit_message_text(
-                "❌ اختر بوت أولاً!",
-                reply_markup=get_main_keyboard(user_id, None)
-            )
-            return
-        
-        db = load_db()
-        bot_key = f"{user_id}_{current_bot}"
-        
-        if bot_key not in db:
-            await query.edit_message_text(
-                "❌ البوت غير شغال.",
-                reply_markup=get_main_keyboard(user_id, current_bot)
-            )
-            return
-        
-        try:
-            os.kill(db[bot_key], 9)
-        except ProcessLookupError:
-            pass
-        
-        del db[bot_key]
-        save_db(db)
-        
-        await query.edit_message_text(
-            f"⛔ تم إيقاف {current_bot}.",
-            reply_markup=get_main_keyboard(user_id, current_bot)
-        )
+    try:
+        result = await cluster.start(user_id, current_bot, press.bot_path)
+    except limits.QuotaExceeded as e:
+        await press.edit(f"❌ {e}", reply_markup=press.main_keyboard)
+        return
     
-    elif query.data == "log":
-        if not current_bot:
-            await query.edit_message_text(
-                "❌ اختر بوت أولاً!",
-                reply_markup=get_main_keyboard(user_id, None)
-            )
-            return
-        
-        log_path = os.path.join(bot_path, "log.txt")
-        if not os.path.exists(log_path):
-            await query.edit_message_text(
-                "❌ لا يوجد سجلات بعد.",
-                reply_markup=get_main_keyboard(user_id, current_bot)
-            )
-            return
-        
-        with open(log_path, "r") as f:
-            content = f.read()[-2000:]
-        
-        if not content:
-            content = "السجلات فارغة"
-        
-        await query.edit_message_text(
-            f"📄 سجلات {current_bot}:\n\n{content}",
-            reply_markup=get_main_keyboard(user_id, current_bot)
-        )
+    if result.get("woken"):
+        text = f"☀️ تم إيقاظ {current_bot} من السبات."
+    elif result.get("already"):
+        text = f"ℹ️ {current_bot} شغال بالفعل.\n\nPID = {result['pid']}"
+    else:
+        text = f"✅ تم تشغيل {current_bot}!\n\nPID = {result['pid']}"
+    await press.edit(text, reply_markup=press.main_keyboard)
+
+@buttons.action("stop", needs_bot=True)
+async def on_stop_bot(press):
+    user_id, current_bot = press.user_id, press.current_bot
     
-    elif query.data == "status":
-        if not current_bot:
-            await query.edit_message_text(
-                "❌ اختر بوت أولاً!",
-                reply_markup=get_main_keyboard(user_id, None)
-            )
-            return
-        
-        db = load_db()
-        bot_key = f"{user_id}_{current_bot}"
-        app_path = os.path.join(bot_path, "app.py")
-        
-        has_bot = os.path.exists(app_path)
-        is_running = bot_key in db
-        
-        files_count = 0
-        if os.path.exists(bot_path):
-            files_count = len([f for f in os.listdir(bot_path) if os.path.isfile(os.path.join(bot_path, f))])
-        
-        status_text = f"🔄 حالة {current_bot}:\n\n"
-        status_text += f"📁 ملف app.py: {'✅ موجود' if has_bot else '❌ غير موجود'}\n"
-        status_text += f"📂 عدد الملفات: {files_count}\n"
-        status_text += f"⚡ الحالة: {'🟢 شغال' if is_running else '🔴 متوقف'}\n"
-        
-        if is_running:
-            status_text += f"🔢 PID: {db[bot_key]}"
-        
-        await query.edit_message_text(
-            status_text,
-            reply_markup=get_main_keyboard(user_id, current_bot)
-        )
+    async def stop(job):
+        if not await cluster.stop(user_id, current_bot):
+            return "❌ البوت غير شغال."
+        return f"⛔ تم إيقاف {current_bot}."
     
-    elif query.data == "install_menu":
-        if not current_bot:
-            await query.edit_message_text(
-                "❌ اختر بوت أولاً!",
-                reply_markup=get_main_keyboard(user_id, None)
-            )
-            return
-        
-        await query.edit_message_text(
-            f"📦 تثبيت مكتبات لـ {current_bot}:\n\n"
-            "اختر مكتبة أو اكتب اسمها يدوياً:",
-            reply_markup=get_libs_keyboard()
+    await press.edit(f"⏳ جاري إيقاف {current_bot}...")
+    run_action(
+        press.query.message, user_id, f"{user_id}_{current_bot}", f"إيقاف {current_bot}", stop,
+        lambda: get_main_keyboard(user_id, current_bot)
+    )
+
+async def bulk_targets(kind, user_ids):
+    items = []
+    for user_id in user_ids:
+        bots = [b for b in get_user_bots(user_id) if os.path.exists(os.path.join(get_bot_path(user_id, b), "app.py"))]
+        states = await cluster.refresh(user_id, bots)
+        for bot_name in bots:
+            active = states.get(bot_name) in cluster.ACTIVE
+            if active != (kind == "start"):
+                items.append((user_id, bot_name))
+    return items
+
+async def bulk_run(kind, items, message):
+    async def start_one(user_id, bot_name):
+        await cluster.start(user_id, bot_name, get_bot_path(user_id, bot_name), settle=True)
+
+    async def restart_one(user_id, bot_name):
+        await cluster.stop(user_id, bot_name)
+        await start_one(user_id, bot_name)
+
+    last = [time.monotonic()]
+
+    def on_progress(result):
+        if result.done < result.total and time.monotonic() - last[0] >= BULK_PROGRESS_INTERVAL:
+            last[0] = time.monotonic()
+            with ratelimit.low_priority():
+                asyncio.create_task(safe_edit(message, f"⏳ {BULK_TEXT[kind]} {result.done}/{result.total}..."))
+
+    if kind == "stop":
+        result = await fleet.each(items, cluster.stop, fleet.FLEET_STOP_CONCURRENCY, on_progress)
+    else:
+        result = await fleet.each(items, start_one if kind == "start" else restart_one, on_progress=on_progress)
+    text = f"✅ {BULK_TEXT[kind]} {result.ok}/{result.total} بوت خلال {result.elapsed:.1f} ث"
+    if result.failed:
+        text += f"\n\n❌ فشل {len(result.failed)}:\n" + "\n".join(
+            f"• {'/'.join(item)}: {error}" for item, error in result.failed[:10]
         )
+    return text
+
+@buttons.action("bulk_", parse=str)
+async def on_bulk(press, kind):
+    if kind not in BULK_TEXT:
+        return
+    items = await bulk_targets(kind, [press.user_id])
+    if not items:
+        await show_bots(press, press.context.user_data.get("bots_page", 0))
+        return
+    user_id, message, page = press.user_id, press.query.message, press.context.user_data.get("bots_page", 0)
     
-    elif query.data.startswith("lib_"):
-        if not current_bot:
-            return
-        
-        lib_name = query.data.replace("lib_", "")
-        
-        await query.edit_message_text(f"⏳ جاري تثبيت {lib_name} في {current_bot}...")
-        
-        result = subprocess.run(
-            ["pip", "install", lib_name, "--target", bot_path],
-            capture_output=True,
-            text=True
-        )
-        
-        if result.returncode == 0:
-            await query.edit_message_text(
-                f"✅ تم تثبيت {lib_name} في {current_bot}!",
-                reply_markup=get_main_keyboard(user_id, current_bot)
-            )
-        else:
-            await query.edit_message_text(
-                f"❌ فشل تثبيت {lib_name}\n\n{result.stderr[:500]}",
-                reply_markup=get_main_keyboard(user_id, current_bot)
-            )
+    async def run(job):
+        text = await bulk_run(kind, items, message)
+        await cluster.refresh(user_id, get_user_bots(user_id))
+        return text
     
-    elif query.data == "custom_libs":
-        await query.edit_message_text(
-            "✍️ أرسل أسماء المكتبات مفصولة بمسافات:\n\n"
-            "مثال: requests flask aiohttp"
+    await press.edit(f"⏳ {BULK_TEXT[kind]} {len(items)} بوت...")
+    run_action(message, user_id, f"{user_id}_bulk", f"{BULK_TEXT[kind]} {len(items)} بوت", run,
+               lambda: get_bots_keyboard(user_id, page), kind="bulk")
+
+async def fleet_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if str(update.message.from_user.id) not in ADMIN_IDS:
+        return
+    if not context.args or context.args[0] not in BULK_TEXT:
+        await update.message.reply_text(
+            "الاستخدام: /fleet start|stop|restart [user_id ...]\n\nبدون user_id يتم التنفيذ على كل المستخدمين."
         )
-        context.user_data["waiting_for_libs"] = True
+        return
+    kind = context.args[0]
+    user_ids = context.args[1:] or fsindex.dirs(BASE)
+    message = await update.message.reply_text(f"⏳ {BULK_TEXT[kind]} بوتات {len(user_ids)} مستخدم...")
     
-    elif query.data == "files_menu":
-        if not current_bot:
-            await query.edit_message_text(
-                "❌ اختر بوت أولاً!",
-                reply_markup=get_main_keyboard(user_id, None)
-            )
-            return
-        
-        files = []
-        if os.path.exists(bot_path):
-            files = [f for f in os.listdir(bot_path) if os.path.isfile(os.path.join(bot_path, f))]
-            files = [f for f in files if f not in ['log.txt', 'bot.zip']]
-        
-        if not files:
-            await query.edit_message_text(
-                f"📁 لا توجد ملفات في {current_bot}.\n\nأرسل ملف .py أو ZIP.",
-                reply_markup=get_main_keyboard(user_id, current_bot)
-            )
+    async def run(job):
+        items = await bulk_targets(kind, user_ids)
+        await safe_edit(message, f"⏳ {BULK_TEXT[kind]} {len(items)} بوت لـ {len(user_ids)} مستخدم...")
+        return await bulk_run(kind, items, message)
+    
+    run_action(message, str(update.message.from_user.id), "fleet", f"/fleet {kind}", run, None, kind="bulk")
+
+@buttons.action("rollback", needs_bot=True)
+async def on_rollback(press):
+    user_id, current_bot, bot_path = press.user_id, press.current_bot, press.bot_path
+    
+    async def rollback(job):
+        try:
+            name = await releases.rollback(user_id, current_bot, bot_path)
+        except releases.HealthCheckFailed as e:
+            return f"❌ الإصدار {e} فشل فحص الصحة، تم الإبقاء على الإصدار الحالي."
+        if name is None:
+            return "❌ لا يوجد إصدار سابق لهذا البوت."
+        return f"⏪ تم الرجوع إلى الإصدار {name}."
+    
+    await press.edit(f"⏳ جاري الرجوع إلى الإصدار السابق لـ {current_bot}...")
+    run_action(
+        press.query.message, user_id, f"{user_id}_{current_bot}", f"رجوع {current_bot}", rollback,
+        lambda: get_main_keyboard(user_id, current_bot)
+    )
+
+async def restore_snapshot(user_id, bot_name, name):
+    bot_path = get_bot_path(user_id, bot_name)
+    release = await asyncio.to_thread(releases.new, bot_path)
+    await asyncio.to_thread(snapshots.restore, user_id, bot_name, name, release)
+    try:
+        await releases.activate(user_id, bot_name, bot_path, os.path.basename(release))
+    except releases.HealthCheckFailed:
+        await asyncio.to_thread(releases.discard, release)
+        raise
+
+async def show_snapshots(press, text=None):
+    names = snapshots.names(press.user_id, press.current_bot)
+    if text is None:
+        text = f"🗂 النسخ الاحتياطية لـ {press.current_bot} ({len(names)}):" if names else \
+            f"🗂 لا توجد نسخ احتياطية لـ {press.current_bot} بعد."
+    await press.edit(text, reply_markup=get_snapshots_keyboard(names))
+
+@buttons.action("snapshots", needs_bot=True)
+async def on_snapshots(press):
+    await show_snapshots(press)
+
+@buttons.action("snapshot_new", needs_bot=True)
+async def on_snapshot_new(press):
+    user_id, current_bot, bot_path = press.user_id, press.current_bot, press.bot_path
+    
+    async def snapshot(job):
+        try:
+            name, stats = await asyncio.to_thread(snapshots.create, user_id, current_bot, bot_path)
+        except OSError as e:
+            return f"❌ فشل أخذ النسخة: {e}"
+        await asyncio.to_thread(snapshots.prune, user_id, current_bot)
+        return f"📸 تم أخذ النسخة {name}\n\n{stats}"
+    
+    await press.edit(f"⏳ جاري أخذ نسخة من {current_bot}...")
+    run_action(
+        press.query.message, user_id, f"{user_id}_{current_bot}", f"نسخة {current_bot}", snapshot,
+        lambda: get_snapshots_keyboard(snapshots.names(user_id, current_bot))
+    )
+
+@buttons.action("snaprestore_", parse=str, needs_bot=True)
+async def on_snapshot_restore(press, name):
+    user_id, current_bot = press.user_id, press.current_bot
+    
+    async def restore(job):
+        try:
+            await restore_snapshot(user_id, current_bot, name)
+        except releases.HealthCheckFailed:
+            text = f"❌ النسخة {name} فشلت في فحص الصحة، تم الإبقاء على الإصدار الحالي."
+        except (OSError, ValueError, RuntimeError) as e:
+            text = f"❌ فشلت الاستعادة من {name}: {e}"
         else:
-            await query.edit_message_text(
-                f"📁 ملفات {current_bot} ({len(files)}):",
-                reply_markup=get_files_keyboard(bot_path)
-            )
+            return f"♻️ تمت استعادة {current_bot} من النسخة {name}."
+        return text, get_snapshots_keyboard(snapshots.names(user_id, current_bot))
     
-    elif query.data.startswith("view_"):
-        if not current_bot:
-            return
-        
-        filename = query.data.replace("view_", "")
-        file_path = os.path.join(bot_path, filename)
-        
-        if not os.path.exists(file_path):
-            await query.edit_message_text(
-                "❌ الملف غير موجود.",
-                reply_markup=get_files_keyboard(bot_path)
-            )
-            return
-        
+    await press.edit(f"⏳ جاري الاستعادة من {name}...")
+    run_action(
+        press.query.message, user_id, f"{user_id}_{current_bot}", f"استعادة {current_bot} من {name}", restore,
+        lambda: get_main_keyboard(user_id, current_bot)
+    )
+
+@buttons.action("trash")
+async def on_trash(press):
+    bots = snapshots.deleted(press.user_id, get_user_bots(press.user_id))
+    text = "♻️ البوتات المحذوفة:\n\nاختر بوت لاستعادته:" if bots else "♻️ لا توجد بوتات محذوفة."
+    await press.edit(text, reply_markup=get_trash_keyboard(bots))
+
+@buttons.action("undelete_", parse=str)
+async def on_undelete(press, bot_name):
+    names = snapshots.names(press.user_id, bot_name)
+    if not names or os.path.lexists(get_bot_path(press.user_id, bot_name)):
+        await on_trash(press)
+        return
+    user_id, user_data = press.user_id, press.context.user_data
+    
+    async def undelete(job):
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                content = f.read()[:1500]
-            
-            await query.edit_message_text(
-                f"📄 {filename}:\n\n{content}",
-                reply_markup=get_files_keyboard(bot_path)
-            )
-        except Exception:
-            await query.edit_message_text(
-                f"❌ لا يمكن قراءة {filename}",
-                reply_markup=get_files_keyboard(bot_path)
-            )
+            await restore_snapshot(user_id, bot_name, names[-1])
+        except (OSError, ValueError, RuntimeError) as e:
+            return f"❌ فشلت استعادة {bot_name}: {e}", get_trash_keyboard([bot_name])
+        user_data["current_bot"] = bot_name
+        return f"♻️ تمت استعادة البوت: {bot_name}"
     
-    elif query.data.startswith("del_"):
-        if not current_bot:
-            return
+    await press.edit(f"⏳ جاري استعادة {bot_name}...")
+    run_action(
+        press.query.message, user_id, f"{user_id}_{bot_name}", f"استعادة {bot_name}", undelete,
+        lambda: get_main_keyboard(user_id, bot_name)
+    )
+
+@buttons.action("clone", needs_bot=True)
+async def on_clone(press):
+    await press.edit(
+        f"🧬 نسخ البوت {press.current_bot}\n\n"
+        "أرسل اسم البوت الجديد (بدون مسافات):"
+    )
+    press.context.user_data["waiting_for_clone"] = press.current_bot
+
+async def show_log(press, follow):
+    user_id, current_bot = press.user_id, press.current_bot
+    content = await cluster.log_tail(user_id, current_bot, press.bot_path)
+    if content is None:
+        await safe_edit(press.query.message, "❌ لا يوجد سجلات بعد.", reply_markup=press.main_keyboard)
+        return
+    
+    if follow:
+        message = press.query.message
         
-        filename = query.data.replace("del_", "")
-        file_path = os.path.join(bot_path, filename)
+        async def on_update(content, live):
+            with ratelimit.low_priority():
+                await safe_edit(
+                    message,
+                    f"📄 سجلات {current_bot}{' (مباشر 🔴)' if live else ''}:\n\n{content or 'السجلات فارغة'}",
+                    reply_markup=get_log_keyboard(user_id, current_bot, live)
+                )
         
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            await query.edit_message_text(
-                f"✅ تم حذف {filename}",
-                reply_markup=get_files_keyboard(bot_path)
-            )
-        else:
-            await query.edit_message_text(
-                "❌ الملف غير موجود.",
-                reply_markup=get_files_keyboard(bot_path)
-            )
+        logs.follow(user_id, logs.log_path(press.bot_path), on_update, read=cluster.log_reader(user_id, current_bot))
+        return
     
-    elif query.data == "current_info":
-        if current_bot:
-            await query.edit_message_text(
-                f"🤖 البوت الحالي: {current_bot}\n\n"
-                "استخدم الأزرار للتحكم أو اضغط 'تغيير البوت' لاختيار بوت آخر.",
-                reply_markup=get_main_keyboard(user_id, current_bot)
-            )
+    logs.unfollow(user_id)
     
-    elif query.data == "back":
-        await query.edit_message_text(
-            "🏠 القائمة الرئيسية",
-            reply_markup=get_main_keyboard(user_id, current_bot)
+    if not content:
+        content = "السجلات فارغة"
+    
+    await safe_edit(
+        press.query.message,
+        f"📄 سجلات {current_bot}:\n\n{content}",
+        reply_markup=get_log_keyboard(user_id, current_bot)
+    )
+
+@buttons.action("log", needs_bot=True)
+async def on_log(press):
+    await show_log(press, follow=False)
+
+@buttons.action("log_stop", needs_bot=True)
+async def on_log_stop(press):
+    await show_log(press, follow=False)
+
+@buttons.action("log_follow", needs_bot=True)
+async def on_log_follow(press):
+    await show_log(press, follow=True)
+
+@buttons.action("status", needs_bot=True)
+async def on_status(press):
+    user_id, current_bot = press.user_id, press.current_bot
+    info = await cluster.status(user_id, current_bot)
+    state = info["state"]
+    app_path = os.path.join(press.bot_path, "app.py")
+    
+    has_bot = os.path.exists(app_path)
+    is_running = info["pid"] is not None
+    
+    files_count = len(fsindex.files(press.bot_path))
+    
+    status_text = f"🔄 حالة {current_bot}:\n\n"
+    status_text += f"📁 ملف app.py: {'✅ موجود' if has_bot else '❌ غير موجود'}\n"
+    status_text += f"📂 عدد الملفات: {files_count}\n"
+    status_text += f"⚡ الحالة: {STATE_TEXT.get(state, '🔴 متوقف')}\n"
+    if info.get("agent"):
+        status_text += f"🖥 الخادم: {info['agent']}\n"
+    
+    if is_running:
+        status_text += f"🔢 PID: {info['pid']}\n"
+        status_text += f"⏱ مدة التشغيل: {format_duration(time.time() - info['started'])}\n"
+        usage = info["usage"]
+        if usage:
+            memory = f"{usage['rss'] // (1024 * 1024)}"
+            if info["memory_mb"]:
+                memory += f"/{info['memory_mb']}"
+            status_text += f"🧠 الذاكرة: {memory} MB\n"
+            status_text += f"⚙️ المعالج: {usage['cpu']:.0f}%"
+            status_text += " (مقيد)\n" if usage["throttled"] else "\n"
+            if usage["event"]:
+                status_text += f"🚧 آخر إجراء: {LIMIT_EVENTS.get(usage['event'], usage['event'])}\n"
+    if info["restarts"]:
+        status_text += f"🔁 مرات إعادة التشغيل: {info['restarts']}\n"
+    if info["exit_code"] is not None and not is_running:
+        status_text += f"🚪 آخر رمز خروج: {info['exit_code']}\n"
+    
+    await safe_edit(press.query.message, status_text, reply_markup=press.main_keyboard)
+
+@buttons.action("install_menu", needs_bot=True)
+async def on_install_menu(press):
+    await press.edit(
+        f"📦 تثبيت مكتبات لـ {press.current_bot}:\n\n"
+        "اختر مكتبة أو اكتب اسمها يدوياً:",
+        reply_markup=get_libs_keyboard()
+    )
+
+@buttons.action("lib_", parse=str, needs_bot=True)
+async def on_lib(press, lib_name):
+    user_id, current_bot = press.user_id, press.current_bot
+    on_progress, on_done = job_reporter(
+        press.query.message, user_id, current_bot,
+        f"✅ تم تثبيت {lib_name} في {current_bot}!",
+        f"❌ فشل تثبيت {lib_name}"
+    )
+    job = jobs.submit(
+        f"{user_id}_{current_bot}",
+        f"جاري تثبيت {lib_name} في {current_bot}",
+        pip_install_job([lib_name], press.bot_path),
+        owner=user_id,
+        on_progress=on_progress,
+        on_done=on_done,
+        kind="install"
+    )
+    await press.edit(
+        f"⏳ جاري تثبيت {lib_name} في {current_bot}...\n🆔 المهمة: {job.id}",
+        reply_markup=get_job_keyboard(job.id)
+    )
+
+@buttons.action("canceljob_", parse=int)
+async def on_cancel_job(press, job_id):
+    if not jobs.cancel(job_id, owner=press.user_id):
+        await press.edit("❌ المهمة انتهت أو غير موجودة.", reply_markup=press.main_keyboard)
+
+@buttons.action("reinstall_reqs", needs_bot=True)
+async def on_reinstall_reqs(press):
+    if not os.path.exists(os.path.join(press.bot_path, "requirements.txt")):
+        await press.edit("❌ لا يوجد requirements.txt في مجلد البوت.", reply_markup=press.main_keyboard)
+        return
+    
+    job = submit_deploy_job(press.query.message, press.bot_path, press.user_id, press.current_bot, force=True)
+    await press.edit(
+        f"⏳ إعادة تثبيت المتطلبات ...\n🆔 المهمة: {job.id}",
+        reply_markup=get_job_keyboard(job.id)
+    )
+
+@buttons.action("custom_libs")
+async def on_custom_libs(press):
+    await press.edit(
+        "✍️ أرسل أسماء المكتبات مفصولة بمسافات:\n\n"
+        "مثال: requests flask aiohttp"
+    )
+    press.context.user_data["waiting_for_libs"] = True
+
+async def show_files(press, page):
+    files = get_bot_files(press.bot_path)
+    press.context.user_data["files_page"] = page
+    
+    if not files:
+        await press.edit(
+            f"📁 لا توجد ملفات في {press.current_bot}.\n\nأرسل ملف .py أو ZIP.",
+            reply_markup=press.main_keyboard
         )
+    else:
+        await safe_edit(
+            press.query.message,
+            f"📁 ملفات {press.current_bot} ({len(files)}، {format_size(sum(size for _, size in files))}):",
+            reply_markup=get_files_keyboard(press.bot_path, page)
+        )
+
+@buttons.action("files_menu", needs_bot=True)
+async def on_files_menu(press):
+    await show_files(press, 0)
+
+@buttons.action("files_back", needs_bot=True)
+async def on_files_back(press):
+    await show_files(press, press.context.user_data.get("files_page", 0))
+
+@buttons.action("files_page_", parse=int, needs_bot=True)
+async def on_files_page(press, page):
+    await show_files(press, page)
+
+async def show_file(press, filename, page):
+    file_path = os.path.join(press.bot_path, filename or "")
+    files_page = press.context.user_data.get("files_page", 0)
+    
+    if not filename or not os.path.isfile(file_path):
+        await press.edit("❌ الملف غير موجود.", reply_markup=get_files_keyboard(press.bot_path, files_page))
+        return
+    
+    press.context.user_data["viewing"] = filename
+    try:
+        content, page, pages = fsindex.read_page(file_path, page)
+        size = fsindex.listing(press.bot_path).size(filename)
+        
+        await safe_edit(
+            press.query.message,
+            f"📄 {filename} ({format_size(size or 0)}):\n\n{content}",
+            reply_markup=get_view_keyboard(page, pages)
+        )
+    except Exception:
+        await press.edit(
+            f"❌ لا يمكن قراءة {filename}",
+            reply_markup=get_files_keyboard(press.bot_path, files_page)
+        )
+
+@buttons.action("view_", parse=str, needs_bot=True)
+async def on_view(press, filename):
+    await show_file(press, filename, 0)
+
+@buttons.action("viewpage_", parse=int, needs_bot=True)
+async def on_view_page(press, page):
+    await show_file(press, press.context.user_data.get("viewing"), page)
+
+@buttons.action("del_", parse=str, needs_bot=True)
+async def on_delete_file(press, filename):
+    file_path = os.path.join(press.bot_path, filename)
+    files_page = press.context.user_data.get("files_page", 0)
+    
+    if os.path.exists(file_path):
+        os.remove(file_path)
+        await cluster.remove_file(press.user_id, press.current_bot, filename)
+        await press.edit(f"✅ تم حذف {filename}", reply_markup=get_files_keyboard(press.bot_path, files_page))
+    else:
+        await press.edit("❌ الملف غير موجود.", reply_markup=get_files_keyboard(press.bot_path, files_page))
 
+@buttons.action("current_info")
+async def on_current_info(press):
+    if press.current_bot:
+        await press.edit(
+            f"🤖 البوت الحالي: {press.current_bot}\n\n"
+            "استخدم الأزرار للتحكم أو اضغط 'تغيير البوت' لاختيار بوت آخر.",
+            reply_markup=press.main_keyboard
+        )
+
+@buttons.action("back")
+async def on_back(press):
+    await press.edit("🏠 القائمة الرئيسية", reply_markup=press.main_keyboard)
+
+@metrics.timed("handle_text")
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.message.from_user.id)
     current_bot = context.user_data.get("current_bot")
@@ -483,6 +940,10 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         bot_name = update.message.text.strip().replace(" ", "_")
         bot_path = get_bot_path(user_id, bot_name)
         
+        if bot_name.startswith(".") or os.sep in bot_name:
+            await update.message.reply_text("❌ اسم غير صالح، اختر اسم آخر:")
+            return
+        
         if os.path.exists(bot_path):
             await update.message.reply_text(
                 f"❌ البوت '{bot_name}' موجود بالفعل!\n\nاختر اسم آخر:",
@@ -501,6 +962,44 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=get_main_keyboard(user_id, bot_name)
         )
     
+    elif context.user_data.get("waiting_for_clone"):
+        source = context.user_data.pop("waiting_for_clone")
+        bot_name = update.message.text.strip().replace(" ", "_")
+        bot_path = get_bot_path(user_id, bot_name)
+        
+        if bot_name.startswith(".") or os.sep in bot_name or os.path.lexists(bot_path):
+            await update.message.reply_text(
+                f"❌ الاسم '{bot_name}' غير صالح أو مستخدم.",
+                reply_markup=get_main_keyboard(user_id, current_bot)
+            )
+            return
+        
+        message = await update.message.reply_text(f"⏳ جاري نسخ {source} إلى {bot_name}...")
+        user_data = context.user_data
+        
+        async def copy(job):
+            release = await asyncio.to_thread(releases.new, bot_path)
+            start = time.monotonic()
+            try:
+                counts = await asyncio.to_thread(
+                    clone.tree, os.path.realpath(get_bot_path(user_id, source)), release,
+                    shutil.ignore_patterns(supervisor.READY_FILE, logs.LOG_NAME + "*", cluster.SYNC_STATE)
+                )
+                await releases.activate(user_id, bot_name, bot_path, os.path.basename(release))
+            except OSError as e:
+                await asyncio.to_thread(releases.discard, release)
+                return f"❌ فشل النسخ: {e}", get_main_keyboard(user_id, current_bot)
+            user_data["current_bot"] = bot_name
+            return (
+                f"✅ تم نسخ {source} إلى {bot_name} خلال {time.monotonic() - start:.1f} ث\n\n"
+                + "، ".join(f"{CLONE_TEXT.get(k, k)}: {v}" for k, v in sorted(counts.items()))
+            )
+        
+        run_action(
+            message, user_id, f"{user_id}_{bot_name}", f"نسخ {source} إلى {bot_name}", copy,
+            lambda: get_main_keyboard(user_id, bot_name)
+        )
+    
     elif context.user_data.get("waiting_for_libs"):
         if not current_bot:
             context.user_data["waiting_for_libs"] = False
@@ -513,34 +1012,135 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         bot_path = get_bot_path(user_id, current_bot)
         packages = update.message.text.strip()
         
-        await update.message.reply_text(f"⏳ جاري تثبيت: {packages}")
-        
-        result = subprocess.run(
-            ["pip", "install"] + packages.split() + ["--target", bot_path],
-            capture_output=True,
-            text=True
-        )
-        
         context.user_data["waiting_for_libs"] = False
         
-        if result.returncode == 0:
-            await update.message.reply_text(
-                f"✅ تم تثبيت المكتبات في {current_bot}!",
-                reply_markup=get_main_keyboard(user_id, current_bot)
-            )
-        else:
-            await update.message.reply_text(
-                f"❌ فشل التثبيت\n\n{result.stderr[:500]}",
-                reply_markup=get_main_keyboard(user_id, current_bot)
-            )
+        message = await update.message.reply_text(f"⏳ جاري تثبيت: {packages}")
+        on_progress, on_done = job_reporter(
+            message, user_id, current_bot,
+            f"✅ تم تثبيت المكتبات في {current_bot}!",
+            "❌ فشل التثبيت"
+        )
+        job = jobs.submit(
+            f"{user_id}_{current_bot}",
+            f"جاري تثبيت: {packages}",
+            pip_install_job(packages.split(), bot_path),
+            owner=user_id,
+            on_progress=on_progress,
+            on_done=on_done,
+            kind="install"
+        )
+        await safe_edit(
+            message,
+            f"⏳ جاري تثبيت: {packages}\n🆔 المهمة: {job.id}",
+            reply_markup=get_job_keyboard(job.id)
+        )
 
-async def auto_install_libs(bot_path, update):
+async def install_requirements(job, bot_path, force=False):
     req_file = os.path.join(bot_path, "requirements.txt")
-    if os.path.exists(req_file):
-        await update.message.reply_text("⏳ يتم تثبيت المكتبات من requirements.txt ...")
-        subprocess.run(["pip", "install", "-r", req_file, "--target", bot_path])
-        await update.message.reply_text("✅ تم تثبيت المكتبات!")
+    if not os.path.exists(req_file):
+        return True
+    plan = planner.plan(bot_path, req_file, force)
+    if plan.up_to_date:
+        job.log("✅ requirements.txt بدون تغيير")
+        return True
+    if plan.full or installer.syncs():
+        job.log("📦 requirements.txt")
+        ok = await installer.install(job, bot_path, requirements=req_file)
+    else:
+        job.log(f"📦 تغييرات: {', '.join(plan.changed)}")
+        ok = await installer.install(job, bot_path, packages=plan.changed)
+    if ok:
+        planner.record(bot_path, plan)
+    return ok
+
+async def compile_release(job, release):
+    compiled, skipped, errors = await asyncio.to_thread(bytecode.compile_tree, release)
+    own = unpack.members(release) | {"app.py"}
+    broken = [f"• {rel}:{error}" for rel, error in sorted(errors.items()) if rel in own]
+    if broken:
+        job.error = "❌ أخطاء في الكود، لم يتم النشر:\n\n" + "\n".join(broken[:10])
+        return False
+    if compiled:
+        job.log(f"🧩 تمت ترجمة {compiled} ملف ({skipped} بدون تغيير)")
+    return True
+
+def submit_deploy_job(message, bot_path, user_id, bot_name, zip_path=None, py_path=None, force=False):
+    async def prepare(job, release):
+        if zip_path:
+            started = time.monotonic()
+            try:
+                written, skipped = await asyncio.to_thread(
+                    unpack.extract, zip_path, release, lambda: job.cancel_requested
+                )
+            except (unpack.UnsafeArchive, zipfile.BadZipFile) as e:
+                job.error = f"ملف ZIP مرفوض: {e}"
+                return False
+            metrics.UNZIP_SECONDS.observe(time.monotonic() - started)
+            job.log(f"📂 {written} ملف محدث، {skipped} بدون تغيير")
+        if py_path:
+            os.replace(py_path, os.path.join(release, "app.py"))
+        if not await compile_release(job, release):
+            return False
+        return await install_requirements(job, release, force) and await compile_release(job, release)
+
+    async def run(job):
+        release = await asyncio.to_thread(releases.stage, bot_path)
+        try:
+            ok = await prepare(job, release) and not job.cancel_requested
+            if ok:
+                await releases.activate(user_id, bot_name, bot_path, os.path.basename(release))
+                job.log(f"🚀 الإصدار الحالي: {os.path.basename(release)}")
+        except releases.HealthCheckFailed:
+            job.error = "الإصدار الجديد توقف أثناء فحص الصحة، تم الإبقاء على الإصدار السابق."
+            ok = False
+        except BaseException:
+            await asyncio.to_thread(releases.discard, release)
+            raise
+        finally:
+            for path in (zip_path, py_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
+        if not ok:
+            await asyncio.to_thread(releases.discard, release)
+        return ok
 
+    on_progress, on_done = job_reporter(
+        message, user_id, bot_name,
+        f"✅ تم رفع الملفات إلى {bot_name}!",
+        f"❌ فشل تجهيز {bot_name}"
+    )
+    return jobs.submit(
+        f"{user_id}_{bot_name}",
+        f"تجهيز {bot_name}",
+        run,
+        owner=user_id,
+        on_progress=on_progress,
+        on_done=on_done,
+        kind="deploy"
+    )
+
+async def auto_install_libs(bot_path, update, user_id, bot_name, zip_path=None, py_path=None):
+    message = await update.message.reply_text("⏳ يتم تجهيز الملفات وتثبيت المكتبات ...")
+    job = submit_deploy_job(message, bot_path, user_id, bot_name, zip_path, py_path)
+    await safe_edit(
+        message,
+        f"⏳ يتم تجهيز الملفات وتثبيت المكتبات ...\n🆔 المهمة: {job.id}",
+        reply_markup=get_job_keyboard(job.id)
+    )
+
+async def receive_upload(update, dest):
+    try:
+        await uploads.fetch(update.message.document, dest)
+    except uploads.TooLarge as e:
+        await update.message.reply_text(f"❌ {e}")
+        return False
+    except (OSError, TelegramError) as e:
+        logger.warning("فشل تنزيل الملف من %s: %s", update.message.from_user.id, e)
+        await update.message.reply_text("❌ تعذر تنزيل الملف، حاول مرة أخرى.")
+        return False
+    return True
+
+@metrics.timed("handle_zip")
 async def handle_zip(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.message.from_user.id)
     current_bot = context.user_data.get("current_bot")
@@ -555,19 +1155,13 @@ async def handle_zip(update: Update, context: ContextTypes.DEFAULT_TYPE):
     bot_path = get_bot_path(user_id, current_bot)
     os.makedirs(bot_path, exist_ok=True)
 
-    file = await update.message.document.get_file()
-    zip_path = os.path.join(bot_path, "bot.zip")
-    await file.download_to_drive(zip_path)
-
-    subprocess.run(["unzip", "-o", zip_path, "-d", bot_path])
+    zip_path = releases.incoming(bot_path, ".zip")
+    if not await receive_upload(update, zip_path):
+        return
 
-    await auto_install_libs(bot_path, update)
-
-    await update.message.reply_text(
-        f"✅ تم رفع الملفات إلى {current_bot}!",
-        reply_markup=get_main_keyboard(user_id, current_bot)
-    )
+    await auto_install_libs(bot_path, update, user_id, current_bot, zip_path=zip_path)
 
+@metrics.timed("handle_py")
 async def handle_py(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.message.from_user.id)
     current_bot = context.user_data.get("current_bot")
@@ -582,35 +1176,132 @@ async def handle_py(update: Update, context: ContextTypes.DEFAULT_TYPE):
     bot_path = get_bot_path(user_id, current_bot)
     os.makedirs(bot_path, exist_ok=True)
 
-    file = await update.message.document.get_file()
-    py_path = os.path.join(bot_path, "app.py")
+    py_path = releases.incoming(bot_path, ".py")
+    if not await receive_upload(update, py_path):
+        return
 
-    await file.download_to_drive(py_path)
+    await auto_install_libs(bot_path, update, user_id, current_bot, py_path=py_path)
 
-    await auto_install_libs(bot_path, update)
+async def notify_bot_event(application, user_id, bot_name, state, code):
+    if state == supervisor.RESTARTING:
+        text = f"⚠️ البوت {bot_name} توقف (رمز {code}) وسيعاد تشغيله تلقائياً."
+    elif state == supervisor.CRASHLOOP:
+        text = f"🛑 البوت {bot_name} يتعطل باستمرار، تم إيقاف إعادة التشغيل التلقائي.\n\nراجع السجلات ثم شغله يدوياً."
+    else:
+        return
+    try:
+        await application.bot.send_message(chat_id=int(user_id), text=text)
+    except Exception as e:
+        logger.warning("تعذر إرسال تنبيه إلى %s: %s", user_id, e)
+
+def notify_limit(application, user_id, bot_name, resource_name, action):
+    event = LIMIT_EVENTS.get(f"{action}:{resource_name}", f"{action}:{resource_name}")
+    with ratelimit.low_priority():
+        application.create_task(application.bot.send_message(
+            chat_id=int(user_id),
+            text=f"🚧 البوت {bot_name} تجاوز حدود الموارد: {event}"
+        ))
 
-    await update.message.reply_text(
-        f"✅ تم رفع الملف إلى {current_bot}!",
-        reply_markup=get_main_keyboard(user_id, current_bot)
+background_tasks = []
+servers = []
+
+async def on_startup(application):
+    supervisor.listeners.append(
+        lambda user_id, bot_name, state, code: notify_bot_event(application, user_id, bot_name, state, code)
     )
+    supervisor.reconcile(get_bot_path)
+    if cluster.ENABLED:
+        cluster.setup()
+        cluster.listeners.append(
+            lambda user_id, bot_name, state, code: notify_bot_event(application, user_id, bot_name, state, code)
+        )
+        cluster.limit_listeners.append(lambda *args: notify_limit(application, *args))
+        await cluster.connect()
+    elif zygote.ENABLED:
+        try:
+            await zygote.start(COMMON_LIBS, limits.child_env())
+        except (OSError, RuntimeError, asyncio.TimeoutError):
+            logger.exception("تعذر تشغيل الـ zygote، سيتم التشغيل العادي للبوتات")
+    background_tasks.append(asyncio.create_task(
+        logs.rotator(lambda: [child.bot_path for child in supervisor.children()])
+    ))
+    background_tasks.append(asyncio.create_task(limits.monitor(
+        supervisor.children,
+        supervisor.kill,
+        lambda *args: notify_limit(application, *args)
+    )))
+    if hibernate.ENABLED and not cluster.ENABLED:
+        background_tasks.append(asyncio.create_task(hibernate.monitor()))
+    if not cluster.ENABLED:
+        background_tasks.append(asyncio.create_task(fleet.restore(
+            lambda user_id, bot_name: cluster.start(user_id, bot_name, get_bot_path(user_id, bot_name), settle=True)
+        )))
+    background_tasks.append(asyncio.create_task(snapshots.collector(
+        lambda user_id, bot_name: os.path.lexists(get_bot_path(user_id, bot_name))
+    )))
+    background_tasks.append(asyncio.create_task(metrics.loop_lag()))
+    if application.bot.rate_limiter:
+        metrics.collector(application.bot.rate_limiter.collect_metrics)
+    server = await metrics.serve()
+    if server:
+        servers.append(server)
 
-def main():
-    if not TOKEN:
-        logger.error("TELEGRAM_BOT_TOKEN غير موجود!")
-        print("خطأ: يرجى تعيين TELEGRAM_BOT_TOKEN")
-        return
+async def on_stop(application):
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    for server in servers:
+        server.close()
+        await server.wait_closed()
+    servers.clear()
+    for client in cluster.agents.values():
+        client.close()
+    await zygote.stop()
 
-    app = ApplicationBuilder().token(TOKEN).build()
+def build_application(builder=None):
+    builder = builder or ApplicationBuilder().token(TOKEN)
+    builder = builder.post_init(on_startup).post_stop(on_stop)
+    if ratelimit.ENABLED:
+        builder = builder.rate_limiter(ratelimit.Limiter())
+    if sessions.ENABLED:
+        builder = builder.persistence(sessions.Persistence())
+    if API_URL:
+        builder = builder.base_url(f"{API_URL}/bot").base_file_url(f"{API_URL}/file/bot")
+    app = builder.build()
 
     app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("fleet", fleet_command))
     app.add_handler(CallbackQueryHandler(button_handler))
     app.add_handler(MessageHandler(filters.Document.ZIP, handle_zip))
     app.add_handler(MessageHandler(filters.Document.FileExtension("py"), handle_py))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
+    return app
+
+def main():
+    if not TOKEN:
+        logger.error("TELEGRAM_BOT_TOKEN غير موجود!")
+        print("خطأ: يرجى تعيين TELEGRAM_BOT_TOKEN")
+        return
+
+    app = build_application()
 
     logger.info("البوت يعمل الآن...")
     print("البوت شغال! اضغط Ctrl+C للإيقاف.")
-    app.run_polling()
+    if MODE == "webhook":
+        if not WEBHOOK_URL:
+            logger.error("WEBHOOK_URL غير موجود!")
+            return
+        secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=secret
+        )
+    else:
+        app.run_polling()
 
 if __name__ == "__main__":
     main()
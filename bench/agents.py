@@ -0,0 +1,141 @@
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+WORKDIR = tempfile.mkdtemp(prefix="bench-agents-")
+
+os.environ.update(
+    REGISTRY=os.path.join(WORKDIR, "manager.db"),
+    DB=os.path.join(WORKDIR, "processes.json"),
+    BASE=os.path.join(WORKDIR, "manager"),
+    METRICS_PORT="0",
+)
+sys.path[:0] = [ROOT]
+
+BOT = """import os, time
+with open("ready", "w") as f:
+    f.write(str(os.getpid()))
+print("hello from", os.getcwd(), flush=True)
+counter = int(open("counter").read()) if os.path.exists("counter") else 0
+with open("counter", "w") as f:
+    f.write(str(counter + 1))
+time.sleep(3600)
+"""
+
+
+def spawn_agents(count):
+    procs = []
+    spec = []
+    env = dict(os.environ, ZYGOTE="0", HIBERNATE="0")
+    env.pop("REGISTRY")
+    for i in range(count):
+        name = f"a{i}"
+        sock = os.path.join(WORKDIR, f"{name}.sock")
+        procs.append(subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "agent.py"), "--listen", f"unix:{sock}",
+             "--base", os.path.join(WORKDIR, name), "--name", name],
+            env=env, stdout=subprocess.DEVNULL, stderr=open(os.path.join(WORKDIR, f"{name}.log"), "w")
+        ))
+        spec.append(f"{name}=unix:{sock}")
+    return procs, ",".join(spec)
+
+
+async def run(args, spec):
+    import cluster
+    cluster.ENABLED = True
+    cluster.setup(spec)
+    deadline = time.monotonic() + 20
+    sockets = [address[len("unix:"):] for address in cluster.configured(spec).values()]
+    while not all(os.path.exists(sock) for sock in sockets) and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+
+    base = os.environ["BASE"]
+    bots = []
+    for i in range(args.bots):
+        path = os.path.join(base, "1", f"bot{i}")
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "app.py"), "w") as f:
+            f.write(BOT)
+        with open(os.path.join(path, "data.bin"), "wb") as f:
+            f.write(os.urandom(args.payload_kb * 1024))
+        bots.append((f"bot{i}", path))
+
+    start_ms = []
+    for name, path in bots:
+        started = time.perf_counter()
+        await cluster.start("1", name, path)
+        start_ms.append((time.perf_counter() - started) * 1000)
+
+    placement = {}
+    for name, _ in bots:
+        placement.setdefault(cluster.owner("1", name), []).append(name)
+    states = await cluster.refresh("1", [name for name, _ in bots])
+
+    restart_ms = []
+    for name, path in bots[:5]:
+        await cluster.stop("1", name)
+        started = time.perf_counter()
+        await cluster.start("1", name, path)
+        restart_ms.append((time.perf_counter() - started) * 1000)
+
+    name, path = bots[0]
+    source = cluster.owner("1", name)
+    started = time.perf_counter()
+    target = await cluster.migrate("1", name, path)
+    migrate_ms = (time.perf_counter() - started) * 1000
+    status = await cluster.status("1", name)
+    log = await cluster.log_tail("1", name, path)
+
+    drained = await cluster.drain(target, lambda user_id, bot_name: os.path.join(base, user_id, bot_name))
+    final = {}
+    for name, _ in bots:
+        final.setdefault(cluster.owner("1", name), []).append(name)
+
+    for name, _ in bots:
+        await cluster.stop("1", name)
+    for client in cluster.agents.values():
+        client.close()
+    return {
+        "start_ms": start_ms,
+        "restart_ms": restart_ms,
+        "placement": {agent: len(names) for agent, names in placement.items()},
+        "running": sum(1 for state in states.values() if state == "running"),
+        "migrate": (source, target, migrate_ms, status["state"], status.get("agent"), log),
+        "drained": len(drained),
+        "final": {agent: len(names) for agent, names in final.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Place, restart and migrate bots across local worker agents")
+    parser.add_argument("--agents", type=int, default=3)
+    parser.add_argument("--bots", type=int, default=12)
+    parser.add_argument("--payload-kb", type=int, default=512, help="extra file per bot to sync")
+    args = parser.parse_args()
+
+    procs, spec = spawn_agents(args.agents)
+    try:
+        r = asyncio.run(run(args, spec))
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+
+    source, target, migrate_ms, state, owner, log = r["migrate"]
+    print(f"placement: {r['placement']}  running {r['running']}/{args.bots}")
+    print(f"first start (sync + spawn) p50 {statistics.median(r['start_ms']):6.1f}ms  max {max(r['start_ms']):6.1f}ms")
+    print(f"restart (nothing to sync)  p50 {statistics.median(r['restart_ms']):6.1f}ms")
+    print(f"migrate bot0 {source} -> {target}: {migrate_ms:.1f}ms, now {state} on {owner}")
+    print(f"log after migration: {(log or '').strip().splitlines()[-1:]}")
+    print(f"drained {target}: moved {r['drained']} bots, final placement {r['final']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+WORKDIR = tempfile.mkdtemp(prefix="bench-bytecode-")
+sys.path[:0] = [ROOT]
+
+import bytecode
+
+BOT = "import {imports}\n"
+
+
+def start_ms(path, runs):
+    env = dict(os.environ, PYTHONPATH=path, PYTHONDONTWRITEBYTECODE="1")
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "app.py"], cwd=path, env=env, check=True)
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="First start of a bot with and without precompiled bytecode")
+    parser.add_argument("--packages", default="requests,rich,pygments")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    packages = args.packages.split(",")
+    path = os.path.join(WORKDIR, "bot")
+    subprocess.run(
+        [sys.executable, "-m", "pip", "install", "--quiet", "--no-compile", "--target", path, *packages],
+        check=True
+    )
+    with open(os.path.join(path, "app.py"), "w") as f:
+        f.write(BOT.format(imports=", ".join(p.replace("-", "_") for p in packages)))
+
+    cold = start_ms(path, args.runs)
+    timings = {}
+    for workers in (1, bytecode.BYTECODE_WORKERS):
+        subprocess.run(["find", path, "-name", "__pycache__", "-prune", "-exec", "rm", "-rf", "{}", ";"], check=True)
+        started = time.perf_counter()
+        compiled, _, errors = bytecode.compile_tree(path, workers)
+        timings[workers] = time.perf_counter() - started
+    started = time.perf_counter()
+    _, skipped, _ = bytecode.compile_tree(path)
+    again = time.perf_counter() - started
+    warm = start_ms(path, args.runs)
+
+    with open(os.path.join(path, "broken.py"), "w") as f:
+        f.write("def f(:\n    pass\n")
+    _, _, broken = bytecode.compile_tree(path)
+
+    print(f"{compiled} files compiled, {len(errors)} vendored files with errors")
+    for workers, seconds in timings.items():
+        print(f"compile with {workers} worker(s): {seconds:.2f}s")
+    print(f"recompile, nothing changed: {again * 1000:.0f}ms ({skipped} skipped)")
+    print(f"start without bytecode (read-only dir) p50 {cold:.0f}ms, precompiled p50 {warm:.0f}ms")
+    print(f"syntax error reported: {broken.get('broken.py')}")
+
+
+if __name__ == "__main__":
+    main()
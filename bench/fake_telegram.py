@@ -0,0 +1,324 @@
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import logging
+import time
+import urllib.parse
+
+from telegram.request import BaseRequest
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Manager", "username": "manager_bot"}
+
+
+def user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+
+def chat(user_id):
+    return {"id": user_id, "type": "private", "first_name": f"user{user_id}"}
+
+
+def callback_update(user_id, data, message_id=1, query_id=None):
+    return {
+        "callback_query": {
+            "id": query_id or f"{user_id}-{time.monotonic_ns()}",
+            "from": user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": chat(user_id),
+                "from": BOT_USER,
+                "text": "menu",
+            },
+        }
+    }
+
+
+def text_update(user_id, text, message_id=1):
+    return {
+        "message": {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": chat(user_id),
+            "from": user(user_id),
+            "text": text,
+        }
+    }
+
+
+def document_update(user_id, file_id, file_name, mime_type, size=0, message_id=1):
+    update = text_update(user_id, None, message_id)
+    del update["message"]["text"]
+    update["message"]["document"] = {
+        "file_id": file_id,
+        "file_unique_id": file_id,
+        "file_name": file_name,
+        "mime_type": mime_type,
+        "file_size": size,
+    }
+    return update
+
+
+class FakeTelegram:
+    def __init__(self):
+        self.updates = collections.deque()
+        self.calls = collections.Counter()
+        self.log = []
+        self.webhook = None
+        self.server = None
+        self.flood = {}
+        self.files = {}
+        self.messages = {}
+        self.latency = 0.0
+        self.tokens = {}
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1000)
+        self._new_updates = asyncio.Event()
+        self._listeners = []
+
+    def stamp(self, update):
+        return dict(update, update_id=next(self._update_ids))
+
+    def push_update(self, update):
+        update = self.stamp(update)
+        self.updates.append(update)
+        self._new_updates.set()
+        return update
+
+    def bot(self, token):
+        fake = self.tokens.get(token)
+        if fake is None:
+            fake = self.tokens[token] = FakeTelegram()
+            fake.latency = self.latency
+        return fake
+
+    def add_file(self, file_id, data):
+        self.files[file_id] = data
+
+    def listen(self, callback):
+        self._listeners.append(callback)
+
+    def inject_flood(self, method, every, retry_after=1):
+        self.flood[method] = {"every": every, "retry_after": retry_after, "count": 0}
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self._serve, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._new_updates.set()
+        for fake in self.tokens.values():
+            fake._new_updates.set()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = b""
+                if "content-length" in headers:
+                    body = await reader.readexactly(int(headers["content-length"]))
+                status, payload = await self._dispatch(path, headers, body)
+                data = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def _params(self, headers, body):
+        kind = headers.get("content-type", "")
+        if kind.startswith("application/json"):
+            return json.loads(body or b"{}")
+        params = {}
+        for name, value in urllib.parse.parse_qsl(body.decode("utf-8")):
+            try:
+                params[name] = json.loads(value)
+            except ValueError:
+                params[name] = value
+        return params
+
+    async def _dispatch(self, path, headers, body):
+        if "/file/bot" in path:
+            data = self.files.get(path.rsplit("/", 1)[-1])
+            return (200, data) if data is not None else (404, {"ok": False})
+        token, _, method = path.strip("/").rpartition("/")
+        target = self.tokens.get(token.rsplit("/", 1)[-1][3:], self)
+        return await target.call(method, self._params(headers, body))
+
+    async def call(self, method, params):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.calls[method] += 1
+        self.log.append((time.monotonic(), method, params))
+        for callback in self._listeners:
+            callback(method, params)
+
+        flood = self.flood.get(method)
+        if flood:
+            flood["count"] += 1
+            if flood["count"] % flood["every"] == 0:
+                return 429, {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {flood['retry_after']}",
+                    "parameters": {"retry_after": flood["retry_after"]},
+                }
+
+        if method == "getUpdates":
+            return 200, {"ok": True, "result": await self._get_updates(params)}
+        if method in ("editMessageText", "editMessageReplyMarkup") and self._not_modified(method, params):
+            self.calls["not_modified"] += 1
+            return 400, {
+                "ok": False,
+                "error_code": 400,
+                "description": "Bad Request: message is not modified: specified new message content "
+                               "and reply markup are exactly the same as a current content and reply markup of the message",
+            }
+        return 200, {"ok": True, "result": self._result(method, params)}
+
+    async def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        while self.updates and self.updates[0]["update_id"] < offset:
+            self.updates.popleft()
+        if not self.updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                return []
+            if not self.updates:
+                return []
+        limit = int(params.get("limit") or 100)
+        return list(itertools.islice(self.updates, limit))
+
+    def _not_modified(self, method, params):
+        key = (int(params.get("chat_id") or 0), int(params.get("message_id") or 0))
+        current = self.messages.get(key)
+        if method == "editMessageText":
+            new = (params.get("text", ""), params.get("reply_markup"))
+        else:
+            new = (current[0] if current else None, params.get("reply_markup"))
+        self.messages[key] = new
+        return current == new
+
+    def _result(self, method, params):
+        if method == "getMe":
+            return dict(BOT_USER, can_join_groups=True, can_read_all_group_messages=False, supports_inline_queries=False)
+        if method == "setWebhook":
+            self.webhook = params.get("url")
+            return True
+        if method == "deleteWebhook":
+            self.webhook = None
+            return True
+        if method == "getWebhookInfo":
+            return {"url": self.webhook or "", "has_custom_certificate": False, "pending_update_count": len(self.updates)}
+        if method in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+            chat_id = int(params.get("chat_id") or 0)
+            message_id = params.get("message_id") or next(self._message_ids)
+            if method == "sendMessage":
+                self.messages[(chat_id, int(message_id))] = (params.get("text", ""), params.get("reply_markup"))
+            return {
+                "message_id": int(message_id),
+                "date": int(time.time()),
+                "chat": chat(chat_id),
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+        if method == "getFile":
+            file_id = params.get("file_id")
+            return {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_size": len(self.files.get(file_id, b"")),
+                "file_path": file_id,
+            }
+        return True
+
+
+class FakeRequest(BaseRequest):
+    def __init__(self, fake):
+        self.fake = fake
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        if "/file/bot" in url:
+            data = self.fake.files.get(url.rsplit("/", 1)[-1])
+            return (200, data) if data is not None else (404, b"")
+        params = {}
+        if request_data:
+            for name, value in request_data.json_parameters.items():
+                try:
+                    params[name] = json.loads(value)
+                except ValueError:
+                    params[name] = value
+        status, payload = await self.fake.call(url.rstrip("/").rsplit("/", 1)[-1], params)
+        return status, json.dumps(payload).encode("utf-8")
+
+
+async def post_update(url, update, secret=None):
+    parts = urllib.parse.urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    data = json.dumps(update).encode("utf-8")
+    headers = (
+        f"POST {parts.path or '/'} HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\nConnection: close\r\n"
+    )
+    if secret:
+        headers += f"X-Telegram-Bot-Api-Secret-Token: {secret}\r\n"
+    writer.write(headers.encode("latin-1") + b"\r\n" + data)
+    await writer.drain()
+    status_line = await reader.readline()
+    writer.close()
+    return int(status_line.split()[1])
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API for local testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+
+    fake = FakeTelegram()
+    fake.listen(lambda method, params: print(method, json.dumps(params, ensure_ascii=False)[:200]))
+    port = await fake.start(args.host, args.port)
+    print(f"Fake Bot API on http://{args.host}:{port} (TELEGRAM_API_URL)")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+WORKDIR = tempfile.mkdtemp(prefix="bench-fleet-")
+
+os.environ.update(
+    REGISTRY=os.path.join(WORKDIR, "processes.db"),
+    DB=os.path.join(WORKDIR, "processes.json"),
+    STOP_TIMEOUT="2",
+)
+sys.path[:0] = [ROOT]
+
+BOT = """import asyncio, json, http.client, urllib.request, email.parser, logging, decimal
+import time
+time.sleep(3600)
+"""
+
+STUBBORN = """import signal, time
+signal.signal(signal.SIGTERM, signal.SIG_IGN)
+time.sleep(3600)
+"""
+
+
+def runnable():
+    count = 0
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "r") as f:
+                if f.read().rsplit(")", 1)[1].split()[0] == "R":
+                    count += 1
+        except (OSError, IndexError):
+            pass
+    return count
+
+
+async def sample(peak, stop):
+    while not stop.is_set():
+        peak.append(runnable())
+        await asyncio.sleep(0.05)
+
+
+async def restore(args, concurrency, settle):
+    import agent
+    import fleet
+    import registry
+    import supervisor
+
+    fleet.FLEET_CONCURRENCY = concurrency
+    paths = {}
+    for i in range(args.bots):
+        path = os.path.join(WORKDIR, "bots", "1", f"bot{i}")
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "app.py"), "w") as f:
+            f.write(BOT)
+        paths[f"bot{i}"] = path
+        registry.update("1", f"bot{i}", autostart=1)
+
+    peak = []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample(peak, stop))
+    started = time.perf_counter()
+    result = await fleet.each(
+        fleet.autostart_set(),
+        lambda user_id, bot_name: agent.start_bot(user_id, bot_name, paths[bot_name], settle),
+        concurrency
+    )
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler
+
+    started = time.perf_counter()
+    stopped = await fleet.each(
+        [(c.user_id, c.bot_name) for c in supervisor.children()], agent.stop_bot, fleet.FLEET_STOP_CONCURRENCY
+    )
+    stop_elapsed = time.perf_counter() - started
+    for bot_name in paths:
+        registry.update("1", bot_name, autostart=1)
+    return result.ok, elapsed, max(peak), stopped.ok, stop_elapsed
+
+
+async def graceful():
+    import supervisor
+    path = os.path.join(WORKDIR, "stubborn")
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "app.py"), "w") as f:
+        f.write(STUBBORN)
+    child = await supervisor.start("2", "stubborn", path)
+    await asyncio.sleep(0.5)
+    started = time.perf_counter()
+    await supervisor.stop("2", "stubborn")
+    return time.perf_counter() - started, child.alive
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Restore an autostart fleet with and without admission control")
+    parser.add_argument("--bots", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--zygote", action="store_true", help="fork bots from a preloaded zygote")
+    args = parser.parse_args()
+
+    async def run():
+        import zygote
+        if args.zygote:
+            zygote.SOCKET = os.path.join(WORKDIR, "zygote.sock")
+            zygote.ENABLED = True
+            await zygote.start([])
+        rows = [
+            ("unbounded", await restore(args, args.bots, False)),
+            (f"bounded {args.concurrency} + settle", await restore(args, args.concurrency, True)),
+        ]
+        stubborn = await graceful()
+        await zygote.stop()
+        return rows, stubborn
+
+    rows, (stop_seconds, alive) = asyncio.run(run())
+    print(f"{args.bots} bots on {os.cpu_count()} cpus{' (zygote)' if args.zygote else ''}")
+    print(f"{'mode':24} {'started':>8} {'seconds':>8} {'peak R':>7} {'stopped':>8} {'stop s':>7}")
+    for mode, (ok, elapsed, peak, stopped, stop_elapsed) in rows:
+        print(f"{mode:24} {ok:8d} {elapsed:8.2f} {peak:7d} {stopped:8d} {stop_elapsed:7.2f}")
+    print(f"bot ignoring SIGTERM stopped after {stop_seconds:.1f}s (STOP_TIMEOUT=2), alive={alive}")
+
+
+if __name__ == "__main__":
+    main()
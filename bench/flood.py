@@ -0,0 +1,110 @@
+import argparse
+import asyncio
+import collections
+import os
+import random
+import sys
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path[:0] = [ROOT, BENCH]
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import ApplicationBuilder
+
+import ratelimit
+from fake_telegram import FakeRequest, FakeTelegram
+
+
+def keyboard(job):
+    return InlineKeyboardMarkup([[InlineKeyboardButton("❌ إلغاء", callback_data=f"canceljob_{job}")]])
+
+
+async def edit(bot, chat_id, message_id, text, errors):
+    try:
+        with ratelimit.low_priority():
+            await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, reply_markup=keyboard(message_id))
+    except RetryAfter:
+        errors["429"] += 1
+    except TelegramError as e:
+        errors[type(e).__name__] += 1
+
+
+async def progress(bot, chat_id, message_id, steps, errors):
+    pending = []
+    for step in range(steps):
+        pending.append(asyncio.create_task(edit(bot, chat_id, message_id, f"⏳ تثبيت\n{step // 3}", errors)))
+        await asyncio.sleep(random.uniform(0, 0.1))
+    await asyncio.gather(*pending)
+
+
+async def taps(bot, chat_id, count, latencies, errors):
+    for i in range(count):
+        start = time.perf_counter()
+        try:
+            await bot.answer_callback_query(f"{chat_id}-{i}")
+            await bot.edit_message_text(f"🏠 القائمة {i}", chat_id=chat_id, message_id=1)
+        except RetryAfter:
+            errors["429"] += 1
+        except TelegramError as e:
+            errors[type(e).__name__] += 1
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(1)
+
+
+async def run(args, limited):
+    fake = FakeTelegram()
+    fake.latency = args.api_latency / 1000
+    if args.flood_every:
+        fake.inject_flood("editMessageText", args.flood_every, args.retry_after)
+    builder = ApplicationBuilder().token("123456:FAKE").request(FakeRequest(fake)).get_updates_request(FakeRequest(fake))
+    limiter = ratelimit.Limiter() if limited else None
+    if limiter:
+        builder = builder.rate_limiter(limiter)
+    application = builder.build()
+    await application.initialize()
+
+    errors = collections.Counter()
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(progress(application.bot, 1000 + c, 500, args.steps, errors) for c in range(args.chats)),
+        *(taps(application.bot, 5000 + c, args.taps, latencies, errors) for c in range(args.chats)),
+    )
+    elapsed = time.perf_counter() - start
+    await application.shutdown()
+
+    edits = fake.calls["editMessageText"]
+    latencies.sort()
+    return {
+        "elapsed": elapsed,
+        "api_edits": edits,
+        "not_modified": fake.calls["not_modified"],
+        "errors": dict(errors),
+        "tap_p95_ms": latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0,
+        "stats": dict(limiter.stats) if limiter else {},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flood the fake Bot API with progress edits and taps")
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--steps", type=int, default=60, help="progress edits per chat")
+    parser.add_argument("--taps", type=int, default=10, help="interactive taps per chat")
+    parser.add_argument("--flood-every", type=int, default=40, help="answer every Nth editMessageText with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--api-latency", type=float, default=20.0, help="simulated Bot API latency in ms")
+    args = parser.parse_args()
+
+    for name, limited in (("direct", False), ("limiter", True)):
+        r = asyncio.run(run(args, limited))
+        print(
+            f"{name:8} {r['elapsed']:6.1f}s  edits sent {r['api_edits']:5d}  not-modified {r['not_modified']:4d}  "
+            f"tap p95 {r['tap_p95_ms']:7.1f}ms  errors {r['errors'] or '-'}  {r['stats'] or ''}"
+        )
+
+
+if __name__ == "__main__":
+    main()
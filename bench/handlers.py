@@ -0,0 +1,284 @@
+import argparse
+import asyncio
+import glob
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import zipfile
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+RESULTS = os.path.join(BENCH, "results")
+WORKDIR = tempfile.mkdtemp(prefix="bench-handlers-")
+
+FAKE_PIP = """#!/bin/sh
+i=0
+while [ $i -lt 5 ]; do
+    echo "Collecting $* ($i)"
+    sleep ${FAKE_PIP_SECONDS:-0.4}
+    i=$((i + 1))
+done
+"""
+
+os.makedirs(os.path.join(WORKDIR, "bin"))
+with open(os.path.join(WORKDIR, "bin", "pip"), "w") as f:
+    f.write(FAKE_PIP)
+os.chmod(os.path.join(WORKDIR, "bin", "pip"), 0o755)
+
+os.environ.update(
+    TELEGRAM_BOT_TOKEN="123456:FAKE",
+    BASE=os.path.join(WORKDIR, "user_bots"),
+    REGISTRY=os.path.join(WORKDIR, "processes.db"),
+    DB=os.path.join(WORKDIR, "processes.json"),
+    PKG_CACHE=os.path.join(WORKDIR, "pkg_cache"),
+    SHARED_STORE="0",
+    RATE_LIMIT="0",
+    METRICS_PORT="0",
+    PATH=os.path.join(WORKDIR, "bin") + os.pathsep + os.environ.get("PATH", ""),
+)
+os.chdir(WORKDIR)
+sys.path[:0] = [ROOT, BENCH]
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder
+
+import app as manager
+import jobs
+from fake_telegram import FakeRequest, FakeTelegram, callback_update, document_update
+
+
+class LoopMonitor:
+    def __init__(self, interval=0.005, threshold=0.01):
+        self.interval = interval
+        self.threshold = threshold
+        self.blocked = 0.0
+        self.max_lag = 0.0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            before = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - before - self.interval
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                self.blocked += lag
+
+    def __enter__(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def seed(users, bots, log_kb):
+    line = "2025-12-12 12:00:00 - bot - INFO - handled update\n"
+    log = line * max(1, log_kb * 1024 // len(line))
+    for u in range(users):
+        for b in range(bots):
+            path = manager.get_bot_path(str(1000 + u), f"bot{b}")
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, "app.py"), "w") as f:
+                f.write("print('hello')\n")
+            with open(os.path.join(path, "log.txt"), "w") as f:
+                f.write(log)
+
+
+def make_zip(files, size):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("app.py", "print('hello from zip')\n")
+        for i in range(files):
+            z.writestr(f"pkg/module_{i}.py", ("x = %d\n" % i) * (size // 8))
+    return buffer.getvalue()
+
+
+async def drive(application, fake, updates, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(data):
+        async with semaphore:
+            update = Update.de_json(fake.stamp(data), application.bot)
+            start = time.perf_counter()
+            await application.process_update(update)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(u) for u in updates))
+    return latencies, time.perf_counter() - start
+
+
+async def wait_jobs(timeout=600):
+    deadline = time.monotonic() + timeout
+    while jobs.pending() and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+
+
+def scenario_updates(name, args, fake):
+    users = range(1000, 1000 + args.users)
+    if name == "bots_menu":
+        return [callback_update(u, "bots_menu") for _ in range(args.repeat) for u in users]
+    if name == "bots_menu_large":
+        return [callback_update(999, "bots_menu") for _ in range(args.repeat * 10)]
+    if name == "files_large":
+        return [callback_update(999, f"files_page_{i % 50}") for i in range(args.repeat * 10)]
+    if name == "view_large":
+        return [callback_update(999, f"viewpage_{i % 50}") for i in range(args.repeat * 10)]
+    if name == "log":
+        return [callback_update(u, "log") for _ in range(args.repeat) for u in users]
+    if name == "status":
+        return [callback_update(u, "status") for _ in range(args.repeat) for u in users]
+    if name == "stop":
+        return [callback_update(u, "stop") for u in users]
+    if name == "bulk_stop":
+        return [callback_update(u, "bulk_stop") for u in users]
+    if name == "install":
+        return [callback_update(u, "lib_requests") for u in users]
+    if name == "zip":
+        fake.add_file("bench-zip", make_zip(args.zip_files, args.zip_file_size))
+        return [document_update(u, "bench-zip", "bot.zip", "application/zip") for u in users]
+    if name == "zip_again":
+        return [document_update(u, "bench-zip", "bot.zip", "application/zip", message_id=2) for u in users]
+    raise ValueError(name)
+
+
+SCENARIOS = ["bots_menu", "bots_menu_large", "files_large", "view_large", "log", "status", "stop", "bulk_stop", "install", "zip", "zip_again"]
+
+
+async def run(args):
+    fake = FakeTelegram()
+    fake.latency = args.api_latency / 1000
+    request = FakeRequest(fake)
+    builder = ApplicationBuilder().token("123456:FAKE").request(request).get_updates_request(FakeRequest(fake))
+    application = manager.build_application(builder)
+
+    seed(args.users, args.bots, args.log_kb)
+    seed_large = manager.get_bot_path("999", "")
+    for b in range(args.large_bots):
+        os.makedirs(os.path.join(seed_large, f"bot{b}"), exist_ok=True)
+    for i in range(args.large_files):
+        with open(os.path.join(seed_large, "bot0", f"module_{i}.py"), "w") as f:
+            f.write("value = %d\n" % i)
+    with open(os.path.join(seed_large, "bot0", "big.txt"), "w") as f:
+        f.write("سطر تجريبي\n" * (args.log_kb * 100))
+
+    await application.initialize()
+    await application.start()
+    await application.post_init(application)
+
+    await drive(application, fake, [callback_update(u, "select_bot0") for u in range(999, 1000 + args.users)], args.concurrency)
+    await drive(application, fake, [callback_update(999, "view_big.txt")], 1)
+
+    results = {}
+    for name in args.scenarios:
+        updates = scenario_updates(name, args, fake)
+        calls_before = sum(fake.calls.values())
+        with LoopMonitor() as monitor:
+            latencies, elapsed = await drive(application, fake, updates, args.concurrency)
+            await wait_jobs()
+            total = monitor.blocked
+        results[name] = {
+            "updates": len(updates),
+            "p50_ms": statistics.median(latencies),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "max_ms": max(latencies),
+            "throughput": len(updates) / elapsed,
+            "loop_blocked_ms": total * 1000,
+            "loop_max_lag_ms": monitor.max_lag * 1000,
+            "api_calls": sum(fake.calls.values()) - calls_before,
+        }
+
+    await application.stop()
+    await application.post_stop(application)
+    await application.shutdown()
+
+    actions = {
+        name: {"calls": calls, "mean_ms": seconds / calls * 1000}
+        for name, (calls, seconds) in sorted(manager.buttons.stats.items())
+    }
+    return results, actions, resolve_cost()
+
+
+def resolve_cost(rounds=20000):
+    samples = [
+        "bots_menu", "run", "status", "select_bot0", "files_page_3",
+        "view_module_1.py", "viewpage_2", "del_module_1.py", "canceljob_7", "lib_requests",
+    ]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for data in samples:
+            manager.buttons.resolve(data)
+    return (time.perf_counter() - start) / (rounds * len(samples)) * 1e9
+
+
+def report(results, previous):
+    header = f"{'scenario':16} {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'upd/s':>8} {'blocked':>9} {'maxlag':>8}"
+    print(header)
+    for name, r in results.items():
+        line = (
+            f"{name:16} {r['updates']:6d} {r['p50_ms']:8.2f} {r['p95_ms']:8.2f} {r['p99_ms']:8.2f} "
+            f"{r['throughput']:8.0f} {r['loop_blocked_ms']:9.1f} {r['loop_max_lag_ms']:8.1f}"
+        )
+        old = (previous or {}).get(name)
+        if old and old.get("p95_ms"):
+            change = (r["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100
+            line += f"   p95 {change:+.0f}%"
+        print(line)
+
+
+def latest_result():
+    files = sorted(glob.glob(os.path.join(RESULTS, "handlers-*.json")))
+    if not files:
+        return None
+    with open(files[-1], "r") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the manager handlers against a fake Bot API")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--bots", type=int, default=5, help="bots per user")
+    parser.add_argument("--large-bots", type=int, default=300, help="bots for the bots_menu_large user")
+    parser.add_argument("--large-files", type=int, default=3000, help="files in the bots_menu_large user's bot0")
+    parser.add_argument("--repeat", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--log-kb", type=int, default=2048)
+    parser.add_argument("--zip-files", type=int, default=200)
+    parser.add_argument("--zip-file-size", type=int, default=4096)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="simulated Bot API latency in ms")
+    parser.add_argument("--scenarios", nargs="+", default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    previous = latest_result()
+    results, actions, resolve_ns = asyncio.run(run(args))
+    report(results, previous and previous.get("results"))
+    print(f"\n{'action':16} {'calls':>6} {'mean ms':>8}")
+    for name, a in actions.items():
+        print(f"{name:16} {a['calls']:6d} {a['mean_ms']:8.3f}")
+    print(f"\nroute resolve: {resolve_ns:.0f} ns/callback")
+
+    if not args.no_save:
+        os.makedirs(RESULTS, exist_ok=True)
+        path = os.path.join(RESULTS, time.strftime("handlers-%Y%m%d-%H%M%S.json"))
+        with open(path, "w") as f:
+            json.dump({"args": vars(args), "results": results, "actions": actions, "resolve_ns": resolve_ns}, f, indent=4)
+        print(f"\nsaved {os.path.relpath(path, ROOT)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+WORKDIR = tempfile.mkdtemp(prefix="bench-hibernate-")
+
+os.environ.update(
+    REGISTRY=os.path.join(WORKDIR, "processes.db"),
+    DB=os.path.join(WORKDIR, "processes.json"),
+    IDLE_AFTER="2",
+    HIBERNATE_INTERVAL="1",
+    HIBERNATE_WAKE_POLL="0.5",
+    LIMITS_FILE=os.path.join(WORKDIR, "limits.json"),
+)
+sys.path[:0] = [ROOT, BENCH]
+
+from fake_telegram import FakeTelegram, text_update
+
+BOT = """import json, urllib.parse, urllib.request
+TOKEN = "{token}"
+API = "{api}/bot" + TOKEN
+offset = 0
+while True:
+    body = urllib.parse.urlencode({{"offset": offset, "timeout": 5}}).encode()
+    try:
+        with urllib.request.urlopen(API + "/getUpdates", body, timeout=15) as r:
+            updates = json.load(r)["result"]
+    except OSError:
+        continue
+    for update in updates:
+        offset = update["update_id"] + 1
+        with open("handled", "a") as f:
+            f.write(str(update["update_id"]) + "\\n")
+"""
+
+
+def token(i):
+    return f"{100000 + i}:{'A' * 30}{i:05d}"
+
+
+def usage(children):
+    import procfs
+    cpu = 0.0
+    rss = 0
+    for child in children:
+        stat = procfs.read_stat(child.pid) if child.pid else None
+        if stat:
+            cpu += procfs.cpu_seconds(stat)
+            rss += stat["rss"]
+    return cpu, rss
+
+
+async def cpu_over(children, seconds):
+    before = usage(children)[0]
+    await asyncio.sleep(seconds)
+    cpu, rss = usage(children)
+    return (cpu - before) / seconds * 100, rss
+
+
+async def deliver(fake, path):
+    handled = os.path.join(path, "handled")
+    count = len(open(handled).read().split()) if os.path.exists(handled) else 0
+    start = time.perf_counter()
+    fake.push_update(text_update(1, "/start"))
+    while not os.path.exists(handled) or len(open(handled).read().split()) == count:
+        await asyncio.sleep(0.005)
+    return (time.perf_counter() - start) * 1000
+
+
+async def run(args):
+    fake = FakeTelegram()
+    port = await fake.start()
+    api = f"http://127.0.0.1:{port}"
+    os.environ["TELEGRAM_API_URL"] = api
+
+    import hibernate
+    import supervisor
+    hibernate.MODE = args.mode
+
+    with open(os.environ["LIMITS_FILE"], "w") as f:
+        json.dump({"bots": {f"1/bot{i}": {"hibernate_token": token(i)} for i in range(args.bots)}}, f)
+
+    children = []
+    paths = []
+    for i in range(args.bots):
+        path = os.path.join(WORKDIR, args.mode, f"bot{i}")
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "app.py"), "w") as f:
+            f.write(BOT.format(token=token(i), api=api))
+        paths.append(path)
+        fake.bot(token(i))
+        children.append(await supervisor.start("1", f"bot{i}", path))
+    await asyncio.sleep(1)
+
+    awake_latency = [await deliver(fake.bot(token(i)), paths[i]) for i in range(args.bots)]
+    awake_cpu, awake_rss = await cpu_over(children, args.window)
+
+    monitor = asyncio.create_task(hibernate.monitor())
+    deadline = time.monotonic() + 30
+    while len(supervisor.hibernating()) < args.bots and time.monotonic() < deadline:
+        await asyncio.sleep(0.2)
+    asleep = len(supervisor.hibernating())
+    asleep_cpu, asleep_rss = await cpu_over(children, args.window)
+
+    wake_latency = [await deliver(fake.bot(token(i)), paths[i]) for i in range(args.bots)]
+
+    monitor.cancel()
+    for i in range(args.bots):
+        await supervisor.stop("1", f"bot{i}")
+    await fake.stop()
+    return {
+        "asleep": asleep,
+        "awake": (statistics.median(awake_latency), awake_cpu, awake_rss),
+        "hibernated": (statistics.median(wake_latency), asleep_cpu, asleep_rss),
+        "wake_max": max(wake_latency),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Idle CPU/RSS and first-message latency with hibernation")
+    parser.add_argument("--bots", type=int, default=10)
+    parser.add_argument("--mode", choices=["freeze", "stop"], default="freeze")
+    parser.add_argument("--window", type=float, default=5.0, help="seconds to sample CPU in each phase")
+    args = parser.parse_args()
+
+    r = asyncio.run(run(args))
+    print(f"mode {args.mode}: {r['asleep']}/{args.bots} bots hibernated, slowest wake {r['wake_max']:.0f}ms")
+    print(f"{'phase':10} {'p50 reply ms':>13} {'cpu %':>7} {'rss MB':>8}")
+    for phase in ("awake", "hibernated"):
+        latency, cpu, rss = r[phase]
+        print(f"{phase:10} {latency:13.1f} {cpu:7.2f} {rss / 1024 / 1024:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
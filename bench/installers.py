@@ -0,0 +1,55 @@
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+WORKDIR = tempfile.mkdtemp(prefix="bench-installers-")
+
+os.environ.update(PKG_CACHE=os.path.join(WORKDIR, "cache"))
+sys.path[:0] = [ROOT]
+
+import installer
+import jobs
+
+REQUIREMENTS = "requests\nattrs\nsix\nidna\n"
+
+
+async def timed_install(name, bot_path):
+    job = jobs.Job(0, name, name, None)
+    started = time.perf_counter()
+    ok = await installer.BACKENDS[name](job, bot_path, requirements=os.path.join(bot_path, "requirements.txt"))
+    if not ok:
+        print(job.tail(), file=sys.stderr)
+    return time.perf_counter() - started, ok
+
+
+async def run(name):
+    times = []
+    for phase in ("cold", "warm"):
+        bot_path = os.path.join(WORKDIR, name, phase)
+        os.makedirs(bot_path)
+        with open(os.path.join(bot_path, "requirements.txt"), "w") as f:
+            f.write(REQUIREMENTS)
+        times.append(await timed_install(name, bot_path))
+    times.append(await timed_install(name, bot_path))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Install the same requirements with each installer backend")
+    parser.add_argument("--backends", default="pip,store,uv")
+    args = parser.parse_args()
+
+    print(f"{'backend':8} {'cold s':>8} {'warm s':>8} {'again s':>8}")
+    for name in args.backends.split(","):
+        results = asyncio.run(run(name))
+        cells = " ".join(f"{seconds:8.2f}" if ok else f"{'fail':>8}" for seconds, ok in results)
+        print(f"{name:8} {cells}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+WORKDIR = tempfile.mkdtemp(prefix="bench-sessions-")
+
+os.environ.update(
+    TELEGRAM_BOT_TOKEN="123456:FAKE",
+    BASE=os.path.join(WORKDIR, "user_bots"),
+    REGISTRY=os.path.join(WORKDIR, "processes.db"),
+    DB=os.path.join(WORKDIR, "processes.json"),
+    SESSIONS=os.path.join(WORKDIR, "sessions.db"),
+    SHARED_STORE="0",
+    RATE_LIMIT="0",
+    METRICS_PORT="0",
+)
+os.chdir(WORKDIR)
+sys.path[:0] = [ROOT, BENCH]
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder
+
+import app as manager
+import sessions
+from fake_telegram import FakeRequest, FakeTelegram, callback_update
+
+
+async def boot(fake, args):
+    builder = ApplicationBuilder().token("123456:FAKE").request(FakeRequest(fake)).get_updates_request(FakeRequest(fake))
+    application = manager.build_application(builder)
+    start = time.perf_counter()
+    await application.initialize()
+    await application.start()
+    return application, (time.perf_counter() - start) * 1000
+
+
+async def halt(application):
+    await application.stop()
+    await application.shutdown()
+
+
+async def drive(application, fake, updates):
+    start = time.perf_counter()
+    for data in updates:
+        await application.process_update(Update.de_json(fake.stamp(data), application.bot))
+    return time.perf_counter() - start
+
+
+async def run(args):
+    sessions.SESSION_FLUSH_INTERVAL = args.interval
+    sessions.SESSION_CACHE_USERS = args.cache_users
+    fake = FakeTelegram()
+    users = range(1000, 1000 + args.users)
+    for u in users:
+        os.makedirs(manager.get_bot_path(str(u), "bot0"), exist_ok=True)
+
+    application, _ = await boot(fake, args)
+    persistence = application.persistence
+    elapsed = await drive(application, fake, [callback_update(u, "select_bot0") for u in users])
+    for _ in range(args.repeat):
+        await asyncio.sleep(args.pause)
+        elapsed += await drive(application, fake, [callback_update(u, "bots_menu") for u in users])
+    writes = persistence.writes
+    await asyncio.sleep(args.pause)
+    resident = sum(1 for data in application.user_data.values() if data)
+    await halt(application)
+    total = args.users * (args.repeat + 1)
+    print(f"{total} تحديث في {elapsed:.2f}s، كتابات القرص أثناء التشغيل {writes}، بعد الإيقاف {persistence.writes}، تحميل {persistence.loads} من القرص، في الذاكرة {resident}")
+
+    application, startup = await boot(fake, args)
+    persistence = application.persistence
+    await drive(application, fake, [callback_update(u, "bots_menu") for u in users])
+    restored = sum(1 for u in users if application.user_data[u].get("current_bot") == "bot0")
+    resident = sum(1 for data in application.user_data.values() if data)
+    print(f"إعادة التشغيل: {startup:.1f}ms، استعادة {restored}/{args.users} مستخدم، تحميل {persistence.loads} من القرص، في الذاكرة {resident}")
+    await halt(application)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check session state survives restarts without per-update writes")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--interval", type=float, default=30)
+    parser.add_argument("--pause", type=float, default=0, help="idle seconds between rounds")
+    parser.add_argument("--cache-users", type=int, default=10000)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
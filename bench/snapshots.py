@@ -0,0 +1,96 @@
+import argparse
+import filecmp
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+WORKDIR = tempfile.mkdtemp(prefix="bench-snapshots-")
+
+os.environ.update(
+    SNAPSHOTS=os.path.join(WORKDIR, "snapshots"),
+    REGISTRY=os.path.join(WORKDIR, "processes.db"),
+    DB=os.path.join(WORKDIR, "processes.json"),
+)
+sys.path[:0] = [ROOT]
+
+import clone
+import snapshots
+
+
+def du(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.lstat(os.path.join(root, name)).st_size
+    return total
+
+
+def make_bot(path, packages):
+    os.makedirs(path)
+    for name in packages:
+        module = __import__(name)
+        src = os.path.dirname(module.__file__)
+        shutil.copytree(src, os.path.join(path, name), ignore=shutil.ignore_patterns("__pycache__"))
+    for root, _, files in os.walk(path):
+        for name in files:
+            p = os.path.join(root, name)
+            os.chmod(p, os.stat(p).st_mode & ~clone.WRITABLE)
+    with open(os.path.join(path, "app.py"), "w") as f:
+        f.write("print('hello')\n")
+    with open(os.path.join(path, "data.json"), "w") as f:
+        f.write('{"users": []}\n' * 1000)
+
+
+def same(a, b):
+    compare = filecmp.dircmp(a, b)
+    if compare.left_only or compare.right_only or compare.diff_files or compare.funny_files:
+        return False
+    return all(same(os.path.join(a, d), os.path.join(b, d)) for d in compare.common_dirs)
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"{label:28} {(time.perf_counter() - start) * 1000:9.1f} ms  {result if result is not None else ''}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time bot cloning and deduplicated snapshots")
+    parser.add_argument("--packages", default="telegram,httpx,httpcore,anyio,idna,certifi")
+    args = parser.parse_args()
+
+    bot = os.path.join(WORKDIR, "user", "bot")
+    make_bot(bot, args.packages.split(","))
+    size = du(bot)
+    print(f"bot: {size / 1024 / 1024:.1f}MB, codec {snapshots.CODEC}\n")
+
+    timed("copytree", lambda: shutil.copytree(bot, os.path.join(WORKDIR, "user", "copy")) and None)
+    timed("clone.tree", clone.tree, bot, os.path.join(WORKDIR, "user", "clone"))
+    with open(os.path.join(WORKDIR, "user", "clone", "app.py"), "a") as f:
+        f.write("print('clone')\n")
+    print(f"{'clone isolated':28} {open(os.path.join(bot, 'app.py')).read().count('clone') == 0}\n")
+
+    timed("snapshot cold", lambda: str(snapshots.create("1", "bot", bot)[1]))
+    timed("snapshot unchanged", lambda: str(snapshots.create("1", "bot", bot)[1]))
+    os.chmod(os.path.join(bot, "app.py"), stat.S_IRUSR | stat.S_IWUSR)
+    with open(os.path.join(bot, "app.py"), "a") as f:
+        f.write("print('v2')\n")
+    timed("snapshot after edit", lambda: str(snapshots.create("1", "bot", bot)[1]))
+    timed("snapshot other bot", lambda: str(snapshots.create("2", "clone", os.path.join(WORKDIR, "user", "clone"))[1]))
+    stored = du(os.path.join(WORKDIR, "snapshots"))
+    print(f"\n4 snapshots of {4 * size / 1024 / 1024:.1f}MB stored in {stored / 1024 / 1024:.1f}MB\n")
+
+    restored = os.path.join(WORKDIR, "restored")
+    timed("restore", snapshots.restore, "1", "bot", snapshots.names("1", "bot")[-1], restored)
+    print(f"{'restored identical':28} {same(bot, restored)}")
+    timed("collect", snapshots.collect, lambda user_id, bot_name: True)
+
+
+if __name__ == "__main__":
+    main()
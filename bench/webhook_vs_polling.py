@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_telegram import FakeTelegram, callback_update, post_update
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = "123456:FAKE"
+SECRET = "bench-secret"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_for(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        await asyncio.sleep(0.02)
+
+
+async def run_mode(mode, updates, users, concurrency):
+    fake = FakeTelegram()
+    api_port = await fake.start()
+    hook_port = free_port()
+    workdir = tempfile.mkdtemp(prefix=f"bench-{mode}-")
+
+    answered = {}
+    fake.listen(lambda method, params: answered.setdefault(params.get("callback_query_id"), time.monotonic())
+                if method == "answerCallbackQuery" else None)
+
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN=TOKEN,
+        TELEGRAM_API_URL=f"http://127.0.0.1:{api_port}",
+        MODE=mode,
+        BASE=os.path.join(workdir, "user_bots"),
+        REGISTRY=os.path.join(workdir, "processes.db"),
+        DB=os.path.join(workdir, "processes.json"),
+        PKG_CACHE=os.path.join(workdir, "pkg_cache"),
+        WEBHOOK_URL=f"http://127.0.0.1:{hook_port}",
+        WEBHOOK_LISTEN="127.0.0.1",
+        WEBHOOK_PORT=str(hook_port),
+        WEBHOOK_PATH="hook",
+        WEBHOOK_SECRET=SECRET,
+    )
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, "app.py"),
+        cwd=workdir, env=env,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+    )
+    try:
+        if mode == "webhook":
+            await wait_for(lambda: fake.webhook is not None, 30)
+        else:
+            await wait_for(lambda: fake.calls["getUpdates"] > 0, 30)
+        await asyncio.sleep(0.5)
+
+        batch = [callback_update(1000 + i % users, "bots_menu", query_id=f"q{i}") for i in range(updates)]
+        sent = {}
+        start = time.monotonic()
+        if mode == "webhook":
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def send(update):
+                async with semaphore:
+                    sent[update["callback_query"]["id"]] = time.monotonic()
+                    await post_update(f"http://127.0.0.1:{hook_port}/hook", fake.stamp(update), SECRET)
+
+            await asyncio.gather(*(send(u) for u in batch))
+        else:
+            for update in batch:
+                sent[update["callback_query"]["id"]] = time.monotonic()
+                fake.push_update(update)
+
+        await wait_for(lambda: len(answered) >= updates, 120)
+        elapsed = time.monotonic() - start
+        latencies = sorted((answered[q] - sent[q]) * 1000 for q in sent)
+        return {
+            "mode": mode,
+            "updates": updates,
+            "seconds": elapsed,
+            "throughput": updates / elapsed,
+            "p50_ms": statistics.median(latencies),
+            "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+            "api_calls": sum(fake.calls.values()),
+        }
+    finally:
+        if proc.returncode is None:
+            proc.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(proc.wait(), 10)
+            except asyncio.TimeoutError:
+                proc.kill()
+        await fake.stop()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare polling and webhook throughput against a fake Bot API")
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    for mode in ("polling", "webhook"):
+        r = await run_mode(mode, args.updates, args.users, args.concurrency)
+        print(
+            f"{r['mode']:8} {r['updates']} updates in {r['seconds']:.2f}s "
+            f"({r['throughput']:.0f}/s)  p50 {r['p50_ms']:.1f}ms  p95 {r['p95_ms']:.1f}ms  "
+            f"api calls {r['api_calls']}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
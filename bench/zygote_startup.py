@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+WORKDIR = tempfile.mkdtemp(prefix="bench-zygote-")
+
+os.environ.update(
+    REGISTRY=os.path.join(WORKDIR, "processes.db"),
+    DB=os.path.join(WORKDIR, "processes.json"),
+    ZYGOTE_SOCKET=os.path.join(WORKDIR, "zygote.sock"),
+)
+sys.path[:0] = [ROOT]
+
+import supervisor
+import zygote
+from app import COMMON_LIBS
+
+BOT = """import os
+{imports}
+with open("ready", "w") as f:
+    f.write(str(os.getpid()))
+import time
+time.sleep(3600)
+"""
+
+
+def rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(fields["Rss"].split()[0]), int(fields["Pss"].split()[0])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+
+async def launch(n, imports):
+    paths = []
+    for i in range(n):
+        path = os.path.join(WORKDIR, "bots", f"bot{i}")
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "app.py"), "w") as f:
+            f.write(BOT.format(imports="\n".join(f"import {m}" for m in imports)))
+        if os.path.exists(os.path.join(path, "ready")):
+            os.remove(os.path.join(path, "ready"))
+        paths.append(path)
+
+    latencies = []
+    children = []
+    for i, path in enumerate(paths):
+        start = time.perf_counter()
+        children.append(await supervisor.start("1", f"bot{i}", path))
+        while not os.path.exists(os.path.join(path, "ready")):
+            await asyncio.sleep(0.001)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    memory = [rss_kb(child.pid) for child in children]
+    for i in range(n):
+        await supervisor.stop("1", f"bot{i}")
+    return latencies, memory
+
+
+async def run(args):
+    modules = zygote.preload_names(COMMON_LIBS)
+    available = []
+    for name in modules:
+        try:
+            __import__(name)
+            available.append(name)
+        except ImportError:
+            pass
+
+    results = {}
+    results["cold"] = await launch(args.bots, available)
+    await zygote.start(COMMON_LIBS)
+    results["zygote"] = await launch(args.bots, available)
+    await zygote.stop()
+    return available, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare cold python3 launches with zygote forks")
+    parser.add_argument("--bots", type=int, default=20)
+    args = parser.parse_args()
+
+    available, results = asyncio.run(run(args))
+    print(f"preloaded modules: {', '.join(available) or '-'}")
+    print(f"{'mode':8} {'p50 ms':>8} {'max ms':>8} {'rss MB':>8} {'pss MB':>8}")
+    for mode, (latencies, memory) in results.items():
+        rss = sum(m[0] for m in memory) / 1024
+        pss = sum(m[1] for m in memory) / 1024
+        print(f"{mode:8} {statistics.median(latencies):8.1f} {max(latencies):8.1f} {rss:8.1f} {pss:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
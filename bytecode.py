@@ -0,0 +1,63 @@
+import concurrent.futures
+import importlib.util
+import logging
+import os
+import py_compile
+
+logger = logging.getLogger(__name__)
+
+BYTECODE_WORKERS = int(os.environ.get("BYTECODE_WORKERS", str(os.cpu_count() or 1)))
+POOL_THRESHOLD = 64
+SKIP_DIRS = {"__pycache__", ".manager", ".git"}
+
+
+def _fresh(path):
+    try:
+        st = os.stat(path)
+        with open(importlib.util.cache_from_source(path), "rb") as f:
+            header = f.read(16)
+    except (OSError, ValueError):
+        return False
+    return (
+        len(header) == 16
+        and header[:4] == importlib.util.MAGIC_NUMBER
+        and int.from_bytes(header[4:8], "little") == 0
+        and int.from_bytes(header[8:12], "little") == int(st.st_mtime) & 0xFFFFFFFF
+        and int.from_bytes(header[12:16], "little") == st.st_size & 0xFFFFFFFF
+    )
+
+
+def _compile(path):
+    try:
+        py_compile.compile(path, doraise=True)
+    except py_compile.PyCompileError as e:
+        error = e.exc_value
+        if isinstance(error, SyntaxError):
+            return f"{error.lineno}: {error.msg}"
+        return str(error)
+    except OSError as e:
+        return str(e)
+    return None
+
+
+def sources(path):
+    for root, dirs, names in os.walk(path):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for name in names:
+            if name.endswith(".py"):
+                yield os.path.join(root, name)
+
+
+def compile_tree(path, workers=BYTECODE_WORKERS):
+    found = list(sources(path))
+    stale = [p for p in found if not _fresh(p)]
+    if len(stale) > POOL_THRESHOLD and workers > 1:
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(_compile, stale, chunksize=32))
+    else:
+        results = [_compile(p) for p in stale]
+    errors = {os.path.relpath(p, path): error for p, error in zip(stale, results) if error}
+    logger.info(
+        "ترجمة %s: %d ملف، %d بدون تغيير، %d خطأ", path, len(stale) - len(errors), len(found) - len(stale), len(errors)
+    )
+    return len(stale) - len(errors), len(found) - len(stale), errors
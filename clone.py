@@ -0,0 +1,65 @@
+import collections
+import errno
+import fcntl
+import logging
+import os
+import shutil
+import stat
+
+logger = logging.getLogger(__name__)
+
+FICLONE = 0x40049409
+WRITABLE = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+
+_no_reflink = set()
+
+
+def _reflink(src, dst):
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+def copy(src, dst, st=None):
+    st = st or os.stat(src)
+    if st.st_dev not in _no_reflink:
+        try:
+            _reflink(src, dst)
+            shutil.copystat(src, dst)
+            return "reflink"
+        except OSError as e:
+            if e.errno in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS):
+                _no_reflink.add(st.st_dev)
+            if os.path.lexists(dst):
+                os.remove(dst)
+    if not st.st_mode & WRITABLE:
+        try:
+            os.link(src, dst)
+            return "link"
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def tree(src, dst, ignore=None):
+    counts = collections.Counter()
+    for root, dirs, files in os.walk(src):
+        rel = os.path.relpath(root, src)
+        target = os.path.join(dst, rel) if rel != "." else dst
+        os.makedirs(target, exist_ok=True)
+        shutil.copymode(root, target)
+        skipped = ignore(root, dirs + files) if ignore else set()
+        dirs[:] = [d for d in dirs if d not in skipped]
+        for name in list(dirs) + files:
+            if name in skipped:
+                continue
+            source = os.path.join(root, name)
+            st = os.lstat(source)
+            if stat.S_ISLNK(st.st_mode):
+                os.symlink(os.readlink(source), os.path.join(target, name))
+                counts["symlink"] += 1
+                if name in dirs:
+                    dirs.remove(name)
+            elif stat.S_ISREG(st.st_mode):
+                counts[copy(source, os.path.join(target, name), st)] += 1
+    return counts
@@ -0,0 +1,358 @@
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import os
+import tempfile
+
+import agent
+import limits
+import registry
+import rpc
+import supervisor
+from unpack import STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+AGENTS = os.environ.get("AGENTS", "")
+AGENT_TOKEN = os.environ.get("AGENT_TOKEN", "")
+BOT_WEIGHT = float(os.environ.get("AGENT_BOT_WEIGHT", "50"))
+SYNC_TIMEOUT = float(os.environ.get("AGENT_SYNC_TIMEOUT", "300"))
+INFO_TIMEOUT = float(os.environ.get("AGENT_INFO_TIMEOUT", "5"))
+ENABLED = bool(AGENTS.strip())
+SYNC_STATE = "synced.json"
+
+UNREACHABLE = "unreachable"
+ACTIVE = (supervisor.RUNNING, supervisor.RESTARTING, supervisor.HIBERNATED)
+
+agents = {}
+listeners = []
+limit_listeners = []
+_states = {}
+
+
+def configured(spec=AGENTS):
+    result = {}
+    for item in spec.split(","):
+        name, sep, address = item.strip().partition("=")
+        if sep and name and address:
+            result[name] = address
+        elif item.strip():
+            logger.warning("تعريف عامل غير صالح في AGENTS: %r", item)
+    return result
+
+
+def _on_event(name, event):
+    if event.get("event") == "bot":
+        _states[(event["user_id"], event["bot_name"])] = event["state"]
+        for listener in listeners:
+            asyncio.ensure_future(listener(event["user_id"], event["bot_name"], event["state"], event.get("code")))
+    elif event.get("event") == "limit":
+        for listener in limit_listeners:
+            listener(event["user_id"], event["bot_name"], event["resource"], event["action"])
+
+
+def setup(spec=AGENTS):
+    for name, address in configured(spec).items():
+        agents[name] = rpc.Client(name, address, AGENT_TOKEN, _on_event)
+
+
+async def loads():
+    names = list(agents)
+    results = await asyncio.gather(
+        *(agents[name].call("info", timeout=INFO_TIMEOUT) for name in names), return_exceptions=True
+    )
+    infos = {}
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            logger.warning("العامل %s غير متاح: %s", name, result)
+        else:
+            infos[name] = result
+    return infos
+
+
+async def connect():
+    infos = await loads()
+    logger.info("العمال المتصلون: %s", ", ".join(f"{n} ({i['running']} بوت)" for n, i in infos.items()) or "-")
+    return infos
+
+
+def score(info):
+    cpu = info["load"] / max(info["cpus"], 1)
+    memory = 1 - info["mem_available"] / info["mem_total"] if info["mem_total"] else 0
+    return cpu + memory + info["running"] / BOT_WEIGHT
+
+
+async def place(exclude=()):
+    infos = {name: info for name, info in (await loads()).items() if name not in exclude}
+    if not infos:
+        raise rpc.Unavailable("no agent available")
+    return min(infos, key=lambda name: score(infos[name]))
+
+
+def owner(user_id, bot_name):
+    return (registry.get(user_id, bot_name) or {}).get("agent")
+
+
+async def _client(user_id, bot_name, assign=False):
+    name = owner(user_id, bot_name)
+    if name not in agents:
+        if not assign:
+            return None
+        name = await place()
+        registry.update(user_id, bot_name, agent=name)
+        logger.info("تم وضع %s/%s على العامل %s", user_id, bot_name, name)
+    return agents[name]
+
+
+def _load_synced(bot_path):
+    try:
+        with open(os.path.join(bot_path, STATE_DIR, SYNC_STATE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_synced(bot_path, state):
+    state_dir = os.path.join(bot_path, STATE_DIR)
+    os.makedirs(state_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=state_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, os.path.join(state_dir, SYNC_STATE))
+
+
+async def sync(client, user_id, bot_name, bot_path):
+    synced = _load_synced(bot_path)
+    if synced.get("agent") == client.name:
+        known = synced["files"]
+    else:
+        known = await client.call("manifest", timeout=SYNC_TIMEOUT, user_id=user_id, bot_name=bot_name)
+    files, data = await asyncio.to_thread(agent.pack, bot_path, known)
+    if files:
+        await client.call("apply", data, SYNC_TIMEOUT, user_id=user_id, bot_name=bot_name, files=files)
+    if files or synced.get("agent") != client.name:
+        known.update(files)
+        _save_synced(bot_path, {"agent": client.name, "files": known})
+    return len(files)
+
+
+def _quota_error(e):
+    if e.kind == limits.QuotaExceeded.__name__:
+        return limits.QuotaExceeded(str(e))
+    return e
+
+
+async def start(user_id, bot_name, bot_path, settle=False):
+    if not ENABLED:
+        return await agent.start_bot(user_id, bot_name, bot_path, settle)
+    others = [name for name in registry.user_bots(user_id) if name != bot_name]
+    current = await refresh(user_id, others)
+    limits.check_quota(user_id, sum(1 for state in current.values() if state in ACTIVE))
+    client = await _client(user_id, bot_name, assign=True)
+    await sync(client, user_id, bot_name, bot_path)
+    try:
+        result = await client.call("start", user_id=user_id, bot_name=bot_name, settle=settle)
+    except rpc.RemoteError as e:
+        raise _quota_error(e) from None
+    _states[(user_id, bot_name)] = supervisor.RUNNING
+    return result
+
+
+async def stop(user_id, bot_name):
+    if not ENABLED:
+        return await agent.stop_bot(user_id, bot_name)
+    client = await _client(user_id, bot_name)
+    if client is None:
+        return False
+    stopped = await client.call("stop", user_id=user_id, bot_name=bot_name)
+    _states[(user_id, bot_name)] = supervisor.STOPPED
+    return stopped
+
+
+async def refresh(user_id, bot_names):
+    if not ENABLED:
+        return supervisor.states(user_id, bot_names)
+    rows = registry.user_bots(user_id)
+    groups = collections.defaultdict(list)
+    result = {}
+    for bot_name in bot_names:
+        name = (rows.get(bot_name) or {}).get("agent")
+        if name in agents:
+            groups[name].append(bot_name)
+        else:
+            result[bot_name] = supervisor.STOPPED
+    names = list(groups)
+    replies = await asyncio.gather(
+        *(agents[name].call("states", timeout=INFO_TIMEOUT, user_id=user_id, bot_names=groups[name]) for name in names),
+        return_exceptions=True
+    )
+    for name, reply in zip(names, replies):
+        if isinstance(reply, Exception):
+            result.update((bot_name, UNREACHABLE) for bot_name in groups[name])
+        else:
+            result.update(reply)
+    for bot_name, state in result.items():
+        _states[(user_id, bot_name)] = state
+    return result
+
+
+def states(user_id, bot_names):
+    if not ENABLED:
+        return supervisor.states(user_id, bot_names)
+    return {bot_name: _states.get((user_id, bot_name), supervisor.STOPPED) for bot_name in bot_names}
+
+
+async def status(user_id, bot_name):
+    if not ENABLED:
+        return agent.bot_status(user_id, bot_name)
+    client = await _client(user_id, bot_name)
+    if client is None:
+        result = agent.bot_status(user_id, bot_name)
+        result["state"] = supervisor.STOPPED
+        return result
+    result = await client.call("status", user_id=user_id, bot_name=bot_name)
+    result["agent"] = client.name
+    _states[(user_id, bot_name)] = result["state"]
+    return result
+
+
+async def log_tail(user_id, bot_name, bot_path):
+    if not ENABLED:
+        return agent.log_tail(bot_path)
+    client = await _client(user_id, bot_name)
+    if client is None:
+        return None
+    return await client.call("log", user_id=user_id, bot_name=bot_name)
+
+
+def log_reader(user_id, bot_name, chars=2000):
+    if not ENABLED:
+        return None
+    name = owner(user_id, bot_name)
+
+    async def read(offset):
+        client = agents.get(name)
+        if client is None:
+            raise rpc.Unavailable(f"{name} is not configured")
+        return await client.call("log_read", user_id=user_id, bot_name=bot_name, offset=offset, chars=chars)
+    return read
+
+
+async def remove_file(user_id, bot_name, rel):
+    if not ENABLED:
+        return
+    client = await _client(user_id, bot_name)
+    if client is not None:
+        await client.call("remove", user_id=user_id, bot_name=bot_name, rel=rel)
+
+
+async def delete(user_id, bot_name):
+    if ENABLED:
+        client = await _client(user_id, bot_name)
+        if client is not None:
+            await client.call("delete", user_id=user_id, bot_name=bot_name)
+        _states.pop((user_id, bot_name), None)
+    else:
+        await supervisor.stop(user_id, bot_name)
+    registry.delete(user_id, bot_name)
+
+
+async def migrate(user_id, bot_name, bot_path, target=None):
+    source_name = owner(user_id, bot_name)
+    if target is None:
+        target = await place(exclude={source_name})
+    if target not in agents:
+        raise ValueError(f"unknown agent {target!r}")
+    if target == source_name:
+        return target
+    destination = agents[target]
+    source = agents.get(source_name)
+    was_running = False
+    if source is not None:
+        try:
+            info = await source.call("status", user_id=user_id, bot_name=bot_name)
+            was_running = info["state"] in ACTIVE
+            if was_running:
+                await source.call("stop", user_id=user_id, bot_name=bot_name)
+            known = await destination.call(
+                "manifest", timeout=SYNC_TIMEOUT, user_id=user_id, bot_name=bot_name, include_logs=True
+            )
+            result, data = await source.call_data(
+                "pack", timeout=SYNC_TIMEOUT, user_id=user_id, bot_name=bot_name, known=known, include_logs=True
+            )
+            if result["files"]:
+                await destination.call(
+                    "apply", data, SYNC_TIMEOUT, user_id=user_id, bot_name=bot_name, files=result["files"]
+                )
+        except rpc.Unavailable as e:
+            logger.warning("العامل %s غير متاح، نقل %s/%s من نسخة المدير: %s", source_name, user_id, bot_name, e)
+            source = None
+            was_running = True
+    registry.update(user_id, bot_name, agent=target)
+    synced = _load_synced(bot_path)
+    if source is not None and synced.get("agent") == source_name:
+        _save_synced(bot_path, dict(synced, agent=target))
+    if was_running:
+        await start(user_id, bot_name, bot_path)
+    if source is not None:
+        await source.call("delete", user_id=user_id, bot_name=bot_name)
+    logger.info("تم نقل %s/%s من %s إلى %s", user_id, bot_name, source_name or "-", target)
+    return target
+
+
+async def drain(name, path_for):
+    moved = []
+    for row in registry.all_bots():
+        if row.get("agent") != name:
+            continue
+        user_id, bot_name = row["user_id"], row["bot_name"]
+        target = await migrate(user_id, bot_name, path_for(user_id, bot_name), await place(exclude={name}))
+        moved.append((user_id, bot_name, target))
+    return moved
+
+
+async def _main(args):
+    setup()
+    base = os.environ.get("BASE", "user_bots/")
+
+    def path_for(user_id, bot_name):
+        return os.path.join(base, user_id, bot_name)
+
+    if args.command == "agents":
+        infos = await loads()
+        for name in agents:
+            info = infos.get(name)
+            if info is None:
+                print(f"{name:12} {UNREACHABLE}")
+                continue
+            print(
+                f"{name:12} running {info['running']:4d}  hibernated {info['hibernated']:4d}  "
+                f"load {info['load']:5.2f}/{info['cpus']}  "
+                f"mem free {info['mem_available'] / info['mem_total'] * 100:4.0f}%  score {score(info):.2f}"
+            )
+    elif args.command == "migrate":
+        print(await migrate(args.user_id, args.bot_name, path_for(args.user_id, args.bot_name), args.target))
+    elif args.command == "drain":
+        for user_id, bot_name, target in await drain(args.agent, path_for):
+            print(f"{user_id}/{bot_name} -> {target}")
+    for client in agents.values():
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect worker agents and move bots between them")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("agents", help="show load per agent")
+    migrate_parser = commands.add_parser("migrate", help="move one bot to another agent")
+    migrate_parser.add_argument("user_id")
+    migrate_parser.add_argument("bot_name")
+    migrate_parser.add_argument("target", nargs="?")
+    drain_parser = commands.add_parser("drain", help="move every bot off an agent")
+    drain_parser.add_argument("agent")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import os
+import time
+
+import procfs
+import registry
+import supervisor
+
+logger = logging.getLogger(__name__)
+
+FLEET_CONCURRENCY = int(os.environ.get("FLEET_CONCURRENCY", "8"))
+FLEET_STOP_CONCURRENCY = int(os.environ.get("FLEET_STOP_CONCURRENCY", "64"))
+FLEET_WARMUP = float(os.environ.get("FLEET_WARMUP", "3"))
+SETTLED_CPU = float(os.environ.get("FLEET_SETTLED_CPU", "0.2"))
+SETTLE_INTERVAL = 0.05
+
+
+class Result:
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.failed = []
+        self.started = time.monotonic()
+
+    @property
+    def ok(self):
+        return self.done - len(self.failed)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+
+async def settle(pid, timeout=FLEET_WARMUP):
+    deadline = time.monotonic() + timeout
+    last = None
+    while time.monotonic() < deadline:
+        stat = procfs.read_stat(pid)
+        if stat is None:
+            return
+        now = time.monotonic()
+        cpu = procfs.cpu_seconds(stat)
+        if last is not None and (cpu - last[1]) / (now - last[0]) < SETTLED_CPU:
+            return
+        last = (now, cpu)
+        await asyncio.sleep(SETTLE_INTERVAL)
+
+
+async def each(items, action, concurrency=FLEET_CONCURRENCY, on_progress=None):
+    result = Result(len(items))
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(item):
+        async with semaphore:
+            try:
+                await action(*item)
+            except Exception as e:
+                logger.warning("فشل تنفيذ العملية على %s: %s", "/".join(item), e)
+                result.failed.append((item, str(e)))
+            result.done += 1
+            if on_progress:
+                on_progress(result)
+
+    await asyncio.gather(*(one(item) for item in items))
+    return result
+
+
+def autostart_set():
+    return [
+        (row["user_id"], row["bot_name"]) for row in registry.all_bots()
+        if row.get("autostart") and supervisor.get(row["user_id"], row["bot_name"]) is None
+    ]
+
+
+async def restore(start):
+    items = autostart_set()
+    if not items:
+        return None
+    logger.info("استعادة %d بوت بعد الإقلاع (التوازي %d)", len(items), FLEET_CONCURRENCY)
+    result = await each(items, start)
+    logger.info(
+        "تمت الاستعادة: %d/%d خلال %.1f ث، %d فشل",
+        result.ok, result.total, result.elapsed, len(result.failed)
+    )
+    return result
@@ -0,0 +1,229 @@
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import struct
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+FS_INDEX_TTL = float(os.environ.get("FS_INDEX_TTL", "30"))
+FS_INOTIFY = os.environ.get("FS_INOTIFY", "1") == "1"
+VIEW_CHUNK = int(os.environ.get("VIEW_CHUNK", "1500"))
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+EVENT = struct.Struct("iIII")
+
+
+class Listing:
+    def __init__(self, dirs, files, mtime):
+        self.dirs = dirs
+        self.files = files
+        self.mtime = mtime
+        self.loaded = time.monotonic()
+        self.watched = False
+        self._sizes = dict(files)
+
+    @property
+    def total_size(self):
+        return sum(size for _, size in self.files)
+
+    def size(self, name):
+        return self._sizes.get(name)
+
+
+class _Inotify:
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self._add = libc.inotify_add_watch
+        self._add.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm = libc.inotify_rm_watch
+        self._rm.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+
+    def add(self, path):
+        wd = self._add(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch", path)
+        return wd
+
+    def remove(self, wd):
+        self._rm(self.fd, wd)
+
+    def read(self):
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, offset)
+                events.append((wd, mask))
+                offset += EVENT.size + length
+
+
+_lock = threading.RLock()
+_entries = {}
+_watches = {}
+_watched = {}
+_inotify = None
+_inotify_failed = not FS_INOTIFY
+
+
+def _notifier():
+    global _inotify, _inotify_failed
+    if _inotify is None and not _inotify_failed:
+        try:
+            _inotify = _Inotify()
+        except (OSError, AttributeError):
+            _inotify_failed = True
+            logger.warning("inotify غير متاح، سيتم استخدام فحص وقت التعديل")
+    return _inotify
+
+
+def _drain():
+    if _inotify is None:
+        return
+    for wd, mask in _inotify.read():
+        if mask & IN_Q_OVERFLOW:
+            _entries.clear()
+            continue
+        path = _watches.get(wd)
+        if path is None:
+            continue
+        _entries.pop(path, None)
+        if mask & IN_IGNORED:
+            del _watches[wd]
+            _watched.pop(path, None)
+
+
+def _scan(path):
+    dirs = []
+    files = []
+    mtime = os.stat(path).st_mtime_ns
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False) or (entry.is_symlink() and entry.is_dir()):
+                    dirs.append(entry.name)
+                elif entry.is_file(follow_symlinks=False):
+                    files.append((entry.name, entry.stat(follow_symlinks=False).st_size))
+            except OSError:
+                continue
+    dirs.sort()
+    files.sort()
+    return Listing(dirs, files, mtime)
+
+
+def _fresh(path, listing):
+    if listing.watched:
+        return True
+    if time.monotonic() - listing.loaded > FS_INDEX_TTL:
+        return False
+    try:
+        return os.stat(path).st_mtime_ns == listing.mtime
+    except OSError:
+        return False
+
+
+def _watch(path):
+    notifier = _notifier()
+    if notifier is None:
+        return False
+    if path in _watched:
+        return True
+    try:
+        wd = notifier.add(path)
+    except OSError as e:
+        if e.errno == errno.ENOSPC:
+            logger.warning("تم بلوغ حد مراقبات inotify، %s سيُفحص دورياً", path)
+        return False
+    _watches[wd] = path
+    _watched[path] = wd
+    return True
+
+
+def listing(path):
+    path = os.path.abspath(path)
+    with _lock:
+        _drain()
+        cached = _entries.get(path)
+        if cached is not None and _fresh(path, cached):
+            return cached
+        watched = _watch(path) if os.path.isdir(path) else False
+        try:
+            result = _scan(path)
+        except (FileNotFoundError, NotADirectoryError):
+            _entries.pop(path, None)
+            return None
+        result.watched = watched
+        _entries[path] = result
+        return result
+
+
+def dirs(path):
+    result = listing(path)
+    return result.dirs if result else []
+
+
+def files(path):
+    result = listing(path)
+    return result.files if result else []
+
+
+def invalidate(path):
+    with _lock:
+        path = os.path.abspath(path)
+        for key in [key for key in _entries if key == path or key.startswith(path + os.sep)]:
+            del _entries[key]
+
+
+def forget(path):
+    with _lock:
+        invalidate(path)
+        path = os.path.abspath(path)
+        for key in [key for key in _watched if key == path or key.startswith(path + os.sep)]:
+            wd = _watched.pop(key)
+            _watches.pop(wd, None)
+            _inotify.remove(wd)
+
+
+def read_page(path, page, chunk=VIEW_CHUNK):
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        pages = max(1, -(-size // chunk))
+        page = min(max(page, 0), pages - 1)
+        f.seek(page * chunk)
+        data = f.read(chunk + 3)
+    if b"\x00" in data:
+        raise ValueError(f"{path} is binary")
+    start = 0
+    if page:
+        while start < min(3, len(data)) and data[start] & 0xC0 == 0x80:
+            start += 1
+    end = min(chunk, len(data))
+    while end < len(data) and data[end] & 0xC0 == 0x80:
+        end += 1
+    return data[start:end].decode("utf-8", errors="replace"), page, pages
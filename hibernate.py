@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import os
+import time
+
+import httpx
+
+import limits
+import procfs
+import supervisor
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("HIBERNATE", "0") == "1"
+MODE = os.environ.get("HIBERNATE_MODE", supervisor.FREEZE)
+SAMPLE_INTERVAL = float(os.environ.get("HIBERNATE_INTERVAL", "30"))
+WAKE_POLL = float(os.environ.get("HIBERNATE_WAKE_POLL", "3"))
+IDLE_CPU_PERCENT = float(os.environ.get("IDLE_CPU_PERCENT", "1"))
+IDLE_IO_BYTES = float(os.environ.get("IDLE_IO_BYTES", "4096"))
+API_URL = os.environ.get("TELEGRAM_API_URL") or "https://api.telegram.org"
+
+_idle = {}
+
+
+def _sample(child):
+    stat = procfs.read_stat(child.pid)
+    if stat is None:
+        return None
+    io = procfs.read_io(child.pid) or {}
+    return procfs.cpu_seconds(stat), io.get("rchar", 0) + io.get("wchar", 0)
+
+
+def check_idle(now):
+    seen = set()
+    candidates = []
+    for child in supervisor.awake():
+        key = (child.user_id, child.bot_name)
+        sample = _sample(child)
+        if sample is None:
+            continue
+        seen.add(key)
+        info = _idle.get(key)
+        if info is None or info["pid"] != child.pid:
+            _idle[key] = {"pid": child.pid, "at": now, "sample": sample, "since": now}
+            continue
+        elapsed = now - info["at"]
+        if elapsed <= 0:
+            continue
+        cpu = (sample[0] - info["sample"][0]) / elapsed * 100
+        traffic = (sample[1] - info["sample"][1]) / elapsed
+        info["at"] = now
+        info["sample"] = sample
+        if cpu >= IDLE_CPU_PERCENT or traffic >= IDLE_IO_BYTES:
+            info["since"] = now
+            continue
+        lim = limits.for_bot(*key)
+        if lim["hibernate_token"] and lim["idle_after"] and now - info["since"] >= lim["idle_after"]:
+            candidates.append(child)
+    for key in list(_idle):
+        if key not in seen:
+            _idle.pop(key, None)
+    return candidates
+
+
+async def pending_updates(client, token):
+    try:
+        response = await client.get(f"{API_URL}/bot{token}/getWebhookInfo")
+        data = response.json()
+    except (httpx.HTTPError, ValueError):
+        return None
+    if not data.get("ok"):
+        return None
+    return data["result"].get("pending_update_count", 0)
+
+
+async def _should_wake(client, child):
+    lim = limits.for_bot(child.user_id, child.bot_name)
+    if lim["wake_every"] and child.hibernated and time.time() - child.hibernated >= lim["wake_every"]:
+        return "schedule"
+    if not lim["hibernate_token"]:
+        return "token"
+    pending = await pending_updates(client, lim["hibernate_token"])
+    if pending is None:
+        return "api"
+    return "demand" if pending else None
+
+
+async def _hibernate(child):
+    _idle.pop((child.user_id, child.bot_name), None)
+    await supervisor.hibernate(child, MODE)
+
+
+async def _wake(child, reason):
+    logger.info("إيقاظ %s/%s (%s)", child.user_id, child.bot_name, reason)
+    await supervisor.wake(child)
+
+
+async def monitor():
+    last_sample = time.monotonic()
+    async with httpx.AsyncClient(timeout=10) as client:
+        while True:
+            await asyncio.sleep(WAKE_POLL)
+            try:
+                now = time.monotonic()
+                sleeping = supervisor.hibernating()
+                reasons = await asyncio.gather(*(_should_wake(client, child) for child in sleeping))
+                for child, reason in zip(sleeping, reasons):
+                    if reason and child.hibernation:
+                        await _wake(child, reason)
+                if now - last_sample >= SAMPLE_INTERVAL:
+                    last_sample = now
+                    for child in check_idle(now):
+                        await _hibernate(child)
+            except Exception:
+                logger.exception("فشل فحص السبات")
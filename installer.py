@@ -0,0 +1,134 @@
+import glob
+import hashlib
+import logging
+import os
+import shutil
+
+import pkgstore
+from unpack import STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+INSTALLER = os.environ.get("INSTALLER", "store")
+UV = os.environ.get("UV_BIN", "uv")
+UV_CACHE = os.environ.get("UV_CACHE_DIR", os.path.join(pkgstore.CACHE, "uv"))
+UV_PYTHON = os.environ.get("UV_PYTHON", "python3")
+VENV = ".venv"
+LOCK_FILE = "requirements.lock"
+EXTRAS_FILE = "extra-requirements.txt"
+
+_fallback_logged = False
+
+
+async def _pip(job, bot_path, packages=(), requirements=None):
+    args = ["-r", requirements] if requirements else list(packages)
+    return await job.exec("pip", "install", *args, "--target", bot_path) == 0
+
+
+async def _uv(job, bot_path, packages=(), requirements=None):
+    state = os.path.join(bot_path, STATE_DIR)
+    os.makedirs(state, exist_ok=True)
+    extras = os.path.join(state, EXTRAS_FILE)
+    if not packages:
+        return await _uv_sync(job, bot_path, requirements, extras)
+    previous = _read(extras)
+    _write(extras, "".join(f"{line}\n" for line in ([previous] if previous else []) + list(packages)))
+    if await _uv_sync(job, bot_path, requirements, extras):
+        return True
+    if previous is None:
+        os.remove(extras)
+    else:
+        _write(extras, previous + "\n")
+    return False
+
+
+async def _uv_sync(job, bot_path, requirements, extras):
+    state = os.path.dirname(extras)
+    requirements = requirements or os.path.join(bot_path, "requirements.txt")
+    sources = [path for path in (requirements, extras) if os.path.exists(path)]
+    if not sources:
+        return True
+
+    env = dict(os.environ, UV_CACHE_DIR=os.path.abspath(UV_CACHE), UV_LINK_MODE="hardlink")
+    venv = os.path.join(bot_path, VENV)
+    if not os.path.exists(os.path.join(venv, "pyvenv.cfg")):
+        if await job.exec(UV, "venv", "--quiet", "--relocatable", "--python", UV_PYTHON, venv, env=env) != 0:
+            return False
+    lock = os.path.join(state, LOCK_FILE)
+    digest = _digest(sources)
+    if not os.path.exists(lock) or _read(lock + ".inputs") != digest:
+        tmp = lock + ".tmp"
+        if not await _uv_exec(job, env, "compile", "--no-header", "--no-annotate", "--python", interpreter(bot_path), "-o", tmp, *sources):
+            return False
+        os.replace(tmp, lock)
+        _write(lock + ".inputs", digest)
+    return await _uv_exec(job, env, "sync", "--python", interpreter(bot_path), lock)
+
+
+async def _uv_exec(job, env, command, *args):
+    base = [UV, "pip", command, "--quiet"]
+    if await job.exec(*base, "--offline", *args, env=env) == 0:
+        return True
+    job.log("🌐 تنزيل الحزم غير الموجودة في الذاكرة المؤقتة...")
+    return await job.exec(*base, *args, env=env) == 0
+
+
+def _digest(paths):
+    h = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            h.update(f.read())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _write(path, text):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _read(path):
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+BACKENDS = {
+    "pip": _pip,
+    "store": pkgstore.install,
+    "uv": _uv,
+}
+
+
+def backend():
+    global _fallback_logged
+    name = INSTALLER if INSTALLER in BACKENDS else "store"
+    if name == "uv" and shutil.which(UV) is None:
+        if not _fallback_logged:
+            logger.warning("uv غير موجود (%s)، سيتم استخدام المخزن المشترك", UV)
+            _fallback_logged = True
+        name = "store"
+    if name == "store" and not pkgstore.ENABLED:
+        name = "pip"
+    return name
+
+
+def syncs():
+    return backend() == "uv"
+
+
+async def install(job, bot_path, packages=(), requirements=None):
+    return await BACKENDS[backend()](job, bot_path, packages=packages, requirements=requirements)
+
+
+def interpreter(bot_path):
+    python = os.path.abspath(os.path.join(bot_path, VENV, "bin", "python"))
+    return python if os.path.exists(python) else None
+
+
+def site_packages(bot_path):
+    return sorted(glob.glob(os.path.join(bot_path, VENV, "lib", "python*", "site-packages")))
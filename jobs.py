@@ -0,0 +1,193 @@
+import asyncio
+import collections
+import itertools
+import logging
+import os
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_PROGRESS_INTERVAL = float(os.environ.get("JOB_PROGRESS_INTERVAL", "3"))
+JOB_HISTORY = int(os.environ.get("JOB_HISTORY", "200"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class Job:
+    def __init__(self, job_id, key, title, func, owner=None, on_progress=None, on_done=None, kind="job"):
+        self.id = job_id
+        self.key = key
+        self.title = title
+        self.kind = kind
+        self.owner = owner
+        self.status = QUEUED
+        self.returncode = None
+        self.error = None
+        self.output = collections.deque(maxlen=200)
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._func = func
+        self._on_progress = on_progress
+        self._on_done = on_done
+        self._proc = None
+        self._task = None
+        self._last_report = 0.0
+        self.cancel_requested = False
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    def tail(self, limit=800):
+        return "\n".join(self.output)[-limit:]
+
+    def log(self, line):
+        self.output.append(line)
+
+    async def exec(self, *argv, cwd=None, env=None):
+        command = " ".join([os.path.basename(argv[0])] + [a for a in argv[1:2] if not a.startswith("-")])
+        started = time.monotonic()
+        proc = await asyncio.create_subprocess_exec(
+            *argv,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            cwd=cwd,
+            env=env
+        )
+        self._proc = proc
+        try:
+            async for raw in proc.stdout:
+                line = raw.decode("utf-8", errors="replace").rstrip()
+                if line:
+                    self.output.append(line)
+                    await self.report()
+            self.returncode = await proc.wait()
+            return self.returncode
+        finally:
+            if proc.returncode is None:
+                try:
+                    proc.kill()
+                except ProcessLookupError:
+                    pass
+                await proc.wait()
+            self._proc = None
+            metrics.COMMAND_SECONDS.observe(time.monotonic() - started, command=command)
+
+    async def report(self, force=False):
+        if not self._on_progress:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_report < JOB_PROGRESS_INTERVAL:
+            return
+        self._last_report = now
+        try:
+            await self._on_progress(self)
+        except Exception:
+            logger.exception("job %s: progress callback failed", self.id)
+
+    def cancel(self):
+        if not self.active:
+            return False
+        self.cancel_requested = True
+        if self._task:
+            self._task.cancel()
+        return True
+
+
+_ids = itertools.count(1)
+_jobs = collections.OrderedDict()
+_locks = {}
+_semaphore = None
+
+
+def _get_semaphore():
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(JOB_WORKERS)
+    return _semaphore
+
+
+def _forget_old():
+    while len(_jobs) > JOB_HISTORY:
+        oldest = next(iter(_jobs.values()))
+        if oldest.active:
+            break
+        _jobs.popitem(last=False)
+
+
+async def _run(job):
+    lock = _locks.setdefault(job.key, asyncio.Lock())
+    try:
+        async with lock:
+            async with _get_semaphore():
+                job.status = RUNNING
+                job.started = time.time()
+                metrics.JOB_WAIT_SECONDS.observe(job.started - job.created, kind=job.kind)
+                await job.report(force=True)
+                result = await job._func(job)
+                if result is False or (job.returncode not in (None, 0)):
+                    job.status = FAILED
+                else:
+                    job.status = DONE
+    except asyncio.CancelledError:
+        job.status = CANCELLED
+    except Exception as e:
+        logger.exception("job %s (%s) failed", job.id, job.title)
+        job.status = FAILED
+        job.error = str(e)
+    finally:
+        job.finished = time.time()
+        metrics.JOB_SECONDS.observe(job.finished - (job.started or job.created), kind=job.kind, status=job.status)
+        if not lock.locked() and not any(j.active and j.key == job.key for j in _jobs.values() if j is not job):
+            _locks.pop(job.key, None)
+        logger.info(
+            "job %s (%s) %s in %.1fs",
+            job.id, job.title, job.status, job.finished - (job.started or job.created)
+        )
+        if job._on_done:
+            try:
+                await job._on_done(job)
+            except Exception:
+                logger.exception("job %s: done callback failed", job.id)
+        _forget_old()
+
+
+def submit(key, title, func, owner=None, on_progress=None, on_done=None, kind="job"):
+    job = Job(next(_ids), key, title, func, owner, on_progress, on_done, kind)
+    _jobs[job.id] = job
+    job._task = asyncio.create_task(_run(job))
+    return job
+
+
+def get(job_id):
+    return _jobs.get(job_id)
+
+
+def cancel(job_id, owner=None):
+    job = _jobs.get(job_id)
+    if not job or (owner is not None and job.owner != owner):
+        return False
+    return job.cancel()
+
+
+def pending(key=None):
+    return [j for j in _jobs.values() if j.active and (key is None or j.key == key)]
+
+
+@metrics.collector
+def collect_metrics():
+    counts = collections.Counter(job.status for job in _jobs.values() if job.active)
+    return [(
+        "manager_jobs",
+        "gauge",
+        "Background jobs by status.",
+        [({"status": status}, counts.get(status, 0)) for status in (QUEUED, RUNNING)]
+    )]
@@ -0,0 +1,285 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import resource
+import time
+
+import procfs
+
+logger = logging.getLogger(__name__)
+
+LIMITS_FILE = os.environ.get("LIMITS_FILE", "limits.json")
+CGROUP_ROOT = os.environ.get("CGROUP_ROOT", "")
+LIMITS_INTERVAL = float(os.environ.get("LIMITS_INTERVAL", "10"))
+CPU_SUSTAIN = int(os.environ.get("CPU_SUSTAIN", "3"))
+AS_FACTOR = int(os.environ.get("AS_FACTOR", "4"))
+SECRET_ENV = {"TELEGRAM_BOT_TOKEN", "AGENT_TOKEN", "WEBHOOK_SECRET"} | {
+    name.strip() for name in os.environ.get("BOT_ENV_STRIP", "").split(",") if name.strip()
+}
+SECRET_MARKERS = ("TOKEN", "SECRET", "PASSWORD", "API_KEY")
+
+DEFAULTS = {
+    "memory_mb": int(os.environ.get("BOT_MEMORY_MB", "512")),
+    "cpu_percent": int(os.environ.get("BOT_CPU_PERCENT", "50")),
+    "cpu_weight": int(os.environ.get("BOT_CPU_WEIGHT", "100")),
+    "pids": int(os.environ.get("BOT_PIDS_MAX", "64")),
+    "nofile": int(os.environ.get("BOT_NOFILE", "1024")),
+    "fsize_mb": int(os.environ.get("BOT_FSIZE_MB", "0")),
+    "nice": int(os.environ.get("BOT_NICE", "5")),
+    "cpu_action": os.environ.get("CPU_ACTION", "throttle"),
+    "max_running": int(os.environ.get("USER_MAX_RUNNING", "0")),
+    "user_memory_mb": int(os.environ.get("USER_MEMORY_MB", "0")),
+    "user_cpu_weight": int(os.environ.get("USER_CPU_WEIGHT", "100")),
+    "idle_after": int(os.environ.get("IDLE_AFTER", "1800")),
+    "wake_every": int(os.environ.get("WAKE_EVERY", "0")),
+    "hibernate_token": "",
+}
+
+THROTTLE = "throttle"
+KILL = "kill"
+NOTIFY = "notify"
+
+usage = {}
+_overrides = {"mtime": None, "data": {}}
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+def _load_overrides():
+    try:
+        mtime = os.path.getmtime(LIMITS_FILE)
+    except OSError:
+        return {}
+    if mtime != _overrides["mtime"]:
+        try:
+            with open(LIMITS_FILE, "r") as f:
+                _overrides["data"] = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("تعذر قراءة %s: %s", LIMITS_FILE, e)
+        _overrides["mtime"] = mtime
+    return _overrides["data"]
+
+
+def for_bot(user_id, bot_name):
+    data = _load_overrides()
+    result = dict(DEFAULTS)
+    result.update(data.get("default", {}))
+    result.update(data.get("users", {}).get(user_id, {}))
+    result.update(data.get("bots", {}).get(f"{user_id}/{bot_name}", {}))
+    return result
+
+
+def check_quota(user_id, running):
+    limit = for_bot(user_id, "")["max_running"]
+    if limit and running >= limit:
+        raise QuotaExceeded(f"الحد الأقصى للبوتات الشغالة هو {limit}")
+
+
+def cgroup_enabled():
+    return bool(CGROUP_ROOT) and os.path.exists(os.path.join(CGROUP_ROOT, "cgroup.controllers"))
+
+
+def cgroup_path(user_id, bot_name):
+    name = hashlib.sha1(bot_name.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(CGROUP_ROOT, f"u{user_id}", f"b{name}")
+
+
+def _write(path, value):
+    with open(path, "w") as f:
+        f.write(str(value))
+
+
+def _read(path):
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _enable_controllers(path):
+    try:
+        _write(os.path.join(path, "cgroup.subtree_control"), "+cpu +memory +pids")
+    except OSError:
+        pass
+
+
+def prepare(user_id, bot_name, lim):
+    if not cgroup_enabled():
+        return None
+    bot_cg = cgroup_path(user_id, bot_name)
+    user_cg = os.path.dirname(bot_cg)
+    try:
+        _enable_controllers(CGROUP_ROOT)
+        os.makedirs(user_cg, exist_ok=True)
+        _enable_controllers(user_cg)
+        _write(os.path.join(user_cg, "cpu.weight"), lim["user_cpu_weight"])
+        if lim["user_memory_mb"]:
+            _write(os.path.join(user_cg, "memory.max"), lim["user_memory_mb"] * 1024 * 1024)
+        os.makedirs(bot_cg, exist_ok=True)
+        _write(os.path.join(bot_cg, "cpu.weight"), lim["cpu_weight"])
+        _write(os.path.join(bot_cg, "cpu.max"), "max 100000")
+        _write(os.path.join(bot_cg, "memory.max"), lim["memory_mb"] * 1024 * 1024 if lim["memory_mb"] else "max")
+        _write(os.path.join(bot_cg, "pids.max"), lim["pids"] or "max")
+        freeze(bot_cg, False)
+    except OSError as e:
+        logger.warning("تعذر تجهيز cgroup لـ %s/%s: %s", user_id, bot_name, e)
+        return None
+    return bot_cg
+
+
+def freeze(cgroup, on):
+    path = os.path.join(cgroup, "cgroup.freeze")
+    if not os.path.exists(path):
+        return False
+    _write(path, 1 if on else 0)
+    return True
+
+
+def reclaim(cgroup):
+    current = _read(os.path.join(cgroup, "memory.current"))
+    if not current or not current.isdigit():
+        return
+    try:
+        _write(os.path.join(cgroup, "memory.reclaim"), current)
+    except OSError:
+        pass
+
+
+def child_env():
+    return {
+        name: value for name, value in os.environ.items()
+        if name not in SECRET_ENV and not any(marker in name.upper() for marker in SECRET_MARKERS)
+    }
+
+
+def preexec(lim, cgroup):
+    def apply():
+        if lim["nice"]:
+            os.nice(lim["nice"])
+        if lim["nofile"]:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (lim["nofile"], lim["nofile"]))
+        if lim["fsize_mb"]:
+            size = lim["fsize_mb"] * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_FSIZE, (size, size))
+        if cgroup:
+            _write(os.path.join(cgroup, "cgroup.procs"), 0)
+        elif lim["memory_mb"]:
+            size = lim["memory_mb"] * AS_FACTOR * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (size, size))
+    return apply
+
+
+def _memory(child, stat):
+    if child.cgroup:
+        current = _read(os.path.join(child.cgroup, "memory.current"))
+        if current and current.isdigit():
+            return int(current)
+    return stat["rss"]
+
+
+def _can_unthrottle(lim):
+    if os.geteuid() == 0:
+        return True
+    soft = resource.getrlimit(resource.RLIMIT_NICE)[0]
+    return soft == resource.RLIM_INFINITY or 20 - soft <= lim["nice"]
+
+
+def _renice(pid, value):
+    for tid in os.listdir(f"/proc/{pid}/task"):
+        os.setpriority(os.PRIO_PROCESS, int(tid), value)
+    if os.getpgid(pid) == pid:
+        os.setpriority(os.PRIO_PGRP, pid, value)
+
+
+def _throttle(child, lim, on):
+    if child.cgroup:
+        quota = f"{lim['cpu_percent'] * 1000} 100000" if on else "max 100000"
+        _write(os.path.join(child.cgroup, "cpu.max"), quota)
+    else:
+        _renice(child.pid, 19 if on else lim["nice"])
+
+
+def check(children, kill, notify, last):
+    now = time.monotonic()
+    seen = set()
+    for child in children():
+        key = (child.user_id, child.bot_name)
+        stat = procfs.read_stat(child.pid)
+        if not stat:
+            continue
+        seen.add(key)
+        lim = for_bot(*key)
+        cpu = procfs.cpu_seconds(stat)
+        prev = last.get(key)
+        percent = 0.0
+        if prev and prev[0] == child.pid and now > prev[1]:
+            percent = (cpu - prev[2]) / (now - prev[1]) * 100
+        last[key] = (child.pid, now, cpu)
+
+        info = usage.get(key)
+        if not info or info["pid"] != child.pid:
+            info = usage[key] = {"pid": child.pid, "over": 0, "throttled": False, "event": None, "notified": set()}
+        info["cpu"] = percent
+        info["rss"] = _memory(child, stat)
+
+        if lim["memory_mb"] and info["rss"] > lim["memory_mb"] * 1024 * 1024:
+            _record(info, key, "memory", KILL, notify)
+            kill(child)
+            continue
+
+        if lim["cpu_percent"] and percent > lim["cpu_percent"]:
+            info["over"] += 1
+            if info["over"] >= CPU_SUSTAIN:
+                action = lim["cpu_action"]
+                if action == THROTTLE and not child.cgroup and not _can_unthrottle(lim):
+                    action = NOTIFY
+                if action == KILL:
+                    _record(info, key, "cpu", KILL, notify)
+                    kill(child)
+                    continue
+                if action == THROTTLE and not info["throttled"]:
+                    try:
+                        _throttle(child, lim, True)
+                        info["throttled"] = True
+                    except OSError as e:
+                        logger.warning("تعذر تقييد %s/%s: %s", *key, e)
+                _record(info, key, "cpu", action, notify)
+        else:
+            info["over"] = 0
+            if info["throttled"] and percent < lim["cpu_percent"] / 2:
+                try:
+                    _throttle(child, lim, False)
+                    info["throttled"] = False
+                except OSError as e:
+                    if "unthrottle" not in info:
+                        logger.warning("تعذر رفع التقييد عن %s/%s: %s", *key, e)
+                    info["unthrottle"] = str(e)
+
+    for key in list(usage):
+        if key not in seen:
+            usage.pop(key, None)
+            last.pop(key, None)
+
+
+def _record(info, key, resource_name, action, notify):
+    info["event"] = f"{action}:{resource_name}"
+    if info["event"] in info["notified"]:
+        return
+    info["notified"].add(info["event"])
+    logger.warning("حدود الموارد: %s/%s %s", *key, info["event"])
+    notify(*key, resource_name, action)
+
+
+async def monitor(children, kill, notify):
+    last = {}
+    while True:
+        await asyncio.sleep(LIMITS_INTERVAL)
+        try:
+            check(children, kill, notify, last)
+        except Exception:
+            logger.exception("فشل فحص حدود الموارد")
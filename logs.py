@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+
+logger = logging.getLogger(__name__)
+
+LOG_NAME = "log.txt"
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+LOG_BACKUPS = int(os.environ.get("LOG_BACKUPS", "3"))
+LOG_ROTATE_INTERVAL = float(os.environ.get("LOG_ROTATE_INTERVAL", "30"))
+LOG_FOLLOW_SECONDS = float(os.environ.get("LOG_FOLLOW_SECONDS", "120"))
+LOG_FOLLOW_INTERVAL = float(os.environ.get("LOG_FOLLOW_INTERVAL", "3"))
+
+_followers = {}
+
+
+def log_path(bot_path):
+    return os.path.join(bot_path, LOG_NAME)
+
+
+def segments(path):
+    result = [path]
+    for i in range(1, LOG_BACKUPS + 1):
+        result.append(f"{path}.{i}")
+    return result
+
+
+def _read_tail(path, limit):
+    try:
+        with open(path, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(0, size - limit))
+            return f.read(limit)
+    except OSError:
+        return b""
+
+
+def tail(path, chars=2000):
+    limit = chars * 4
+    data = _read_tail(path, limit)
+    for older in segments(path)[1:]:
+        if len(data) >= limit:
+            break
+        data = _read_tail(older, limit - len(data)) + data
+    return data.decode("utf-8", errors="replace")[-chars:]
+
+
+def rotate(path):
+    paths = segments(path)
+    if LOG_BACKUPS < 1:
+        os.truncate(path, 0)
+        return
+    for i in range(len(paths) - 1, 1, -1):
+        if os.path.exists(paths[i - 1]):
+            os.replace(paths[i - 1], paths[i])
+    shutil.copyfile(path, paths[1])
+    os.truncate(path, 0)
+
+
+def rotate_if_needed(path):
+    try:
+        if os.path.getsize(path) <= LOG_MAX_BYTES:
+            return False
+    except OSError:
+        return False
+    rotate(path)
+    logger.info("تم تدوير السجل %s", path)
+    return True
+
+
+def open_for_child(bot_path):
+    path = log_path(bot_path)
+    rotate_if_needed(path)
+    log_file = open(path, "ab")
+    log_file.write(f"===== {time.strftime('%Y-%m-%d %H:%M:%S')} =====\n".encode("utf-8"))
+    log_file.flush()
+    return log_file
+
+
+async def rotator(bot_paths):
+    while True:
+        await asyncio.sleep(LOG_ROTATE_INTERVAL)
+        for bot_path in bot_paths():
+            try:
+                await asyncio.to_thread(rotate_if_needed, log_path(bot_path))
+            except OSError as e:
+                logger.warning("تعذر تدوير سجل %s: %s", bot_path, e)
+
+
+def read_since(path, offset, chars=2000):
+    if offset is None:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        return size, tail(path, chars)
+    size = os.path.getsize(path)
+    if size < offset:
+        offset = 0
+    if size == offset:
+        return size, ""
+    with open(path, "rb") as f:
+        f.seek(max(offset, size - chars * 4))
+        data = f.read(size - f.tell())
+    return size, data.decode("utf-8", errors="replace")
+
+
+async def _follow(read, on_update, chars):
+    deadline = time.monotonic() + LOG_FOLLOW_SECONDS
+    offset, window = await read(None)
+    await on_update(window, True)
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LOG_FOLLOW_INTERVAL)
+        try:
+            offset, data = await read(offset)
+        except (OSError, RuntimeError):
+            continue
+        if not data:
+            continue
+        window = (window + data)[-chars:]
+        await on_update(window, True)
+    await on_update(window, False)
+
+
+def follow(key, path, on_update, chars=2000, read=None):
+    unfollow(key)
+    if read is None:
+        async def read(offset):
+            return read_since(path, offset, chars)
+    task = asyncio.create_task(_follow(read, on_update, chars))
+    _followers[key] = task
+    task.add_done_callback(lambda t: _followers.pop(key, None) if _followers.get(key) is t else None)
+    return task
+
+
+def unfollow(key):
+    task = _followers.pop(key, None)
+    if task and not task.done():
+        task.cancel()
+        return True
+    return False
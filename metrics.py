@@ -0,0 +1,266 @@
+import asyncio
+import collections
+import functools
+import logging
+import math
+import os
+import sys
+import threading
+import time
+import urllib.parse
+
+logger = logging.getLogger(__name__)
+
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9464"))
+LOOP_LAG_INTERVAL = float(os.environ.get("LOOP_LAG_INTERVAL", "0.5"))
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", "60"))
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", "0.005"))
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+JOB_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+_metrics = []
+collectors = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            for key, value in self.values.items():
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            for key, (counts, total, count) in self.values.items():
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    labels = _labels(self.labelnames, key, [("le", _number(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total!r}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+HANDLER_SECONDS = Histogram("manager_handler_seconds", "Time spent handling a Telegram update.", ["handler"])
+LOOP_LAG = Gauge("manager_event_loop_lag_seconds", "Last measured event loop scheduling delay.")
+LOOP_LAG_MAX = Gauge("manager_event_loop_lag_max_seconds", "Largest event loop delay since start.")
+JOB_SECONDS = Histogram("manager_job_seconds", "Background job run time.", ["kind", "status"], JOB_BUCKETS)
+JOB_WAIT_SECONDS = Histogram("manager_job_wait_seconds", "Time a job waited in the queue.", ["kind"], JOB_BUCKETS)
+COMMAND_SECONDS = Histogram("manager_command_seconds", "Subprocess run time inside jobs.", ["command"], JOB_BUCKETS)
+UNZIP_SECONDS = Histogram("manager_unzip_seconds", "Archive extraction time.", [], JOB_BUCKETS)
+UPLOADS = Counter("manager_uploads_total", "Uploaded documents by download cache result.", ["result"])
+
+
+def timed(name):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                HANDLER_SECONDS.observe(time.perf_counter() - start, handler=name)
+        return wrapper
+    return decorator
+
+
+def collector(func):
+    collectors.append(func)
+    return func
+
+
+def render():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for func in collectors:
+        try:
+            families = func()
+        except Exception:
+            logger.exception("metrics collector %s failed", func.__name__)
+            continue
+        for name, kind, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if value is None:
+                    continue
+                lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+async def loop_lag():
+    loop = asyncio.get_running_loop()
+    worst = 0.0
+    while True:
+        before = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = max(0.0, loop.time() - before - LOOP_LAG_INTERVAL)
+        worst = max(worst, lag)
+        LOOP_LAG.set(lag)
+        LOOP_LAG_MAX.set(worst)
+
+
+_profile_lock = threading.Lock()
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def profile(seconds, thread_id=None, interval=PROFILE_INTERVAL):
+    thread_id = thread_id or threading.main_thread().ident
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("profile already running")
+    try:
+        stacks = collections.Counter()
+        own = collections.Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stacks[";".join(reversed(stack))] += 1
+                own[stack[0]] += 1
+                samples += 1
+            time.sleep(interval)
+    finally:
+        _profile_lock.release()
+
+    lines = [f"# {samples} samples over {seconds:.0f}s every {interval * 1000:.0f}ms", "# top frames (self):"]
+    for name, count in own.most_common(25):
+        lines.append(f"#   {count / max(samples, 1) * 100:5.1f}%  {name}")
+    lines.append("# collapsed stacks (flamegraph.pl / speedscope):")
+    lines.extend(f"{stack} {count}" for stack, count in stacks.most_common())
+    return "\n".join(lines) + "\n"
+
+
+async def _respond(writer, status, body, content_type="text/plain; charset=utf-8"):
+    data = body.encode("utf-8")
+    writer.write(
+        f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+        f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1") + data
+    )
+    await writer.drain()
+
+
+async def _serve(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) < 2 or parts[0] != "GET":
+            await _respond(writer, "405 Method Not Allowed", "GET only\n")
+            return
+        url = urllib.parse.urlsplit(parts[1])
+        query = urllib.parse.parse_qs(url.query)
+        if url.path == "/metrics":
+            await _respond(writer, "200 OK", render(), "text/plain; version=0.0.4; charset=utf-8")
+        elif url.path == "/debug/profile":
+            seconds = min(float(query.get("seconds", ["10"])[0]), PROFILE_MAX_SECONDS)
+            try:
+                text = await asyncio.to_thread(profile, seconds)
+            except RuntimeError as e:
+                await _respond(writer, "409 Conflict", f"{e}\n")
+                return
+            await _respond(writer, "200 OK", text)
+        else:
+            await _respond(writer, "404 Not Found", "/metrics, /debug/profile?seconds=N\n")
+    except (ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve():
+    if not METRICS_PORT:
+        return None
+    try:
+        server = await asyncio.start_server(_serve, METRICS_HOST, METRICS_PORT)
+    except OSError as e:
+        logger.warning("تعذر تشغيل خادم المقاييس على %s:%s: %s", METRICS_HOST, METRICS_PORT, e)
+        return None
+    logger.info("المقاييس متاحة على http://%s:%s/metrics", METRICS_HOST, METRICS_PORT)
+    return server
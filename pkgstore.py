@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import time
+
+import bytecode
+
+logger = logging.getLogger(__name__)
+
+CACHE = os.environ.get("PKG_CACHE", "pkg_cache/")
+WHEELS = os.path.join(CACHE, "wheels")
+STORE = os.path.join(CACHE, "store")
+INDEX = os.path.join(CACHE, "index.json")
+INDEX_TTL = int(os.environ.get("PKG_INDEX_TTL", str(24 * 3600)))
+ENABLED = os.environ.get("SHARED_STORE", "1") != "0"
+
+_lock = asyncio.Lock()
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _load_index():
+    if not os.path.exists(INDEX):
+        return {}
+    try:
+        with open(INDEX, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        logger.warning("فهرس الحزم تالف، سيتم إنشاؤه من جديد")
+        return {}
+
+
+def _save_index(index):
+    fd, tmp = tempfile.mkstemp(dir=CACHE, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp, INDEX)
+
+
+def request_key(packages=(), requirements=None):
+    if requirements:
+        return "req:" + _sha256(requirements)
+    return "pkg:" + " ".join(sorted(p.strip().lower() for p in packages))
+
+
+def entry_name(wheel_path):
+    name = os.path.basename(wheel_path)[:-len(".whl")]
+    return f"{name}-{_sha256(wheel_path)[:16]}"
+
+
+def _link_tree(src, dst):
+    count = 0
+    for root, dirs, files in os.walk(src):
+        rel = os.path.relpath(root, src)
+        target_dir = os.path.join(dst, rel) if rel != "." else dst
+        os.makedirs(target_dir, exist_ok=True)
+        for name in files:
+            target = os.path.join(target_dir, name)
+            source = os.path.join(root, name)
+            if os.path.lexists(target):
+                try:
+                    if os.path.samefile(source, target):
+                        continue
+                except OSError:
+                    pass
+                os.remove(target)
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copy2(source, target)
+            count += 1
+    return count
+
+
+def link_entries(entries, bot_path):
+    return sum(_link_tree(os.path.join(STORE, e), bot_path) for e in entries)
+
+
+def _freeze(path):
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            p = os.path.join(root, name)
+            os.chmod(p, os.stat(p).st_mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+async def _store_wheel(job, wheel):
+    entry = entry_name(wheel)
+    dest = os.path.join(STORE, entry)
+    if os.path.isdir(dest):
+        return entry
+    tmp = tempfile.mkdtemp(dir=STORE, prefix=".tmp-")
+    code = await job.exec(
+        "pip", "install", "--no-deps", "--no-index", "--no-compile",
+        "--target", tmp, wheel
+    )
+    if code != 0:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise RuntimeError(f"تعذر فك {os.path.basename(wheel)}")
+    await asyncio.to_thread(bytecode.compile_tree, tmp)
+    await asyncio.to_thread(_freeze, tmp)
+    try:
+        os.rename(tmp, dest)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return entry
+
+
+async def _build_wheels(job, args):
+    build_dir = tempfile.mkdtemp(dir=CACHE, prefix=".build-")
+    try:
+        base = ["pip", "wheel", "--wheel-dir", build_dir, "--find-links", WHEELS]
+        code = await job.exec(*base, "--no-index", *args)
+        if code != 0:
+            job.log("🌐 تنزيل الحزم غير الموجودة في الذاكرة المؤقتة...")
+            code = await job.exec(*base, *args)
+        if code != 0:
+            return None
+        wheels = []
+        for name in sorted(os.listdir(build_dir)):
+            if not name.endswith(".whl"):
+                continue
+            cached = os.path.join(WHEELS, name)
+            if not os.path.exists(cached):
+                os.replace(os.path.join(build_dir, name), cached)
+            wheels.append(cached)
+        return wheels
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+
+async def install(job, bot_path, packages=(), requirements=None):
+    os.makedirs(WHEELS, exist_ok=True)
+    os.makedirs(STORE, exist_ok=True)
+    key = request_key(packages, requirements)
+
+    async with _lock:
+        known = _load_index().get(key)
+    if known and time.time() - known["time"] < INDEX_TTL:
+        entries = known["entries"]
+        if all(os.path.isdir(os.path.join(STORE, e)) for e in entries):
+            count = await asyncio.to_thread(link_entries, entries, bot_path)
+            job.log(f"⚡ من المخزن المشترك: {len(entries)} حزمة ({count} ملف)")
+            return True
+
+    args = ["-r", requirements] if requirements else list(packages)
+    wheels = await _build_wheels(job, args)
+    if wheels is None:
+        return False
+
+    entries = []
+    for wheel in wheels:
+        entries.append(await _store_wheel(job, wheel))
+    count = await asyncio.to_thread(link_entries, entries, bot_path)
+    job.log(f"🔗 تم ربط {len(entries)} حزمة ({count} ملف)")
+
+    async with _lock:
+        index = _load_index()
+        index[key] = {"entries": entries, "time": time.time()}
+        await asyncio.to_thread(_save_index, index)
+    return True
+
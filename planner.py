@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+from unpack import STATE_DIR
+
+STATE_FILE = "requirements.json"
+
+_name_re = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)")
+
+
+class Plan:
+    def __init__(self, digest, specs, changed, full):
+        self.digest = digest
+        self.specs = specs
+        self.changed = changed
+        self.full = full
+
+    @property
+    def up_to_date(self):
+        return not self.full and not self.changed
+
+
+def canonical(name):
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def parse(text):
+    specs = {}
+    options = False
+    for raw in text.splitlines():
+        line = raw.split(" #", 1)[0].strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("-"):
+            options = True
+            continue
+        match = _name_re.match(line)
+        if not match:
+            options = True
+            continue
+        specs[canonical(match.group(1))] = " ".join(line.split())
+    return specs, options
+
+
+def _state_path(bot_path):
+    return os.path.join(bot_path, STATE_DIR, STATE_FILE)
+
+
+def load_state(bot_path):
+    try:
+        with open(_state_path(bot_path), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def plan(bot_path, req_file, force=False):
+    with open(req_file, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    specs, options = parse(data.decode("utf-8", errors="replace"))
+    state = load_state(bot_path)
+
+    if force or not state:
+        return Plan(digest, specs, list(specs.values()), True)
+    if state.get("hash") == digest:
+        return Plan(digest, specs, [], False)
+    if options:
+        return Plan(digest, specs, list(specs.values()), True)
+
+    installed = state.get("specs", {})
+    changed = [line for name, line in specs.items() if installed.get(name) != line]
+    return Plan(digest, specs, changed, False)
+
+
+def record(bot_path, result):
+    state_dir = os.path.join(bot_path, STATE_DIR)
+    os.makedirs(state_dir, exist_ok=True)
+    previous = load_state(bot_path).get("specs", {})
+    previous.update(result.specs)
+    fd, tmp = tempfile.mkstemp(dir=state_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump({"hash": result.digest, "specs": result.specs if result.full else previous}, f)
+    os.replace(tmp, _state_path(bot_path))
+
@@ -0,0 +1,51 @@
+import os
+
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def read_stat(pid):
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            data = f.read()
+    except OSError:
+        return None
+    fields = data.rsplit(")", 1)[1].split()
+    return {
+        "state": fields[0],
+        "utime": int(fields[11]),
+        "stime": int(fields[12]),
+        "threads": int(fields[17]),
+        "starttime": int(fields[19]),
+        "rss": int(fields[21]) * PAGE_SIZE,
+    }
+
+
+def start_ticks(pid):
+    stat = read_stat(pid)
+    if not stat or stat["state"] in ("Z", "X"):
+        return None
+    return stat["starttime"]
+
+
+def cpu_seconds(stat):
+    return (stat["utime"] + stat["stime"]) / CLK_TCK
+
+
+def fd_count(pid):
+    try:
+        return len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        return None
+
+
+def read_io(pid):
+    result = {}
+    try:
+        with open(f"/proc/{pid}/io", "r") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                result[name] = int(value)
+    except (OSError, ValueError):
+        return None
+    return result
@@ -0,0 +1,326 @@
+import asyncio
+import collections
+import contextlib
+import contextvars
+import datetime
+import heapq
+import itertools
+import logging
+import os
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+RATE_GLOBAL = float(os.environ.get("RATE_GLOBAL", "30"))
+RATE_CHAT = float(os.environ.get("RATE_CHAT", "1"))
+RATE_CHAT_BURST = int(os.environ.get("RATE_CHAT_BURST", "3"))
+RATE_GROUP_PER_MINUTE = float(os.environ.get("RATE_GROUP_PER_MINUTE", "20"))
+RATE_MAX_RETRIES = int(os.environ.get("RATE_MAX_RETRIES", "3"))
+SENT_CACHE = int(os.environ.get("RATE_SENT_CACHE", "10000"))
+
+NORMAL = 0
+LOW = 1
+
+EDITS = ("editMessageText", "editMessageReplyMarkup")
+ENABLED = os.environ.get("RATE_LIMIT", "1") == "1"
+
+_priority = contextvars.ContextVar("ratelimit_priority", default=NORMAL)
+
+
+def _retry_seconds(error):
+    delay = error.retry_after
+    return delay.total_seconds() if isinstance(delay, datetime.timedelta) else float(delay)
+
+
+@contextlib.contextmanager
+def low_priority():
+    token = _priority.set(LOW)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class Bucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = None
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        if self.updated is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_at(self, now):
+        self._refill(now)
+        if self.tokens >= 1:
+            return max(now, self.blocked_until)
+        return max(now + (1 - self.tokens) / self.rate, self.blocked_until)
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class Request:
+    def __init__(self, priority, seq, endpoint, data, callback, args, kwargs):
+        self.priority = priority
+        self.seq = seq
+        self.endpoint = endpoint
+        self.data = data
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.waiters = [asyncio.get_running_loop().create_future()]
+        self.retries = 0
+        self.queued = True
+        self.content = None
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def resolve(self, result=None, error=None):
+        for waiter in self.waiters:
+            if waiter.done():
+                continue
+            if error is not None:
+                waiter.set_exception(error)
+            else:
+                waiter.set_result(result)
+
+
+def _markup(data):
+    markup = data.get("reply_markup")
+    return markup.to_json() if hasattr(markup, "to_json") else markup
+
+
+def _text(data):
+    entities = data.get("entities")
+    return (data.get("text"), data.get("parse_mode"), str(entities) if entities else None)
+
+
+class Limiter(BaseRateLimiter):
+    def __init__(self, global_rate=RATE_GLOBAL, chat_rate=RATE_CHAT, chat_burst=RATE_CHAT_BURST,
+                 group_per_minute=RATE_GROUP_PER_MINUTE, max_retries=RATE_MAX_RETRIES):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_per_minute / 60
+        self.max_retries = max_retries
+        self.global_bucket = Bucket(global_rate, max(1, int(global_rate)))
+        self.chats = {}
+        self.sent = collections.OrderedDict()
+        self.stats = collections.Counter()
+        self._queue = []
+        self._edits = {}
+        self._inflight = set()
+        self._sending = set()
+        self._seq = itertools.count()
+        self._wake = None
+        self._task = None
+
+    async def initialize(self):
+        if self._task is not None:
+            return
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def shutdown(self):
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        for request in self._queue:
+            if request.queued:
+                request.resolve(error=asyncio.CancelledError())
+        self._queue.clear()
+        self._edits.clear()
+
+    def _bucket(self, chat_id):
+        bucket = self.chats.get(chat_id)
+        if bucket is None:
+            if isinstance(chat_id, int) and chat_id < 0:
+                bucket = Bucket(self.group_rate, self.chat_burst)
+            else:
+                bucket = Bucket(self.chat_rate, self.chat_burst)
+            self.chats[chat_id] = bucket
+        return bucket
+
+    def _edit_key(self, endpoint, data):
+        if endpoint in EDITS and data.get("chat_id") is not None and data.get("message_id") is not None:
+            return (data["chat_id"], data["message_id"])
+        return None
+
+    def _unchanged(self, request, key):
+        sent = self.sent.get(key)
+        if sent is None:
+            return False
+        if request.endpoint == "editMessageText":
+            return sent == request.content
+        return sent[1] == request.content[1]
+
+    def _remember(self, request, result):
+        if request.endpoint == "sendMessage" and isinstance(result, dict):
+            key = (request.data["chat_id"], result.get("message_id"))
+        else:
+            key = self._edit_key(request.endpoint, request.data)
+        if key is None:
+            return
+        if request.endpoint == "editMessageReplyMarkup":
+            previous = self.sent.get(key)
+            if previous is None:
+                return
+            value = (previous[0], request.content[1])
+        elif request.endpoint in ("sendMessage", "editMessageText"):
+            value = request.content
+        else:
+            return
+        self.sent[key] = value
+        self.sent.move_to_end(key)
+        while len(self.sent) > SENT_CACHE:
+            self.sent.popitem(last=False)
+
+    async def _direct(self, callback, args, kwargs, endpoint):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.stats["retry_after"] += 1
+                logger.warning("حد الإرسال في تيليجرام (%s)، انتظار %.1f ث", endpoint, _retry_seconds(e))
+                await asyncio.sleep(_retry_seconds(e) + 0.1)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if data.get("chat_id") is None:
+            return await self._direct(callback, args, kwargs, endpoint)
+        priority = rate_limit_args if isinstance(rate_limit_args, int) else _priority.get()
+
+        key = self._edit_key(endpoint, data)
+        pending = self._edits.get(key) if key else None
+        if pending is not None and pending.queued and pending.endpoint == endpoint:
+            waiter = asyncio.get_running_loop().create_future()
+            pending.waiters.append(waiter)
+            pending.data = data
+            pending.args = args
+            pending.kwargs = kwargs
+            pending.priority = min(pending.priority, priority)
+            pending.seq = next(self._seq)
+            heapq.heapify(self._queue)
+            self.stats["coalesced"] += 1
+            self._wake.set()
+            return await waiter
+
+        request = Request(priority, next(self._seq), endpoint, data, callback, args, kwargs)
+        if key:
+            self._edits[key] = request
+        heapq.heappush(self._queue, request)
+        self._wake.set()
+        return await request.waiters[0]
+
+    def _take_next(self, now):
+        wait = None
+        skipped = []
+        chosen = None
+        while self._queue:
+            request = heapq.heappop(self._queue)
+            if not request.queued:
+                continue
+            if self._edit_key(request.endpoint, request.data) in self._inflight:
+                skipped.append(request)
+                continue
+            ready = self._bucket(request.data["chat_id"]).ready_at(now)
+            if ready <= now:
+                chosen = request
+                break
+            skipped.append(request)
+            wait = ready - now if wait is None else min(wait, ready - now)
+        for request in skipped:
+            heapq.heappush(self._queue, request)
+        return chosen, wait
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            ready = self.global_bucket.ready_at(now)
+            if ready > now:
+                wait = ready - now
+            else:
+                request, wait = self._take_next(now)
+                if request is not None:
+                    request.queued = False
+                    key = self._edit_key(request.endpoint, request.data)
+                    if key and self._edits.get(key) is request:
+                        del self._edits[key]
+                    if request.endpoint in ("sendMessage",) + EDITS:
+                        request.content = (_text(request.data), _markup(request.data))
+                    if key and self._unchanged(request, key):
+                        self.stats["unchanged"] += 1
+                        request.resolve(True)
+                        continue
+                    self.global_bucket.take(now)
+                    self._bucket(request.data["chat_id"]).take(now)
+                    if key:
+                        self._inflight.add(key)
+                    task = asyncio.create_task(self._send(request))
+                    self._sending.add(task)
+                    task.add_done_callback(self._sending.discard)
+                    continue
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _send(self, request):
+        key = self._edit_key(request.endpoint, request.data)
+        try:
+            result = await request.callback(*request.args, **request.kwargs)
+        except RetryAfter as e:
+            self._retry(request, e)
+            return
+        except Exception as e:
+            request.resolve(error=e)
+            return
+        finally:
+            self._inflight.discard(key)
+            self._wake.set()
+        self.stats["sent"] += 1
+        self._remember(request, result)
+        request.resolve(result)
+
+    def _retry(self, request, error):
+        delay = _retry_seconds(error) + 0.1
+        self.stats["retry_after"] += 1
+        bucket = self._bucket(request.data["chat_id"])
+        bucket.blocked_until = max(bucket.blocked_until, asyncio.get_running_loop().time() + delay)
+        logger.warning("حد الإرسال في تيليجرام (%s)، انتظار %.1f ث", request.endpoint, delay)
+
+        request.retries += 1
+        if request.retries > self.max_retries:
+            request.resolve(error=error)
+            return
+        key = self._edit_key(request.endpoint, request.data)
+        newer = self._edits.get(key) if key else None
+        if newer is not None and newer.queued and newer.endpoint == request.endpoint:
+            newer.waiters.extend(request.waiters)
+            return
+        request.queued = True
+        if key:
+            self._edits[key] = request
+        heapq.heappush(self._queue, request)
+        self._wake.set()
+
+    def collect_metrics(self):
+        return [
+            ("manager_outbound_queue", "gauge", "Bot API requests waiting in the rate limiter.",
+             [({}, sum(1 for request in self._queue if request.queued))]),
+            ("manager_outbound_requests_total", "counter", "Rate limiter outcomes.",
+             [({"outcome": outcome}, count) for outcome, count in sorted(self.stats.items())]),
+        ]
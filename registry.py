@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+REGISTRY = os.environ.get("REGISTRY", "processes.db")
+LEGACY_DB = os.environ.get("DB", "processes.json")
+
+COLUMNS = {
+    "pid": "INTEGER",
+    "started": "REAL",
+    "start_ticks": "INTEGER",
+    "exit_code": "INTEGER",
+    "restarts": "INTEGER",
+    "state": "TEXT",
+    "agent": "TEXT",
+    "autostart": "INTEGER",
+}
+
+_conn = None
+_lock = threading.RLock()
+
+
+def _connect():
+    conn = sqlite3.connect(REGISTRY, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS bots ("
+        "user_id TEXT NOT NULL, bot_name TEXT NOT NULL, "
+        "PRIMARY KEY (user_id, bot_name)) WITHOUT ROWID"
+    )
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    existing = {row["name"] for row in conn.execute("PRAGMA table_info(bots)")}
+    for name, kind in COLUMNS.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE bots ADD COLUMN {name} {kind}")
+    return conn
+
+
+def _migrate_legacy(conn):
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_migrated'").fetchone():
+        return
+    rows = []
+    if os.path.exists(LEGACY_DB):
+        try:
+            with open(LEGACY_DB, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            logger.warning("تعذر قراءة %s، تم تجاهله", LEGACY_DB)
+            data = {}
+        for key, pid in data.items():
+            user_id, sep, bot_name = key.partition("_")
+            if not sep or not bot_name or not isinstance(pid, int):
+                continue
+            rows.append((user_id, bot_name, pid))
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            "INSERT OR IGNORE INTO bots (user_id, bot_name, pid) VALUES (?, ?, ?)", rows
+        )
+        conn.execute("INSERT INTO meta (key, value) VALUES ('legacy_migrated', ?)", (LEGACY_DB,))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if rows:
+        logger.info("تم ترحيل %d عملية من %s إلى %s", len(rows), LEGACY_DB, REGISTRY)
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        with _lock:
+            if _conn is None:
+                conn = _connect()
+                _migrate_legacy(conn)
+                _conn = conn
+    return _conn
+
+
+def get(user_id, bot_name):
+    with _lock:
+        row = _db().execute(
+            "SELECT * FROM bots WHERE user_id = ? AND bot_name = ?", (user_id, bot_name)
+        ).fetchone()
+    return dict(row) if row else None
+
+
+def user_bots(user_id):
+    with _lock:
+        rows = _db().execute("SELECT * FROM bots WHERE user_id = ?", (user_id,)).fetchall()
+    return {row["bot_name"]: dict(row) for row in rows}
+
+
+def all_bots():
+    with _lock:
+        rows = _db().execute("SELECT * FROM bots").fetchall()
+    return [dict(row) for row in rows]
+
+
+def update(user_id, bot_name, **fields):
+    unknown = set(fields) - set(COLUMNS)
+    if unknown:
+        raise KeyError(f"أعمدة غير معروفة: {', '.join(sorted(unknown))}")
+    names = ["user_id", "bot_name"] + list(fields)
+    placeholders = ", ".join("?" for _ in names)
+    assignments = ", ".join(f"{name} = excluded.{name}" for name in fields) or "user_id = user_id"
+    with _lock:
+        _db().execute(
+            f"INSERT INTO bots ({', '.join(names)}) VALUES ({placeholders}) "
+            f"ON CONFLICT (user_id, bot_name) DO UPDATE SET {assignments}",
+            [user_id, bot_name] + list(fields.values())
+        )
+
+
+def delete(user_id, bot_name):
+    with _lock:
+        _db().execute("DELETE FROM bots WHERE user_id = ? AND bot_name = ?", (user_id, bot_name))
+
+
+def close():
+    global _conn
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import os
+import secrets
+import shutil
+import time
+
+import cluster
+import fsindex
+import supervisor
+import unpack
+
+logger = logging.getLogger(__name__)
+
+RELEASES_DIR = ".releases"
+RELEASES_KEEP = int(os.environ.get("RELEASES_KEEP", "3"))
+INCOMING_PREFIX = ".incoming-"
+
+_staged = {}
+
+
+class HealthCheckFailed(RuntimeError):
+    pass
+
+
+def root(bot_path):
+    parent, name = os.path.split(os.path.normpath(bot_path))
+    return os.path.join(parent, RELEASES_DIR, name)
+
+
+def current(bot_path):
+    if not os.path.islink(bot_path):
+        return None
+    return os.path.basename(os.path.realpath(bot_path))
+
+
+def names(bot_path):
+    try:
+        return sorted(n for n in os.listdir(root(bot_path)) if not n.startswith("."))
+    except FileNotFoundError:
+        return []
+
+
+def incoming(bot_path, suffix):
+    os.makedirs(root(bot_path), exist_ok=True)
+    return os.path.join(root(bot_path), f"{INCOMING_PREFIX}{secrets.token_hex(4)}{suffix}")
+
+
+def _point(bot_path, name):
+    parent, base = os.path.split(os.path.normpath(bot_path))
+    target = os.path.relpath(os.path.join(root(bot_path), name), parent)
+    tmp = os.path.join(parent, f".{base}.{secrets.token_hex(4)}.tmp")
+    os.symlink(target, tmp)
+    os.replace(tmp, bot_path)
+    fsindex.forget(bot_path)
+
+
+def _adopt(bot_path):
+    if os.path.islink(bot_path) or not os.path.isdir(bot_path):
+        return
+    name = _new_name()
+    os.makedirs(root(bot_path), exist_ok=True)
+    os.rename(bot_path, os.path.join(root(bot_path), name))
+    _point(bot_path, name)
+    logger.info("تم تحويل %s إلى إصدارات (%s)", bot_path, name)
+
+
+def _new_name():
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() // 1000 % 1000000:06d}"
+
+
+def _link(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def new(bot_path):
+    _adopt(bot_path)
+    os.makedirs(root(bot_path), exist_ok=True)
+    return os.path.join(root(bot_path), _new_name())
+
+
+def stage(bot_path):
+    release = new(bot_path)
+    if os.path.isdir(bot_path):
+        shutil.copytree(
+            os.path.realpath(bot_path), release, symlinks=True, copy_function=_link,
+            ignore=shutil.ignore_patterns(supervisor.READY_FILE)
+        )
+    else:
+        os.makedirs(release)
+    _staged[release] = _inodes(release)
+    return release
+
+
+def _inodes(path):
+    found = {}
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [d for d in dirs if d != unpack.STATE_DIR or root != path]
+        for name in files:
+            full = os.path.join(root, name)
+            try:
+                found[os.path.relpath(full, path)] = os.lstat(full).st_ino
+            except FileNotFoundError:
+                continue
+    return found
+
+
+def _carry(old, release, staged):
+    carried = 0
+    for rel, ino in _inodes(old).items():
+        if os.path.basename(rel) == supervisor.READY_FILE:
+            continue
+        target = os.path.join(release, rel)
+        try:
+            current_ino = os.lstat(target).st_ino
+        except FileNotFoundError:
+            current_ino = None
+        if current_ino == ino or (current_ino is None and rel in staged) or current_ino not in (None, staged.get(rel)):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f"{target}.{secrets.token_hex(4)}.tmp"
+        source = os.path.join(old, rel)
+        try:
+            if os.path.islink(source):
+                os.symlink(os.readlink(source), tmp)
+            else:
+                _link(source, tmp)
+        except FileNotFoundError:
+            continue
+        os.replace(tmp, target)
+        carried += 1
+    return carried
+
+
+def discard(release):
+    _staged.pop(release, None)
+    shutil.rmtree(release, ignore_errors=True)
+
+
+def prune(bot_path, keep=RELEASES_KEEP):
+    active = current(bot_path)
+    removed = 0
+    for name in names(bot_path)[:-keep or None]:
+        if name != active:
+            discard(os.path.join(root(bot_path), name))
+            removed += 1
+    return removed
+
+
+def previous(bot_path):
+    all_names = names(bot_path)
+    active = current(bot_path)
+    if active not in all_names:
+        return None
+    index = all_names.index(active)
+    return all_names[index - 1] if index else None
+
+
+async def _restart(user_id, bot_name, bot_path):
+    if not cluster.ENABLED:
+        return await supervisor.replace(user_id, bot_name)
+    if cluster.states(user_id, [bot_name])[bot_name] not in cluster.ACTIVE:
+        return None
+    await cluster.stop(user_id, bot_name)
+    await cluster.start(user_id, bot_name, bot_path)
+    return True
+
+
+async def activate(user_id, bot_name, bot_path, name):
+    before = current(bot_path)
+    release = os.path.join(root(bot_path), name)
+    staged = _staged.pop(release, None)
+    if staged is not None and before:
+        carried = await asyncio.to_thread(_carry, os.path.join(root(bot_path), before), release, staged)
+        if carried:
+            logger.info("%s/%s: نقل %d ملف كتبه البوت أثناء التجهيز", user_id, bot_name, carried)
+    _point(bot_path, name)
+    if await _restart(user_id, bot_name, bot_path) is False:
+        if before:
+            _point(bot_path, before)
+            if not cluster.ENABLED:
+                await supervisor.start(user_id, bot_name, bot_path)
+        raise HealthCheckFailed(name)
+    logger.info("%s/%s: الإصدار الحالي %s (السابق %s)", user_id, bot_name, name, before or "-")
+    await asyncio.to_thread(prune, bot_path)
+    return before
+
+
+async def rollback(user_id, bot_name, bot_path):
+    name = previous(bot_path)
+    if name is None:
+        return None
+    await activate(user_id, bot_name, bot_path, name)
+    return name
+
+
+def remove(bot_path):
+    if os.path.islink(bot_path):
+        os.remove(bot_path)
+        fsindex.forget(bot_path)
+    elif os.path.isdir(bot_path):
+        shutil.rmtree(bot_path)
+    shutil.rmtree(root(bot_path), ignore_errors=True)
@@ -0,0 +1,58 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Action:
+    def __init__(self, name, func, parse=None, needs_bot=False):
+        self.name = name
+        self.func = func
+        self.parse = parse
+        self.needs_bot = needs_bot
+
+
+class Router:
+    def __init__(self, observe=None):
+        self.exact = {}
+        self.prefixes = {}
+        self.stats = {}
+        self.observe = observe
+
+    def action(self, name, parse=None, needs_bot=False):
+        def register(func):
+            action = Action(name, func, parse, needs_bot)
+            table = self.prefixes if parse else self.exact
+            if name in table:
+                raise ValueError(f"duplicate callback action {name!r}")
+            table[name] = action
+            return func
+        return register
+
+    def resolve(self, data):
+        action = self.exact.get(data)
+        if action is not None:
+            return action, None
+        found = None
+        end = data.find("_")
+        while end != -1:
+            found = self.prefixes.get(data[:end + 1], found)
+            end = data.find("_", end + 1)
+        if found is None:
+            return None, None
+        try:
+            return found, found.parse(data[len(found.name):])
+        except ValueError:
+            return None, None
+
+    async def run(self, action, *args):
+        start = time.perf_counter()
+        try:
+            await action.func(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            stat = self.stats.setdefault(action.name, [0, 0.0])
+            stat[0] += 1
+            stat[1] += elapsed
+            if self.observe:
+                self.observe(action.name, elapsed)
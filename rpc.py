@@ -0,0 +1,222 @@
+import asyncio
+import hmac
+import itertools
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+RPC_TIMEOUT = float(os.environ.get("RPC_TIMEOUT", "30"))
+LINE_LIMIT = 1024 * 1024
+
+
+class RemoteError(RuntimeError):
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind
+
+
+class Unavailable(ConnectionError):
+    pass
+
+
+class Binary:
+    def __init__(self, result, data):
+        self.result = result
+        self.data = data
+
+
+def parse_address(address):
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    if address.startswith("tcp:"):
+        address = address[len("tcp:"):]
+    host, _, port = address.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+
+async def open_connection(address):
+    kind, target = parse_address(address)
+    if kind == "unix":
+        return await asyncio.open_unix_connection(target, limit=LINE_LIMIT)
+    return await asyncio.open_connection(*target, limit=LINE_LIMIT)
+
+
+async def start_server(handler, address):
+    kind, target = parse_address(address)
+    if kind == "unix":
+        if os.path.exists(target):
+            os.remove(target)
+        return await asyncio.start_unix_server(handler, target, limit=LINE_LIMIT)
+    return await asyncio.start_server(handler, *target, limit=LINE_LIMIT)
+
+
+async def read_message(reader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionResetError("connection closed")
+    header = json.loads(line)
+    size = header.pop("size", None)
+    data = await reader.readexactly(size) if size is not None else None
+    return header, data
+
+
+def write_message(writer, header, data=None):
+    if data is not None:
+        header = dict(header, size=len(data))
+    writer.write(json.dumps(header).encode("utf-8") + b"\n")
+    if data:
+        writer.write(data)
+
+
+class Client:
+    def __init__(self, name, address, token="", on_event=None):
+        self.name = name
+        self.address = address
+        self.token = token
+        self.on_event = on_event
+        self.info = None
+        self._writer = None
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._lock = asyncio.Lock()
+
+    @property
+    def connected(self):
+        return self._writer is not None
+
+    async def _connect(self):
+        async with self._lock:
+            if self._writer is not None:
+                return
+            reader, writer = await asyncio.wait_for(open_connection(self.address), RPC_TIMEOUT)
+            write_message(writer, {"hello": self.token})
+            await writer.drain()
+            header, _ = await asyncio.wait_for(read_message(reader), RPC_TIMEOUT)
+            if "error" in header:
+                writer.close()
+                raise Unavailable(f"{self.name}: {header['error'].get('message')}")
+            self.info = header.get("result")
+            self._writer = writer
+            asyncio.create_task(self._read(reader, writer))
+
+    async def _read(self, reader, writer):
+        try:
+            while True:
+                header, data = await read_message(reader)
+                if "event" in header:
+                    if self.on_event:
+                        self.on_event(self.name, header)
+                    continue
+                future = self._pending.pop(header.get("id"), None)
+                if future is None or future.done():
+                    continue
+                if "error" in header:
+                    error = header["error"]
+                    future.set_exception(RemoteError(error.get("type"), error.get("message")))
+                else:
+                    future.set_result((header.get("result"), data))
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            logger.warning("انقطع الاتصال بالعامل %s: %s", self.name, e)
+        finally:
+            if self._writer is writer:
+                self._writer = None
+            writer.close()
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(Unavailable(f"{self.name} disconnected"))
+            self._pending.clear()
+
+    async def call_data(self, method, data=None, timeout=RPC_TIMEOUT, **params):
+        try:
+            await self._connect()
+        except (OSError, asyncio.TimeoutError, ValueError) as e:
+            raise Unavailable(f"{self.name}: {e}") from e
+        writer = self._writer
+        if writer is None:
+            raise Unavailable(f"{self.name} disconnected")
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            write_message(writer, {"id": request_id, "method": method, "params": params}, data)
+            await writer.drain()
+            return await asyncio.wait_for(future, timeout)
+        except ConnectionError as e:
+            raise Unavailable(f"{self.name}: {e}") from e
+        except asyncio.TimeoutError:
+            raise Unavailable(f"{self.name}: {method} timed out") from None
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def call(self, method, data=None, timeout=RPC_TIMEOUT, **params):
+        result, _ = await self.call_data(method, data, timeout, **params)
+        return result
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class Server:
+    def __init__(self, handlers, token="", hello=None):
+        self.handlers = handlers
+        self.token = token
+        self.hello = hello
+        self.connections = set()
+        self._tasks = set()
+
+    async def handle(self, reader, writer):
+        try:
+            header, _ = await asyncio.wait_for(read_message(reader), RPC_TIMEOUT)
+            if "hello" not in header or not hmac.compare_digest(str(header["hello"]).encode(), self.token.encode()):
+                write_message(writer, {"error": {"type": "auth", "message": "bad token"}})
+                await writer.drain()
+                return
+            write_message(writer, {"result": self.hello() if self.hello else None})
+            await writer.drain()
+            self.connections.add(writer)
+            while True:
+                header, data = await read_message(reader)
+                task = asyncio.create_task(self._dispatch(writer, header, data))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, writer, header, data):
+        method = header.get("method")
+        reply = {"id": header.get("id")}
+        payload = None
+        try:
+            handler = self.handlers.get(method)
+            if handler is None:
+                raise LookupError(f"unknown method {method!r}")
+            params = header.get("params") or {}
+            if data is not None:
+                params["data"] = data
+            result = await handler(**params)
+            if isinstance(result, Binary):
+                result, payload = result.result, result.data
+            reply["result"] = result
+        except Exception as e:
+            if not isinstance(e, (LookupError, OSError, ValueError, RuntimeError)):
+                logger.exception("فشل تنفيذ %s", method)
+            reply["error"] = {"type": type(e).__name__, "message": str(e)}
+        try:
+            write_message(writer, reply, payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    def broadcast(self, event, **fields):
+        for writer in list(self.connections):
+            try:
+                write_message(writer, dict(fields, event=event))
+            except (ConnectionError, RuntimeError):
+                self.connections.discard(writer)
@@ -0,0 +1,206 @@
+import asyncio
+import collections
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+SESSIONS = os.environ.get("SESSIONS", "sessions.db")
+SESSION_FLUSH_INTERVAL = float(os.environ.get("SESSION_FLUSH_INTERVAL", "30"))
+SESSION_CACHE_USERS = int(os.environ.get("SESSION_CACHE_USERS", "10000"))
+SESSION_IDLE = float(os.environ.get("SESSION_IDLE", "3600"))
+ENABLED = bool(SESSIONS)
+
+USER = "user"
+CHAT = "chat"
+BOT = "bot"
+
+
+class Store:
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _db(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS data ("
+                "kind TEXT NOT NULL, key INTEGER NOT NULL, value TEXT NOT NULL, updated REAL, "
+                "PRIMARY KEY (kind, key)) WITHOUT ROWID"
+            )
+            self._conn = conn
+        return self._conn
+
+    def load(self, kind, key):
+        with self._lock:
+            row = self._db().execute("SELECT value FROM data WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def write(self, items, deleted=()):
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT INTO data (kind, key, value, updated) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (kind, key) DO UPDATE SET value = excluded.value, updated = excluded.updated",
+                    [(kind, key, json.dumps(value, default=str), now) for (kind, key), value in items]
+                )
+                conn.executemany("DELETE FROM data WHERE kind = ? AND key = ?", list(deleted))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class Persistence(BasePersistence):
+    def __init__(self):
+        super().__init__(
+            store_data=PersistenceInput(user_data=True, chat_data=True, bot_data=True, callback_data=False),
+            update_interval=SESSION_FLUSH_INTERVAL
+        )
+        self.store = Store(SESSIONS)
+        self._pending = {}
+        self._deleted = set()
+        self._writer = None
+        self._loaded = {USER: collections.OrderedDict(), CHAT: collections.OrderedDict()}
+        self._saved = {}
+        self.loads = 0
+        self.writes = 0
+
+    async def get_user_data(self):
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return self.store.load(BOT, 0) or {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    def _refresh(self, kind, key, data):
+        loaded = self._loaded[kind]
+        if key in loaded:
+            loaded.move_to_end(key)
+            loaded[key] = (time.monotonic(), data)
+            return
+        saved = self._pending.get((kind, key))
+        if saved is None and (kind, key) not in self._deleted:
+            saved = self.store.load(kind, key)
+            self.loads += 1
+        if saved and not data:
+            data.update(saved)
+        loaded[key] = (time.monotonic(), data)
+        self._evict(kind)
+
+    def _evict(self, kind):
+        loaded = self._loaded[kind]
+        excess = len(loaded) - SESSION_CACHE_USERS
+        if excess <= 0:
+            return
+        cutoff = time.monotonic() - SESSION_IDLE
+        victims = []
+        for key, (touched, data) in loaded.items():
+            if len(victims) >= excess or touched > cutoff:
+                break
+            if self._saved.get((kind, key), 0) >= touched:
+                victims.append((key, data))
+        for key, data in victims:
+            del loaded[key]
+            del self._saved[(kind, key)]
+            data.clear()
+
+    async def refresh_user_data(self, user_id, user_data):
+        self._refresh(USER, user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        self._refresh(CHAT, chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    def _stage(self, kind, key, value):
+        self._pending[(kind, key)] = value
+        self._deleted.discard((kind, key))
+        self._schedule()
+
+    def _drop(self, kind, key):
+        self._pending.pop((kind, key), None)
+        self._deleted.add((kind, key))
+        self._loaded.get(kind, {}).pop(key, None)
+        self._schedule()
+
+    def _schedule(self):
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.ensure_future(self._write())
+
+    async def _write(self):
+        await asyncio.sleep(0)
+        while self._pending or self._deleted:
+            items, self._pending = list(self._pending.items()), {}
+            deleted, self._deleted = self._deleted, set()
+            started = time.monotonic()
+            try:
+                await asyncio.to_thread(self.store.write, items, deleted)
+            except (sqlite3.Error, TypeError, ValueError):
+                logger.exception("تعذر حفظ %d جلسة", len(items))
+                for key, value in items:
+                    self._pending.setdefault(key, value)
+                self._deleted |= deleted
+                return
+            for key, _ in items:
+                self._saved[key] = started
+            self.writes += 1
+        self._evict(USER)
+        self._evict(CHAT)
+
+    async def update_user_data(self, user_id, data):
+        self._stage(USER, user_id, data)
+
+    async def update_chat_data(self, chat_id, data):
+        self._stage(CHAT, chat_id, data)
+
+    async def update_bot_data(self, data):
+        self._stage(BOT, 0, data)
+
+    async def drop_user_data(self, user_id):
+        self._drop(USER, user_id)
+
+    async def drop_chat_data(self, chat_id):
+        self._drop(CHAT, chat_id)
+
+    async def flush(self):
+        if self._writer is not None:
+            await self._writer
+        if self._pending or self._deleted:
+            self._schedule()
+            await self._writer
+        self.store.close()
@@ -0,0 +1,280 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import cluster
+import supervisor
+from unpack import STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOTS = os.environ.get("SNAPSHOTS", "snapshots/")
+CHUNKS = os.path.join(SNAPSHOTS, "chunks")
+CHUNK_SIZE = int(os.environ.get("SNAPSHOT_CHUNK_SIZE", str(1024 * 1024)))
+SNAPSHOT_KEEP = int(os.environ.get("SNAPSHOT_KEEP", "5"))
+SNAPSHOT_TRASH_DAYS = float(os.environ.get("SNAPSHOT_TRASH_DAYS", "14"))
+SNAPSHOT_GC_INTERVAL = float(os.environ.get("SNAPSHOT_GC_INTERVAL", "3600"))
+DELETED = "deleted"
+SYNCED = os.path.join(STATE_DIR, cluster.SYNC_STATE)
+
+CODECS = {
+    ".zst": (
+        (lambda data: zstandard.ZstdCompressor(level=3).compress(data)) if zstandard else None,
+        (lambda data: zstandard.ZstdDecompressor().decompress(data)) if zstandard else None,
+    ),
+    ".gz": (lambda data: gzip.compress(data, compresslevel=6, mtime=0), gzip.decompress),
+    ".raw": (bytes, bytes),
+}
+CODEC = ".zst" if zstandard else ".gz"
+
+_lock = threading.Lock()
+
+
+class Stats:
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.read = 0
+        self.chunks = 0
+        self.stored = 0
+
+    def __str__(self):
+        return (
+            f"{self.files} ملف، {self.bytes / 1024 / 1024:.1f}MB، قراءة {self.read / 1024 / 1024:.1f}MB، "
+            f"{self.chunks} قطعة جديدة ({self.stored / 1024 / 1024:.1f}MB مضغوط)"
+        )
+
+
+def bot_dir(user_id, bot_name):
+    return os.path.join(SNAPSHOTS, user_id, bot_name)
+
+
+def names(user_id, bot_name):
+    try:
+        return sorted(n[:-len(".json")] for n in os.listdir(bot_dir(user_id, bot_name)) if n.endswith(".json"))
+    except FileNotFoundError:
+        return []
+
+
+def manifest(user_id, bot_name, name):
+    with open(os.path.join(bot_dir(user_id, bot_name), f"{name}.json"), "r") as f:
+        return json.load(f)
+
+
+def _latest(user_id, bot_name):
+    for name in reversed(names(user_id, bot_name)):
+        try:
+            return manifest(user_id, bot_name, name)
+        except (OSError, ValueError):
+            continue
+    return None
+
+
+def _chunk_path(digest, suffix):
+    return os.path.join(CHUNKS, digest[:2], digest + suffix)
+
+
+def _find_chunk(digest):
+    for suffix in CODECS:
+        path = _chunk_path(digest, suffix)
+        if os.path.exists(path):
+            return path, suffix
+    return None, None
+
+
+def _put_chunk(data, stats):
+    digest = hashlib.sha256(data).hexdigest()
+    if _find_chunk(digest)[0]:
+        return digest
+    packed, suffix = CODECS[CODEC][0](data), CODEC
+    if len(packed) >= len(data):
+        packed, suffix = data, ".raw"
+    path = _chunk_path(digest, suffix)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(packed)
+    os.replace(tmp, path)
+    stats.chunks += 1
+    stats.stored += len(packed)
+    return digest
+
+
+def _get_chunk(digest):
+    path, suffix = _find_chunk(digest)
+    if path is None:
+        raise FileNotFoundError(f"قطعة مفقودة {digest}")
+    decompress = CODECS[suffix][1]
+    if decompress is None:
+        raise RuntimeError(f"zstandard غير مثبت لقراءة {digest}")
+    with open(path, "rb") as f:
+        return decompress(f.read())
+
+
+def _file_chunks(path, stats):
+    chunks = []
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(CHUNK_SIZE), b""):
+            stats.read += len(data)
+            chunks.append(_put_chunk(data, stats))
+    return chunks
+
+
+def _entries(path, previous, stats):
+    known = {e["path"]: e for e in previous.get("entries", [])} if previous else {}
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(dirs + files):
+            if name == supervisor.READY_FILE:
+                continue
+            full = os.path.join(root, name)
+            rel = os.path.relpath(full, path)
+            if rel == SYNCED:
+                continue
+            st = os.lstat(full)
+            entry = {"path": rel, "mode": stat.S_IMODE(st.st_mode), "mtime": st.st_mtime_ns}
+            if stat.S_ISLNK(st.st_mode):
+                entry.update(type="link", target=os.readlink(full))
+                if name in dirs:
+                    dirs.remove(name)
+            elif stat.S_ISDIR(st.st_mode):
+                entry["type"] = "dir"
+            elif stat.S_ISREG(st.st_mode):
+                entry.update(type="file", size=st.st_size)
+                old = known.get(rel)
+                if old and old.get("type") == "file" and (old["size"], old["mtime"]) == (st.st_size, st.st_mtime_ns) \
+                        and all(_find_chunk(d)[0] for d in old["chunks"]):
+                    entry["chunks"] = old["chunks"]
+                else:
+                    entry["chunks"] = _file_chunks(full, stats)
+                stats.files += 1
+                stats.bytes += st.st_size
+            else:
+                continue
+            yield entry
+
+
+def create(user_id, bot_name, bot_path, label=""):
+    stats = Stats()
+    start = time.monotonic()
+    with _lock:
+        previous = _latest(user_id, bot_name)
+        entries = list(_entries(os.path.realpath(bot_path), previous, stats))
+        name = time.strftime("%Y%m%d-%H%M%S") + f"-{time.time_ns() // 1000 % 1000000:06d}" + (f"-{label}" if label else "")
+        directory = bot_dir(user_id, bot_name)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"created": time.time(), "label": label, "entries": entries}, f)
+        os.replace(tmp, os.path.join(directory, f"{name}.json"))
+    logger.info("نسخة %s/%s %s: %s خلال %.2f ث", user_id, bot_name, name, stats, time.monotonic() - start)
+    return name, stats
+
+
+def restore(user_id, bot_name, name, dest):
+    with _lock:
+        return _restore(manifest(user_id, bot_name, name), dest)
+
+
+def _restore(data, dest):
+    os.makedirs(dest)
+    dirs = []
+    try:
+        for entry in data["entries"]:
+            if entry["path"] == SYNCED:
+                continue
+            target = os.path.join(dest, entry["path"])
+            if entry["type"] == "dir":
+                os.makedirs(target, exist_ok=True)
+                dirs.append((target, entry))
+            elif entry["type"] == "link":
+                os.symlink(entry["target"], target)
+            else:
+                with open(target, "wb") as f:
+                    for digest in entry["chunks"]:
+                        f.write(_get_chunk(digest))
+                os.chmod(target, entry["mode"])
+                os.utime(target, ns=(entry["mtime"], entry["mtime"]))
+        for target, entry in reversed(dirs):
+            os.chmod(target, entry["mode"])
+            os.utime(target, ns=(entry["mtime"], entry["mtime"]))
+    except Exception:
+        shutil.rmtree(dest, ignore_errors=True)
+        raise
+    return len(data["entries"])
+
+
+def deleted(user_id, live):
+    try:
+        bots = sorted(os.listdir(os.path.join(SNAPSHOTS, user_id)))
+    except FileNotFoundError:
+        return []
+    return [b for b in bots if b not in live and any(n.endswith(DELETED) for n in names(user_id, b))]
+
+
+def prune(user_id, bot_name, keep=SNAPSHOT_KEEP):
+    removed = 0
+    with _lock:
+        for name in names(user_id, bot_name)[:-keep or None]:
+            os.remove(os.path.join(bot_dir(user_id, bot_name), f"{name}.json"))
+            removed += 1
+    return removed
+
+
+def _expire(cutoff, exists):
+    for user_id in os.listdir(SNAPSHOTS):
+        if user_id == os.path.basename(CHUNKS):
+            continue
+        for bot_name in os.listdir(os.path.join(SNAPSHOTS, user_id)):
+            latest = names(user_id, bot_name)
+            if latest and latest[-1].endswith(DELETED) and not exists(user_id, bot_name) and os.path.getmtime(
+                os.path.join(bot_dir(user_id, bot_name), f"{latest[-1]}.json")
+            ) < cutoff:
+                shutil.rmtree(bot_dir(user_id, bot_name))
+                logger.info("انتهت صلاحية النسخة المحذوفة %s/%s", user_id, bot_name)
+
+
+def collect(exists, trash_days=SNAPSHOT_TRASH_DAYS):
+    if not os.path.isdir(SNAPSHOTS):
+        return 0
+    with _lock:
+        _expire(time.time() - trash_days * 86400, exists)
+        used = set()
+        for root, _, files in os.walk(SNAPSHOTS):
+            if root.startswith(CHUNKS):
+                continue
+            for name in files:
+                if name.endswith(".json"):
+                    with open(os.path.join(root, name), "r") as f:
+                        used.update(d for e in json.load(f)["entries"] for d in e.get("chunks", ()))
+        removed = 0
+        for root, _, files in os.walk(CHUNKS):
+            for name in files:
+                if name.split(".")[0] not in used:
+                    os.remove(os.path.join(root, name))
+                    removed += 1
+    return removed
+
+
+async def collector(exists):
+    while True:
+        try:
+            removed = await asyncio.to_thread(collect, exists)
+            if removed:
+                logger.info("تم حذف %d قطعة غير مستخدمة من النسخ الاحتياطية", removed)
+        except (OSError, ValueError) as e:
+            logger.warning("تعذر تنظيف النسخ الاحتياطية: %s", e)
+        await asyncio.sleep(SNAPSHOT_GC_INTERVAL)
@@ -0,0 +1,595 @@
+import asyncio
+import collections
+import logging
+import os
+import signal
+import subprocess
+import time
+
+import installer
+import limits
+import logs
+import metrics
+import registry
+import zygote
+import procfs
+from procfs import start_ticks
+
+logger = logging.getLogger(__name__)
+
+RESTART_BACKOFF = float(os.environ.get("RESTART_BACKOFF", "2"))
+RESTART_BACKOFF_MAX = float(os.environ.get("RESTART_BACKOFF_MAX", "300"))
+CRASH_LIMIT = int(os.environ.get("CRASH_LIMIT", "5"))
+CRASH_WINDOW = float(os.environ.get("CRASH_WINDOW", "600"))
+STABLE_AFTER = float(os.environ.get("STABLE_AFTER", "60"))
+POLL_INTERVAL = float(os.environ.get("SUPERVISOR_POLL", "5"))
+STOP_TIMEOUT = float(os.environ.get("STOP_TIMEOUT", "10"))
+HEALTH_SECONDS = float(os.environ.get("RELEASE_HEALTH_SECONDS", "5"))
+READY_FILE = os.environ.get("READY_FILE", ".ready")
+RELEASE_OVERLAP = os.environ.get("RELEASE_OVERLAP", "1") == "1"
+
+RUNNING = "running"
+RESTARTING = "restarting"
+STOPPED = "stopped"
+EXITED = "exited"
+CRASHLOOP = "crashloop"
+HIBERNATED = "hibernated"
+
+FREEZE = "freeze"
+SHUTDOWN = "stop"
+
+listeners = []
+
+
+def same_process(pid, ticks):
+    return bool(pid) and ticks is not None and start_ticks(pid) == ticks
+
+
+class Child:
+    def __init__(self, user_id, bot_name, bot_path):
+        self.user_id = user_id
+        self.bot_name = bot_name
+        self.bot_path = bot_path
+        self.popen = None
+        self.launch = None
+        self.pid = None
+        self.ticks = None
+        self.started = None
+        self.pidfd = None
+        self.cgroup = None
+        self.wanted = False
+        self.state = STOPPED
+        self.crashes = collections.deque()
+        self.consecutive = 0
+        self.restart_handle = None
+        self.exited = None
+        self.hibernation = None
+        self.hibernated = None
+
+    @property
+    def alive(self):
+        return self.pid is not None
+
+
+_children = {}
+
+
+def _notify(child, state, code=None):
+    for listener in listeners:
+        asyncio.ensure_future(listener(child.user_id, child.bot_name, state, code))
+
+
+async def _spawn(child):
+    env = limits.child_env()
+    venv = installer.site_packages(child.bot_path)
+    env["PYTHONPATH"] = os.pathsep.join([child.bot_path] + venv)
+    lim = limits.for_bot(child.user_id, child.bot_name)
+    child.cgroup = limits.prepare(child.user_id, child.bot_name, lim)
+
+    if not venv and zygote.running() and zygote.usable(child.bot_path):
+        launch = await zygote.spawn(child.bot_path, env, ["app.py"], lim, child.cgroup)
+        pid = launch.pid
+    else:
+        launch = None
+        with logs.open_for_child(child.bot_path) as log_file:
+            p = subprocess.Popen(
+                [installer.interpreter(child.bot_path) or "python3", "app.py"],
+                stdout=log_file,
+                stderr=subprocess.STDOUT,
+                cwd=child.bot_path,
+                env=env,
+                start_new_session=True,
+                preexec_fn=limits.preexec(lim, child.cgroup)
+            )
+        child.popen = p
+        pid = p.pid
+
+    child.launch = launch
+    child.pid = pid
+    child.ticks = start_ticks(pid)
+    child.started = time.time()
+    child.state = RUNNING
+    registry.update(
+        child.user_id, child.bot_name,
+        pid=pid, started=child.started, start_ticks=child.ticks,
+        state=RUNNING, exit_code=None
+    )
+    if launch is not None:
+        _watch_launch(child, launch)
+    else:
+        _watch(child)
+    logger.info("تم تشغيل %s/%s (PID %s%s)", child.user_id, child.bot_name, pid, ", zygote" if launch else "")
+
+
+def _watch_launch(child, launch):
+    loop = asyncio.get_running_loop()
+    child.exited = loop.create_future()
+    try:
+        child.pidfd = os.pidfd_open(child.pid)
+    except (AttributeError, OSError):
+        child.pidfd = None
+    launch.exited.add_done_callback(lambda f: _on_launch_exit(child, launch, f.result()))
+
+
+def _on_launch_exit(child, launch, code):
+    if child.launch is not launch:
+        return
+    child.launch = None
+    if code is None and same_process(child.pid, child.ticks):
+        logger.warning("انقطع الاتصال بالـ zygote، متابعة %s/%s مباشرة", child.user_id, child.bot_name)
+        if child.pidfd is not None:
+            asyncio.get_running_loop().add_reader(child.pidfd, _on_exit, child)
+        else:
+            asyncio.get_running_loop().call_later(POLL_INTERVAL, _poll, child, child.pid)
+        return
+    _on_exit(child, code)
+
+
+def _watch(child):
+    loop = asyncio.get_running_loop()
+    child.exited = loop.create_future()
+    try:
+        child.pidfd = os.pidfd_open(child.pid)
+    except (AttributeError, OSError):
+        child.pidfd = None
+        loop.call_later(POLL_INTERVAL, _poll, child, child.pid)
+        return
+    if child.ticks is not None and start_ticks(child.pid) != child.ticks:
+        os.close(child.pidfd)
+        child.pidfd = None
+        loop.call_soon(_on_exit, child)
+        return
+    loop.add_reader(child.pidfd, _on_exit, child)
+
+
+def _poll(child, pid):
+    if child.pid != pid:
+        return
+    if child.popen is not None:
+        if child.popen.poll() is None:
+            asyncio.get_running_loop().call_later(POLL_INTERVAL, _poll, child, pid)
+            return
+    elif same_process(pid, child.ticks):
+        asyncio.get_running_loop().call_later(POLL_INTERVAL, _poll, child, pid)
+        return
+    _on_exit(child)
+
+
+def _on_exit(child, code=None):
+    if child.hibernation == FREEZE:
+        child.hibernation = None
+        if child.cgroup:
+            try:
+                limits.freeze(child.cgroup, False)
+            except OSError:
+                pass
+    if child.pidfd is not None:
+        asyncio.get_running_loop().remove_reader(child.pidfd)
+        os.close(child.pidfd)
+        child.pidfd = None
+    if child.popen is not None:
+        code = child.popen.wait()
+    ran = time.time() - (child.started or time.time())
+    child.popen = None
+    child.pid = None
+    child.ticks = None
+    if _children.get((child.user_id, child.bot_name), child) is not child:
+        if child.exited and not child.exited.done():
+            child.exited.set_result(code)
+        return
+    registry.update(
+        child.user_id, child.bot_name,
+        pid=None, started=None, start_ticks=None, exit_code=code
+    )
+    if child.exited and not child.exited.done():
+        child.exited.set_result(code)
+    _handle_exit(child, code, ran)
+
+
+def _handle_exit(child, code, ran):
+    key = (child.user_id, child.bot_name)
+    if not child.wanted:
+        _finish(child, STOPPED)
+        return
+    if child.hibernation == SHUTDOWN:
+        logger.info("%s/%s في وضع السبات", *key)
+        return
+    if code == 0:
+        logger.info("%s/%s انتهى بنجاح", *key)
+        _finish(child, EXITED, code)
+        return
+
+    now = time.time()
+    child.crashes.append(now)
+    while child.crashes and now - child.crashes[0] > CRASH_WINDOW:
+        child.crashes.popleft()
+    child.consecutive = 1 if ran > STABLE_AFTER else child.consecutive + 1
+
+    if len(child.crashes) >= CRASH_LIMIT:
+        logger.warning("%s/%s يتعطل باستمرار (%d مرات)، تم إيقاف إعادة التشغيل", *key, len(child.crashes))
+        child.wanted = False
+        _finish(child, CRASHLOOP, code)
+        return
+
+    delay = min(RESTART_BACKOFF_MAX, RESTART_BACKOFF * 2 ** (child.consecutive - 1))
+    logger.warning("%s/%s توقف (رمز %s)، إعادة التشغيل بعد %.0f ث", *key, code, delay)
+    row = registry.get(*key) or {}
+    child.state = RESTARTING
+    registry.update(*key, state=RESTARTING, restarts=(row.get("restarts") or 0) + 1)
+    _notify(child, RESTARTING, code)
+    child.restart_handle = asyncio.get_running_loop().call_later(delay, _restart, child)
+
+
+def _restart(child):
+    child.restart_handle = None
+    if child.wanted:
+        asyncio.ensure_future(_respawn(child))
+
+
+async def _respawn(child):
+    try:
+        await _spawn(child)
+    except (OSError, subprocess.SubprocessError, RuntimeError):
+        logger.exception("تعذر إعادة تشغيل %s/%s", child.user_id, child.bot_name)
+        _on_exit(child)
+
+
+def _finish(child, state, code=None):
+    child.state = state
+    if _children.get((child.user_id, child.bot_name)) is child:
+        del _children[(child.user_id, child.bot_name)]
+    registry.update(child.user_id, child.bot_name, state=state)
+    if state != STOPPED:
+        _notify(child, state, code)
+
+
+def _send_signal(child, sig):
+    if child.pidfd is not None:
+        signal.pidfd_send_signal(child.pidfd, sig)
+    elif child.popen is not None:
+        child.popen.send_signal(sig)
+    elif same_process(child.pid, child.ticks):
+        os.kill(child.pid, sig)
+    else:
+        raise ProcessLookupError(child.pid)
+
+
+def _stop_group(child, sig):
+    if same_process(child.pid, child.ticks) and os.getpgid(child.pid) == child.pid:
+        os.killpg(child.pid, sig)
+    else:
+        _send_signal(child, sig)
+
+
+def _set_state(child, state):
+    child.state = state
+    registry.update(child.user_id, child.bot_name, state=state)
+
+
+async def hibernate(child, mode=FREEZE, timeout=5):
+    if not child.alive or child.hibernation:
+        return False
+    if mode == FREEZE:
+        try:
+            if child.cgroup and limits.freeze(child.cgroup, True):
+                limits.reclaim(child.cgroup)
+            else:
+                _stop_group(child, signal.SIGSTOP)
+        except (OSError, ProcessLookupError) as e:
+            logger.warning("تعذر تجميد %s/%s: %s", child.user_id, child.bot_name, e)
+            return False
+        child.hibernation = FREEZE
+    else:
+        child.hibernation = SHUTDOWN
+        kill(child, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(asyncio.shield(child.exited), timeout)
+        except asyncio.TimeoutError:
+            kill(child)
+    child.hibernated = time.time()
+    _set_state(child, HIBERNATED)
+    logger.info("%s/%s دخل وضع السبات (%s)", child.user_id, child.bot_name, mode)
+    return True
+
+
+async def wake(child):
+    mode = child.hibernation
+    if mode is None:
+        return False
+    child.hibernation = None
+    child.hibernated = None
+    if mode == FREEZE:
+        try:
+            if not (child.cgroup and limits.freeze(child.cgroup, False)):
+                _stop_group(child, signal.SIGCONT)
+        except (OSError, ProcessLookupError):
+            pass
+        _set_state(child, RUNNING)
+    else:
+        await _respawn(child)
+    logger.info("%s/%s استيقظ من السبات", child.user_id, child.bot_name)
+    return True
+
+
+def hibernating():
+    return [child for child in _children.values() if child.hibernation]
+
+
+def get(user_id, bot_name):
+    return _children.get((user_id, bot_name))
+
+
+def children():
+    return [child for child in _children.values() if child.alive]
+
+
+def awake():
+    return [child for child in _children.values() if child.alive and not child.hibernation]
+
+
+def kill(child, sig=signal.SIGKILL):
+    try:
+        _send_signal(child, sig)
+    except ProcessLookupError:
+        pass
+
+
+def state(user_id, bot_name):
+    child = _children.get((user_id, bot_name))
+    if child:
+        return child.state
+    row = registry.get(user_id, bot_name)
+    return (row or {}).get("state") or STOPPED
+
+
+def states(user_id, bot_names):
+    rows = None
+    result = {}
+    for bot_name in bot_names:
+        child = _children.get((user_id, bot_name))
+        if child:
+            result[bot_name] = child.state
+            continue
+        if rows is None:
+            rows = registry.user_bots(user_id)
+        result[bot_name] = (rows.get(bot_name) or {}).get("state") or STOPPED
+    return result
+
+
+def is_running(user_id, bot_name):
+    child = _children.get((user_id, bot_name))
+    return bool(child and child.alive)
+
+
+async def start(user_id, bot_name, bot_path):
+    child = _children.get((user_id, bot_name))
+    if child and child.hibernation:
+        await wake(child)
+        return child
+    if child and child.alive:
+        return child
+    limits.check_quota(user_id, sum(1 for c in _children.values() if c.user_id == user_id and c.alive))
+    if child is None:
+        child = Child(user_id, bot_name, bot_path)
+        _children[(user_id, bot_name)] = child
+    if child.restart_handle:
+        child.restart_handle.cancel()
+        child.restart_handle = None
+    child.wanted = True
+    child.crashes.clear()
+    child.consecutive = 0
+    try:
+        await _spawn(child)
+    except (OSError, subprocess.SubprocessError, RuntimeError):
+        _children.pop((user_id, bot_name), None)
+        raise
+    registry.update(user_id, bot_name, restarts=0)
+    return child
+
+
+def _signal_group(child, sig):
+    try:
+        _stop_group(child, sig)
+    except ProcessLookupError:
+        pass
+
+
+async def stop(user_id, bot_name, timeout=STOP_TIMEOUT):
+    child = _children.get((user_id, bot_name))
+    if child is None:
+        return False
+    child.wanted = False
+    if child.restart_handle:
+        child.restart_handle.cancel()
+        child.restart_handle = None
+    if child.hibernation == FREEZE:
+        await wake(child)
+    child.hibernation = None
+    if not child.alive:
+        _finish(child, STOPPED)
+        return True
+    await _terminate(child, timeout)
+    return True
+
+
+async def _terminate(child, timeout=STOP_TIMEOUT):
+    _signal_group(child, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(asyncio.shield(child.exited), timeout)
+        return
+    except asyncio.TimeoutError:
+        logger.warning(
+            "%s/%s لم ينتهِ خلال %.0f ث من SIGTERM، إرسال SIGKILL", child.user_id, child.bot_name, timeout
+        )
+    _signal_group(child, signal.SIGKILL)
+    try:
+        await asyncio.wait_for(asyncio.shield(child.exited), 5)
+    except asyncio.TimeoutError:
+        logger.warning("%s/%s لم ينتهِ بعد الإشارة", child.user_id, child.bot_name)
+
+
+async def _healthy(child, seconds, marker):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if child.exited.done():
+            return False
+        if marker and os.path.exists(os.path.join(child.bot_path, marker)):
+            return True
+        await asyncio.wait([child.exited], timeout=0.1)
+    return child.alive
+
+
+async def _swap(old, seconds, marker):
+    await stop(old.user_id, old.bot_name)
+    try:
+        child = await start(old.user_id, old.bot_name, old.bot_path)
+    except (OSError, subprocess.SubprocessError, RuntimeError) as e:
+        logger.warning("%s/%s: تعذر تشغيل الإصدار الجديد: %s", old.user_id, old.bot_name, e)
+        return False
+    if await _healthy(child, seconds, marker):
+        logger.info("%s/%s: تم الاستبدال بإيقاف ثم تشغيل (PID %s)", old.user_id, old.bot_name, child.pid)
+        return True
+    await stop(old.user_id, old.bot_name)
+    return False
+
+
+async def replace(user_id, bot_name, seconds=HEALTH_SECONDS, marker=READY_FILE):
+    key = (user_id, bot_name)
+    old = _children.get(key)
+    if old is None or not old.alive:
+        return None
+    if old.hibernation:
+        await stop(user_id, bot_name)
+        await start(user_id, bot_name, old.bot_path)
+        return True
+    if not RELEASE_OVERLAP:
+        return await _swap(old, seconds, marker)
+    new = Child(user_id, bot_name, old.bot_path)
+    new.wanted = True
+    await _spawn(new)
+    if not await _healthy(new, seconds, marker):
+        exited = not new.alive
+        if new.alive:
+            await _terminate(new)
+        registry.update(
+            user_id, bot_name,
+            pid=old.pid, started=old.started, start_ticks=old.ticks, state=old.state, exit_code=None
+        )
+        if exited and old.alive:
+            logger.warning("%s/%s: الإصدار الجديد توقف بجانب PID %s، إعادة المحاولة بعد إيقافه", user_id, bot_name, old.pid)
+            return await _swap(old, seconds, marker)
+        logger.warning("%s/%s: الإصدار الجديد فشل فحص الصحة، الإبقاء على PID %s", user_id, bot_name, old.pid)
+        return False
+    _children[key] = new
+    old.wanted = False
+    if old.restart_handle:
+        old.restart_handle.cancel()
+        old.restart_handle = None
+    await _terminate(old)
+    logger.info("%s/%s: تم الاستبدال بدون توقف (PID %s -> %s)", user_id, bot_name, old.pid, new.pid)
+    return True
+
+
+def reconcile(path_for):
+    adopted = 0
+    for row in registry.all_bots():
+        pid = row.get("pid")
+        user_id, bot_name = row["user_id"], row["bot_name"]
+        bot_path = path_for(user_id, bot_name)
+        if not pid:
+            if row.get("state") == HIBERNATED:
+                child = Child(user_id, bot_name, bot_path)
+                child.wanted = True
+                child.hibernation = SHUTDOWN
+                child.hibernated = time.time()
+                child.state = HIBERNATED
+                _children[(user_id, bot_name)] = child
+            continue
+        ticks = row.get("start_ticks")
+        if ticks is not None:
+            verified = same_process(pid, ticks)
+        else:
+            ticks = start_ticks(pid)
+            try:
+                cwd = os.readlink(f"/proc/{pid}/cwd")
+            except OSError:
+                cwd = None
+            verified = ticks is not None and cwd == os.path.abspath(bot_path)
+        if not verified:
+            registry.update(user_id, bot_name, pid=None, started=None, start_ticks=None, state=STOPPED)
+            continue
+        child = Child(user_id, bot_name, bot_path)
+        child.pid = pid
+        child.ticks = ticks
+        child.started = row.get("started") or time.time()
+        child.wanted = True
+        child.state = RUNNING
+        cgroup = limits.cgroup_path(user_id, bot_name)
+        child.cgroup = cgroup if limits.cgroup_enabled() and os.path.isdir(cgroup) else None
+        if row.get("state") == HIBERNATED:
+            child.hibernation = FREEZE
+            child.hibernated = time.time()
+            child.state = HIBERNATED
+        _children[(user_id, bot_name)] = child
+        registry.update(user_id, bot_name, start_ticks=ticks, state=child.state)
+        _watch(child)
+        adopted += 1
+    logger.info("المشرف: تم تبني %d عملية شغالة", adopted)
+    return adopted
+
+
+@metrics.collector
+def collect_metrics():
+    rows = {(row["user_id"], row["bot_name"]): row for row in registry.all_bots()}
+    families = {
+        "hosted_bot_running": ("gauge", "1 while the supervisor has a live process for the bot.", []),
+        "hosted_bot_hibernated": ("gauge", "1 while the bot is frozen or stopped for being idle.", []),
+        "hosted_bot_restarts_total": ("counter", "Automatic restarts since the last manual start.", []),
+        "hosted_bot_uptime_seconds": ("gauge", "Seconds since the current process started.", []),
+        "hosted_bot_cpu_seconds_total": ("counter", "User plus system CPU time of the bot process.", []),
+        "hosted_bot_cpu_percent": ("gauge", "CPU usage over the last limits sampling interval.", []),
+        "hosted_bot_rss_bytes": ("gauge", "Resident memory of the bot process.", []),
+        "hosted_bot_open_fds": ("gauge", "Open file descriptors of the bot process.", []),
+        "hosted_bot_threads": ("gauge", "Threads in the bot process.", []),
+    }
+    now = time.time()
+    for (user_id, bot_name), row in rows.items():
+        labels = {"user": user_id, "bot": bot_name}
+        child = _children.get((user_id, bot_name))
+        alive = bool(child and child.alive)
+        families["hosted_bot_running"][2].append((labels, int(alive)))
+        families["hosted_bot_hibernated"][2].append((labels, int(bool(child and child.hibernation))))
+        families["hosted_bot_restarts_total"][2].append((labels, row.get("restarts") or 0))
+        if not alive:
+            continue
+        stat = procfs.read_stat(child.pid)
+        if stat is None:
+            continue
+        usage = limits.usage.get((user_id, bot_name)) or {}
+        families["hosted_bot_uptime_seconds"][2].append((labels, round(now - child.started, 1)))
+        families["hosted_bot_cpu_seconds_total"][2].append((labels, procfs.cpu_seconds(stat)))
+        families["hosted_bot_cpu_percent"][2].append((labels, usage.get("cpu")))
+        families["hosted_bot_rss_bytes"][2].append((labels, stat["rss"]))
+        families["hosted_bot_open_fds"][2].append((labels, procfs.fd_count(child.pid)))
+        families["hosted_bot_threads"][2].append((labels, stat["threads"]))
+    return [(name, kind, help_text, samples) for name, (kind, help_text, samples) in families.items()]
@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+import stat
+import tempfile
+import zipfile
+import zlib
+
+logger = logging.getLogger(__name__)
+
+ZIP_MAX_BYTES = int(os.environ.get("ZIP_MAX_BYTES", str(1024 * 1024 * 1024)))
+ZIP_MAX_FILES = int(os.environ.get("ZIP_MAX_FILES", "20000"))
+ZIP_MAX_RATIO = int(os.environ.get("ZIP_MAX_RATIO", "200"))
+STATE_DIR = ".manager"
+MANIFEST = "zip_manifest.json"
+CHUNK = 1024 * 1024
+
+
+class UnsafeArchive(Exception):
+    pass
+
+
+def _member_path(dest, name):
+    normalized = os.path.normpath(name.replace("\\", "/"))
+    first = normalized.split(os.sep)[0]
+    if os.path.isabs(normalized) or first == ".." or ":" in first:
+        raise UnsafeArchive(f"مسار غير مسموح: {name}")
+    if first == STATE_DIR:
+        raise UnsafeArchive(f"مسار محجوز: {name}")
+    target = os.path.join(dest, normalized)
+    if os.path.commonpath([os.path.realpath(dest), os.path.realpath(target)]) != os.path.realpath(dest):
+        raise UnsafeArchive(f"مسار خارج مجلد البوت: {name}")
+    return normalized, target
+
+
+def _validate(infos):
+    if len(infos) > ZIP_MAX_FILES:
+        raise UnsafeArchive(f"عدد الملفات {len(infos)} أكبر من الحد ({ZIP_MAX_FILES})")
+    total = sum(i.file_size for i in infos)
+    if total > ZIP_MAX_BYTES:
+        raise UnsafeArchive(f"الحجم بعد الفك {total // (1024 * 1024)}MB أكبر من الحد")
+    for info in infos:
+        if stat.S_ISLNK(info.external_attr >> 16):
+            raise UnsafeArchive(f"الروابط الرمزية غير مسموحة: {info.filename}")
+        if info.file_size > CHUNK and info.file_size > max(info.compress_size, 1) * ZIP_MAX_RATIO:
+            raise UnsafeArchive(f"نسبة ضغط مشبوهة: {info.filename}")
+
+
+def _load_manifest(dest):
+    try:
+        with open(os.path.join(dest, STATE_DIR, MANIFEST), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def members(dest):
+    return set(_load_manifest(dest))
+
+
+def _save_manifest(dest, manifest):
+    state = os.path.join(dest, STATE_DIR)
+    os.makedirs(state, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=state, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(state, MANIFEST))
+
+
+def _crc32(path):
+    crc = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def _unchanged(target, info, known):
+    try:
+        st = os.stat(target)
+    except OSError:
+        return False
+    if st.st_size != info.file_size:
+        return False
+    if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+        return known[2] == info.CRC
+    return _crc32(target) == info.CRC
+
+
+def _write_member(z, info, target):
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".unpack-")
+    written = 0
+    try:
+        with z.open(info) as src, os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: src.read(CHUNK), b""):
+                written += len(chunk)
+                if written > info.file_size:
+                    raise UnsafeArchive(f"حجم فعلي أكبر من المعلن: {info.filename}")
+                out.write(chunk)
+        mode = (info.external_attr >> 16) & 0o777
+        os.chmod(tmp, mode or 0o644)
+        os.replace(tmp, target)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def extract(zip_path, dest, cancelled=None):
+    written = skipped = 0
+    manifest = _load_manifest(dest)
+    with zipfile.ZipFile(zip_path) as z:
+        infos = [i for i in z.infolist() if not i.is_dir()]
+        _validate(infos)
+        members = [(info,) + _member_path(dest, info.filename) for info in infos]
+        for info, name, target in members:
+            if cancelled and cancelled():
+                break
+            if _unchanged(target, info, manifest.get(name)):
+                skipped += 1
+            else:
+                _write_member(z, info, target)
+                written += 1
+            st = os.stat(target)
+            manifest[name] = [st.st_size, st.st_mtime_ns, info.CRC]
+    _save_manifest(dest, manifest)
+    logger.info("فك %s: %d ملف جديد/معدل، %d بدون تغيير", zip_path, written, skipped)
+    return written, skipped
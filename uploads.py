@@ -0,0 +1,156 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE = os.environ.get("UPLOAD_CACHE", "upload_cache/")
+BLOBS = os.path.join(CACHE, "blobs")
+IDS = os.path.join(CACHE, "ids")
+REFS = os.path.join(CACHE, "refs")
+MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+CACHE_MAX_BYTES = int(os.environ.get("UPLOAD_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+CONCURRENCY = int(os.environ.get("UPLOAD_CONCURRENCY", "4"))
+
+_semaphore = asyncio.Semaphore(CONCURRENCY)
+_inflight = {}
+
+
+class TooLarge(Exception):
+    pass
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _read(path):
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _lookup(unique_id):
+    digest = _read(os.path.join(IDS, unique_id))
+    if not digest:
+        return None
+    blob = os.path.join(BLOBS, digest)
+    if not os.path.exists(blob):
+        return None
+    os.utime(blob)
+    return blob
+
+
+def _store(unique_id, tmp, size):
+    actual = os.path.getsize(tmp)
+    if size and actual != size:
+        os.remove(tmp)
+        raise OSError(f"حجم غير متطابق ({actual} != {size})")
+    digest = _sha256(tmp)
+    blob = os.path.join(BLOBS, digest)
+    if os.path.exists(blob):
+        os.remove(tmp)
+    else:
+        os.chmod(tmp, 0o444)
+        os.replace(tmp, blob)
+    os.makedirs(os.path.join(REFS, digest), exist_ok=True)
+    open(os.path.join(REFS, digest, unique_id), "w").close()
+    fd, ids_tmp = tempfile.mkstemp(dir=IDS, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(digest)
+    os.replace(ids_tmp, os.path.join(IDS, unique_id))
+    return blob
+
+
+def _place(blob, dest):
+    tmp = os.path.join(os.path.dirname(dest), f".{os.path.basename(dest)}.{os.getpid()}.tmp")
+    shutil.copyfile(blob, tmp)
+    os.replace(tmp, dest)
+
+
+def evict(limit=CACHE_MAX_BYTES):
+    blobs = []
+    for name in os.listdir(BLOBS):
+        try:
+            st = os.stat(os.path.join(BLOBS, name))
+        except OSError:
+            continue
+        blobs.append((st.st_mtime, st.st_size, name))
+    total = sum(size for _, size, _ in blobs)
+    removed = 0
+    for _, size, name in sorted(blobs):
+        if total <= limit:
+            break
+        os.remove(os.path.join(BLOBS, name))
+        _forget(name)
+        total -= size
+        removed += 1
+    return removed
+
+
+def _forget(digest):
+    refs = os.path.join(REFS, digest)
+    try:
+        ids = os.listdir(refs)
+    except FileNotFoundError:
+        return
+    for unique_id in ids:
+        path = os.path.join(IDS, unique_id)
+        if _read(path) == digest:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    shutil.rmtree(refs, ignore_errors=True)
+
+
+async def _download(document):
+    async with _semaphore:
+        blob = _lookup(document.file_unique_id)
+        if blob:
+            return blob
+        file = await document.get_file()
+        fd, tmp = tempfile.mkstemp(dir=CACHE, suffix=".part")
+        os.close(fd)
+        try:
+            await file.download_to_drive(tmp)
+            blob = await asyncio.to_thread(_store, document.file_unique_id, tmp, document.file_size)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    await asyncio.to_thread(evict)
+    return blob
+
+
+async def fetch(document, dest):
+    if document.file_size and document.file_size > MAX_BYTES:
+        raise TooLarge(f"حجم الملف {document.file_size // (1024 * 1024)}MB أكبر من الحد ({MAX_BYTES // (1024 * 1024)}MB)")
+    os.makedirs(BLOBS, exist_ok=True)
+    os.makedirs(IDS, exist_ok=True)
+
+    blob = _lookup(document.file_unique_id)
+    if blob:
+        metrics.UPLOADS.inc(result="hit")
+    else:
+        task = _inflight.get(document.file_unique_id)
+        if task is None:
+            task = asyncio.ensure_future(_download(document))
+            _inflight[document.file_unique_id] = task
+            task.add_done_callback(lambda _: _inflight.pop(document.file_unique_id, None))
+            metrics.UPLOADS.inc(result="miss")
+        else:
+            metrics.UPLOADS.inc(result="shared")
+        blob = await asyncio.shield(task)
+    await asyncio.to_thread(_place, blob, dest)
+    return dest
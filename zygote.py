@@ -0,0 +1,256 @@
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import selectors
+import signal
+import socket
+import sys
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("ZYGOTE", "0") == "1"
+SOCKET = os.environ.get("ZYGOTE_SOCKET", "zygote.sock")
+PRELOAD = os.environ.get("ZYGOTE_PRELOAD", "")
+IMPORT_NAMES = {
+    "python-telegram-bot": "telegram.ext",
+    "beautifulsoup4": "bs4",
+    "pillow": "PIL",
+}
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+_process = None
+preloaded = []
+
+
+def preload_names(libs=()):
+    if PRELOAD:
+        return [name.strip() for name in PRELOAD.split(",") if name.strip()]
+    return [IMPORT_NAMES.get(lib, lib) for lib in libs]
+
+
+def usable(bot_path):
+    for name in {name.split(".")[0] for name in preloaded}:
+        if os.path.exists(os.path.join(bot_path, name)) or os.path.exists(os.path.join(bot_path, f"{name}.py")):
+            return False
+    return True
+
+
+def _child_main(request, listener, conn):
+    listener.close()
+    conn.close()
+    signal.set_wakeup_fd(-1)
+    for sig in (signal.SIGCHLD, signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, signal.SIG_DFL)
+    code = 1
+    try:
+        os.setsid()
+        import limits
+        import logs
+        limits.preexec(request["limits"], request["cgroup"])()
+        os.chdir(request["cwd"])
+        log_file = logs.open_for_child(request["cwd"])
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(log_file.fileno(), 1)
+        os.dup2(log_file.fileno(), 2)
+        log_file.close()
+        os.close(devnull)
+
+        os.environ.clear()
+        os.environ.update(request["env"])
+        for name, module in list(sys.modules.items()):
+            path = getattr(module, "__file__", None) or ""
+            if path.startswith(ROOT + os.sep):
+                del sys.modules[name]
+        extra = [p for p in request["env"].get("PYTHONPATH", "").split(os.pathsep) if p]
+        sys.path[:] = [request["cwd"]] + extra + [p for p in sys.path if p and os.path.abspath(p) != ROOT]
+        sys.argv = list(request["argv"])
+
+        import runpy
+        try:
+            runpy.run_path(request["argv"][0], run_name="__main__")
+            code = 0
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            if not isinstance(e.code, (int, type(None))):
+                print(e.code, file=sys.stderr)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def serve(path, modules):
+    loaded = []
+    for name in modules:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except Exception as e:
+            print(f"zygote: skip {name}: {e}", file=sys.stderr)
+
+    if os.path.exists(path):
+        os.remove(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(64)
+    listener.setblocking(False)
+
+    wake_r, wake_w = os.pipe()
+    os.set_blocking(wake_r, False)
+    os.set_blocking(wake_w, False)
+    signal.set_wakeup_fd(wake_w)
+    signal.signal(signal.SIGCHLD, lambda *args: None)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ, "accept")
+    selector.register(wake_r, selectors.EVENT_READ, "reap")
+    buffers = {}
+    children = {}
+
+    sys.stdout.write(json.dumps({"ready": True, "preloaded": loaded}) + "\n")
+    sys.stdout.flush()
+
+    while True:
+        for key, _ in selector.select():
+            if key.data == "accept":
+                try:
+                    conn, _ = listener.accept()
+                except BlockingIOError:
+                    continue
+                conn.setblocking(False)
+                buffers[conn] = b""
+                selector.register(conn, selectors.EVENT_READ, "request")
+            elif key.data == "reap":
+                try:
+                    os.read(wake_r, 4096)
+                except BlockingIOError:
+                    pass
+                while True:
+                    try:
+                        pid, status = os.waitpid(-1, os.WNOHANG)
+                    except ChildProcessError:
+                        break
+                    if pid == 0:
+                        break
+                    conn = children.pop(pid, None)
+                    if conn is None:
+                        continue
+                    try:
+                        conn.setblocking(True)
+                        conn.sendall(json.dumps({"exit": os.waitstatus_to_exitcode(status)}).encode() + b"\n")
+                    except OSError:
+                        pass
+                    selector.unregister(conn)
+                    conn.close()
+            else:
+                conn = key.fileobj
+                try:
+                    data = conn.recv(65536)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    data = b""
+                if not data:
+                    selector.unregister(conn)
+                    buffers.pop(conn, None)
+                    conn.close()
+                    continue
+                buffers[conn] += data
+                if b"\n" not in buffers[conn]:
+                    continue
+                line = buffers.pop(conn).split(b"\n", 1)[0]
+                request = json.loads(line)
+                sys.stdout.flush()
+                sys.stderr.flush()
+                pid = os.fork()
+                if pid == 0:
+                    _child_main(request, listener, conn)
+                children[pid] = conn
+                conn.setblocking(True)
+                conn.sendall(json.dumps({"pid": pid}).encode() + b"\n")
+                conn.setblocking(False)
+
+
+class ZygoteProcess:
+    def __init__(self, pid, reader, writer):
+        self.pid = pid
+        self.exited = asyncio.get_running_loop().create_future()
+        self._writer = writer
+        self._task = asyncio.create_task(self._wait(reader))
+
+    async def _wait(self, reader):
+        try:
+            line = await reader.readline()
+        finally:
+            self._writer.close()
+        if not self.exited.done():
+            self.exited.set_result(json.loads(line)["exit"] if line else None)
+
+
+async def start(libs=(), env=None):
+    global _process
+    if _process is not None and _process.returncode is None:
+        return
+    _process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.abspath(__file__), "--socket", SOCKET,
+        "--preload", ",".join(preload_names(libs)),
+        stdout=asyncio.subprocess.PIPE,
+        env=env,
+        start_new_session=True
+    )
+    line = await asyncio.wait_for(_process.stdout.readline(), 120)
+    if not line:
+        raise RuntimeError("zygote exited during startup")
+    preloaded[:] = json.loads(line)["preloaded"]
+    logger.info("zygote جاهز (PID %s)، وحدات محملة مسبقاً: %s", _process.pid, ", ".join(preloaded))
+
+
+async def stop():
+    global _process
+    if _process is not None and _process.returncode is None:
+        _process.terminate()
+        await _process.wait()
+    _process = None
+
+
+def running():
+    return _process is not None and _process.returncode is None
+
+
+async def spawn(cwd, env, argv, lim, cgroup):
+    reader, writer = await asyncio.open_unix_connection(SOCKET)
+    request = {"cwd": os.path.abspath(cwd), "env": env, "argv": argv, "limits": lim, "cgroup": cgroup}
+    writer.write(json.dumps(request).encode() + b"\n")
+    await writer.drain()
+    line = await reader.readline()
+    if not line:
+        writer.close()
+        raise RuntimeError("zygote closed the connection")
+    return ZygoteProcess(json.loads(line)["pid"], reader, writer)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-warmed fork server for hosted bots")
+    parser.add_argument("--socket", default=SOCKET)
+    parser.add_argument("--preload", default=PRELOAD)
+    args = parser.parse_args()
+    started = time.monotonic()
+    try:
+        serve(args.socket, [name for name in args.preload.split(",") if name])
+    finally:
+        print(f"zygote: stopped after {time.monotonic() - started:.0f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()